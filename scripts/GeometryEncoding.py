@@ -0,0 +1,272 @@
+"""
+Encodes VectorGeometry shapes and coordinate arrays as WKB or Esri JSON, for the SHAPE@WKB and SHAPE@JSON
+cursor tokens. This skips building an arcpy.Point per vertex, and does not import arcpy.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+# Geometry formats understood by the encoders, and the cursor token each one is written with.
+WKB = "WKB"
+JSON = "JSON"
+shapeTokens = {WKB: "SHAPE@WKB", JSON: "SHAPE@JSON"}
+
+# ISO WKB geometry type codes with Z.
+wkbLineStringZ = 1002
+wkbPolygonZ = 1003
+wkbMultiLineStringZ = 1005
+wkbMultiPolygonZ = 1006
+
+# Little endian byte order marker.
+wkbNDR = 1
+
+
+def shapeToken(geometryFormat):
+    return shapeTokens[geometryFormat]
+
+
+def toXYZArray(geometry):
+    # Accepts an (M, 3) array, a VectorGeometry Polyline or Polygon, or a list of nodes/points.
+    if isinstance(geometry, np.ndarray):
+        return np.ascontiguousarray(geometry, dtype=np.float64).reshape(-1, 3)
+    if hasattr(geometry, "getNodes"):
+        geometry = geometry.getNodes()
+    return np.array([(node.x, node.y, node.z) for node in geometry], dtype=np.float64).reshape(-1, 3)
+
+
+def toPartList(geometries):
+    # A single geometry, or a list of geometries (one per part, like funPolylineToArcpyPolyline takes).
+    if isinstance(geometries, np.ndarray):
+        if geometries.ndim == 3:
+            return [toXYZArray(part) for part in geometries]
+        return [toXYZArray(geometries)]
+    if hasattr(geometries, "getNodes"):
+        return [toXYZArray(geometries)]
+    return [toXYZArray(part) for part in geometries if part is not None]
+
+
+def closeRing(vertices):
+    # WKB and Esri JSON rings repeat the first vertex at the end; VectorGeometry polygons don't.
+    if len(vertices) > 0 and not np.array_equal(vertices[0], vertices[-1]):
+        return np.concatenate((vertices, vertices[0:1]))
+    return vertices
+
+
+def _wkbPoints(vertices):
+    return struct.pack("<I", len(vertices)) + vertices.astype("<f8").tobytes()
+
+
+def _wkbLineString(vertices):
+    return struct.pack("<BI", wkbNDR, wkbLineStringZ) + _wkbPoints(vertices)
+
+
+def _wkbPolygon(rings):
+    ret = struct.pack("<BII", wkbNDR, wkbPolygonZ, len(rings))
+    for ring in rings:
+        ret += _wkbPoints(closeRing(ring))
+    return ret
+
+
+def polylineToWKB(geometries):
+    # One part is written as a LineString Z, more parts as a MultiLineString Z.
+    parts = toPartList(geometries)
+    if len(parts) == 1:
+        return bytearray(_wkbLineString(parts[0]))
+    ret = struct.pack("<BII", wkbNDR, wkbMultiLineStringZ, len(parts))
+    for part in parts:
+        ret += _wkbLineString(part)
+    return bytearray(ret)
+
+
+def polygonToWKB(geometries):
+    # Every geometry is one single ring polygon, as in funPolygonToArcpyPolygon.
+    # One is written as a Polygon Z, more as a MultiPolygon Z.
+    parts = toPartList(geometries)
+    if len(parts) == 1:
+        return bytearray(_wkbPolygon(parts))
+    ret = struct.pack("<BII", wkbNDR, wkbMultiPolygonZ, len(parts))
+    for part in parts:
+        ret += _wkbPolygon([part])
+    return bytearray(ret)
+
+
+def _esriJSON(key, parts, wkid):
+    shape = {"hasZ": True, key: [part.tolist() for part in parts]}
+    if wkid is not None:
+        shape["spatialReference"] = {"wkid": wkid}
+    return json.dumps(shape)
+
+
+def polylineToEsriJSON(geometries, wkid=None):
+    return _esriJSON("paths", toPartList(geometries), wkid)
+
+
+def polygonToEsriJSON(geometries, wkid=None):
+    return _esriJSON("rings", [closeRing(part) for part in toPartList(geometries)], wkid)
+
+
+def encodePolyline(geometries, geometryFormat=WKB):
+    if geometryFormat == JSON:
+        return polylineToEsriJSON(geometries)
+    return polylineToWKB(geometries)
+
+
+def encodePolygon(geometries, geometryFormat=WKB):
+    if geometryFormat == JSON:
+        return polygonToEsriJSON(geometries)
+    return polygonToWKB(geometries)
+
+
+def _wkbTriangles(vertices, faces):
+    # One Polygon Z record (a closed 4 point ring) per triangle of the mesh, in a structured array.
+    triangles = np.asarray(vertices, dtype=np.float64)[np.asarray(faces)]
+    triangleRecord = np.dtype([("byteOrder", "u1"), ("type", "<u4"), ("ringCount", "<u4"), ("pointCount", "<u4"),
+                               ("points", "<f8", (4, 3))], align=False)
+    records = np.empty(len(triangles), dtype=triangleRecord)
+    records["byteOrder"] = wkbNDR
+    records["type"] = wkbPolygonZ
+    records["ringCount"] = 1
+    records["pointCount"] = 4
+    records["points"][:, 0:3] = triangles
+    records["points"][:, 3] = triangles[:, 0]
+    return records
+
+
+def meshToWKB(vertices, faces):
+    # Triangle mesh (M, 3) vertices and (F, 3) face indices as one MultiPolygon Z of triangles,
+    # for a single feature in a multipatch feature class.
+    records = _wkbTriangles(vertices, faces)
+    return bytearray(struct.pack("<BII", wkbNDR, wkbMultiPolygonZ, len(records)) + records.tobytes())
+
+
+def meshTrianglesToWKB(vertices, faces):
+    # The triangles of a mesh as a list of Polygon Z WKB, one per triangle, for a 3D polygon feature class.
+    records = _wkbTriangles(vertices, faces)
+    return [bytearray(record.tobytes()) for record in records]
+
+
+def _wkbDimensions(wkbType):
+    # Returns (base type, has Z, has M) for ISO (1000 / 2000 / 3000 + type) and extended (flag bit) type codes.
+    hasZ = bool(wkbType & 0x80000000)
+    hasM = bool(wkbType & 0x40000000)
+    wkbType &= 0x0FFFFFFF
+    if wkbType >= 1000:
+        hasZ = hasZ or (wkbType // 1000) in (1, 3)
+        hasM = hasM or (wkbType // 1000) in (2, 3)
+        wkbType %= 1000
+    return wkbType, hasZ, hasM
+
+
+def _readWKBLineStrings(wkb, offset, parts):
+    byteOrder = "<" if wkb[offset] == wkbNDR else ">"
+    wkbType, hasZ, hasM = _wkbDimensions(struct.unpack_from(byteOrder + "I", wkb, offset + 1)[0])
+    offset += 5
+    if wkbType == 5:
+        partCount = struct.unpack_from(byteOrder + "I", wkb, offset)[0]
+        offset += 4
+        for partIndex in range(0, partCount):
+            offset = _readWKBLineStrings(wkb, offset, parts)
+        return offset
+    if wkbType != 2:
+        raise ValueError("WKB geometry type " + str(wkbType) + " is not a (multi) linestring")
+    pointCount = struct.unpack_from(byteOrder + "I", wkb, offset)[0]
+    offset += 4
+    # Coordinates are x, y[, z][, m]; m values are dropped.
+    dimension = 2 + hasZ + hasM
+    coordinates = np.frombuffer(wkb, dtype=byteOrder + "f8", count=pointCount * dimension, offset=offset)
+    coordinates = coordinates.reshape(pointCount, dimension).astype(np.float64)
+    if hasZ:
+        coordinates = coordinates[:, 0:3]
+    else:
+        coordinates = np.column_stack((coordinates[:, 0:2], np.zeros(pointCount)))
+    parts.append(coordinates)
+    return offset + pointCount * dimension * 8
+
+
+def polylineFromWKB(wkb):
+    # Decodes a (Multi)LineString (as read with SHAPE@WKB) into a list of (M, 3) vertex arrays, one per part.
+    # Without Z, the z coordinates are 0.
+    parts = []
+    _readWKBLineStrings(bytes(wkb), 0, parts)
+    return parts
+
+
+class WKBTemplate(object):
+    # A WKB geometry split into its coordinates and the bytes around them, so moved copies are encoded by writing
+    # new coordinates between the original headers, without parsing the geometry again per copy.
+    # Any WKB geometry type works, multipatches read with SHAPE@WKB included. WKB has no materials or textures.
+    def __init__(self, wkb):
+        self.wkb = bytes(wkb)
+        # (start, pointCount, byteOrder, dimension, hasZ) of every coordinate block.
+        self.blocks = []
+        self._readGeometry(0)
+        self.xyz = np.zeros((sum(block[1] for block in self.blocks), 3), dtype=np.float64)
+        pointIndex = 0
+        for start, pointCount, byteOrder, dimension, hasZ in self.blocks:
+            coordinates = np.frombuffer(self.wkb, dtype=byteOrder + "f8", count=pointCount * dimension, offset=start)
+            coordinates = coordinates.reshape(pointCount, dimension)
+            self.xyz[pointIndex:pointIndex + pointCount, 0:2] = coordinates[:, 0:2]
+            if hasZ:
+                self.xyz[pointIndex:pointIndex + pointCount, 2] = coordinates[:, 2]
+            pointIndex += pointCount
+
+    def _readGeometry(self, offset):
+        byteOrder = "<" if self.wkb[offset] == wkbNDR else ">"
+        wkbType, hasZ, hasM = _wkbDimensions(struct.unpack_from(byteOrder + "I", self.wkb, offset + 1)[0])
+        offset += 5
+        dimension = 2 + int(hasZ) + int(hasM)
+        if wkbType == 1:
+            return self._readPoints(offset, 1, byteOrder, dimension, hasZ)
+        if wkbType == 2:
+            pointCount = struct.unpack_from(byteOrder + "I", self.wkb, offset)[0]
+            return self._readPoints(offset + 4, pointCount, byteOrder, dimension, hasZ)
+        if wkbType in (3, 17):
+            # Polygon, Triangle: rings of points.
+            ringCount = struct.unpack_from(byteOrder + "I", self.wkb, offset)[0]
+            offset += 4
+            for ringIndex in range(0, ringCount):
+                pointCount = struct.unpack_from(byteOrder + "I", self.wkb, offset)[0]
+                offset = self._readPoints(offset + 4, pointCount, byteOrder, dimension, hasZ)
+            return offset
+        if wkbType in (4, 5, 6, 7, 15, 16):
+            # Multi geometries, collections, polyhedral surfaces and TINs: nested geometries with their own header.
+            partCount = struct.unpack_from(byteOrder + "I", self.wkb, offset)[0]
+            offset += 4
+            for partIndex in range(0, partCount):
+                offset = self._readGeometry(offset)
+            return offset
+        raise ValueError("WKB geometry type " + str(wkbType) + " is not supported")
+
+    def _readPoints(self, offset, pointCount, byteOrder, dimension, hasZ):
+        self.blocks.append((offset, pointCount, byteOrder, dimension, hasZ))
+        return offset + pointCount * dimension * 8
+
+    def moved(self, fromXYZ, toXYZ, clockwiseDegrees=0):
+        # WKB of the geometry turned clockwise (seen from above) around fromXYZ, and moved from fromXYZ to toXYZ.
+        angle = np.radians(clockwiseDegrees)
+        cosine = np.cos(angle)
+        sine = np.sin(angle)
+        dx = self.xyz[:, 0] - fromXYZ[0]
+        dy = self.xyz[:, 1] - fromXYZ[1]
+        x = toXYZ[0] + dx * cosine + dy * sine
+        y = toXYZ[1] - dx * sine + dy * cosine
+        z = self.xyz[:, 2] + (toXYZ[2] - fromXYZ[2])
+
+        pieces = []
+        previousEnd = 0
+        pointIndex = 0
+        for start, pointCount, byteOrder, dimension, hasZ in self.blocks:
+            pieces.append(self.wkb[previousEnd:start])
+            coordinates = np.frombuffer(self.wkb, dtype=byteOrder + "f8", count=pointCount * dimension, offset=start)
+            coordinates = coordinates.reshape(pointCount, dimension).copy()
+            coordinates[:, 0] = x[pointIndex:pointIndex + pointCount]
+            coordinates[:, 1] = y[pointIndex:pointIndex + pointCount]
+            if hasZ:
+                coordinates[:, 2] = z[pointIndex:pointIndex + pointCount]
+            pieces.append(coordinates.tobytes())
+            previousEnd = start + pointCount * dimension * 8
+            pointIndex += pointCount
+        pieces.append(self.wkb[previousEnd:])
+        return bytearray(b"".join(pieces))
@@ -0,0 +1,846 @@
+"""
+Array versions of the span math in create_3D_catenary.
+Everything here works on NumPy arrays (one row per span) and does not import arcpy,
+so whole runs can be solved in one pass and the functions can be checked outside of ArcGIS Pro.
+"""
+
+import collections
+import hashlib
+import math
+import os
+import pickle
+
+import numpy as np
+
+
+class SpanSolution(object):
+    # Holds the solved values for a batch of spans, one array element per span.
+    # Names follow the variables in create_3D_catenary.makeSpan().
+    def __init__(self):
+        self.spanLength2D = None
+        self.spanLength3D = None
+        self.heightDifference = None
+        self.sagDistance = None
+        self.horizontalTension = None
+        self.weightPerUnitLength = None
+        self.xHigh = None
+        self.xLow = None
+        self.dHigh = None
+        self.dLow = None
+        self.lineLength = None
+        # Drop from the fromPoint to the lowest point of the catenary (dHigh or dLow).
+        self.sagOriginDrop = None
+        # False where the span could not be solved (zero length, zero sag, uplift with zero dLow...).
+        self.valid = None
+        # Exact solves only: Newton iterations used per span, and whether the span converged.
+        self.iterations = None
+        self.converged = None
+
+    def __len__(self):
+        return len(self.sagDistance)
+
+    def select(self, indices):
+        # New SpanSolution with only the given spans (index array or boolean mask).
+        selected = SpanSolution()
+        for name, value in vars(self).items():
+            if value is not None:
+                setattr(selected, name, value[indices])
+        return selected
+
+
+def asXYZArray(points):
+    # Accepts an (N, 3) array, or a list of objects with x, y, z attributes (vg.Point, AttachmentPoint).
+    if isinstance(points, np.ndarray):
+        return np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    return np.array([(point.x, point.y, point.z) for point in points], dtype=np.float64).reshape(-1, 3)
+
+
+def spanGeometry(fromXYZ, toXYZ):
+    # Returns spanLength2D, spanLength3D and the (absolute) attachment point height difference.
+    spanVector3D = toXYZ - fromXYZ
+    spanLength2D = np.hypot(spanVector3D[:, 0], spanVector3D[:, 1])
+    spanLength3D = np.sqrt(spanLength2D * spanLength2D + spanVector3D[:, 2] * spanVector3D[:, 2])
+    heightDifference = np.abs(spanVector3D[:, 2])
+    return spanLength2D, spanLength3D, heightDifference
+
+
+def sagFromLineGuideZ(fromZ, toZ, lineGuideZ):
+    # Array version of the line guide branch in makeSpan(): sag D from the height of a user placed line guide.
+    fromZ = np.asarray(fromZ, dtype=np.float64)
+    toZ = np.asarray(toZ, dtype=np.float64)
+    lineGuideZ = np.asarray(lineGuideZ, dtype=np.float64)
+    fromIsHigher = fromZ > toZ
+    dLow = np.where(fromIsHigher, toZ, fromZ) - lineGuideZ
+    hSign = np.where(fromIsHigher, 1.0, -1.0)
+    h = np.abs(toZ - fromZ)
+    dHigh = dLow + h
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sqrtDLow = np.sqrt(dLow)
+        sqrtDHigh = np.sqrt(dHigh)
+        D = ((h / 4) * hSign) * ((sqrtDLow + sqrtDHigh) / (sqrtDLow - sqrtDHigh))
+    return D
+
+
+def solveSpans(fromXYZ, toXYZ, weightPerUnitLength, sagToSpanRatio=None, horizontalTension=None, sagDistance=None,
+               exact=False, tolerance=1e-9, maxIterations=50):
+    # Vectorized makeSpan(): solves sag, H, xHigh/xLow, dHigh/dLow and line length for all spans at once.
+    # The same precedence as makeSpan() is used: sagToSpanRatio, then horizontalTension, then sagDistance.
+    # Scalars and per-span arrays can be mixed for weightPerUnitLength, sagToSpanRatio, horizontalTension and sagDistance.
+    # With exact, the inclined catenary is solved exactly (solveExactSpans) instead of with the parabolic approximations.
+    if exact:
+        return solveExactSpans(fromXYZ, toXYZ, weightPerUnitLength, sagToSpanRatio, horizontalTension, sagDistance,
+                               tolerance, maxIterations)
+    fromXYZ = asXYZArray(fromXYZ)
+    toXYZ = asXYZArray(toXYZ)
+    S, spanLength3D, h = spanGeometry(fromXYZ, toXYZ)
+    w = np.broadcast_to(np.asarray(weightPerUnitLength, dtype=np.float64), S.shape)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        H = None
+        if sagToSpanRatio is not None:
+            D = np.asarray(sagToSpanRatio, dtype=np.float64) * S
+        elif horizontalTension is not None:
+            # Same sag approximation as makeSpan(), visually corrected when the shape is made.
+            H = np.broadcast_to(np.asarray(horizontalTension, dtype=np.float64), S.shape)
+            catenaryConstant = H / w
+            D = catenaryConstant * (np.cosh((spanLength3D / 2) / catenaryConstant) - 1)
+        elif sagDistance is not None:
+            D = np.asarray(sagDistance, dtype=np.float64)
+        else:
+            raise ValueError("solveSpans needs a sag to span ratio, a horizontal tension or a sag distance.")
+        D = np.broadcast_to(D, S.shape)
+
+        hOver4D = h / (4 * D)
+        xHigh = (S / 2) * (1 + hOver4D)
+        xLow = (S / 2) * (1 - hOver4D)
+        dHigh = D * np.square(1 + hOver4D)
+        dLow = D * np.square(1 - hOver4D)
+
+        if H is None:
+            H = (w * np.square(xLow)) / (2 * dLow)
+
+        L = S + (np.power(np.abs(xLow), 3) + np.power(xHigh, 3)) * (np.square(w) / (6 * np.square(H)))
+
+    solution = SpanSolution()
+    solution.spanLength2D = S
+    solution.spanLength3D = spanLength3D
+    solution.heightDifference = h
+    solution.sagDistance = np.array(D)
+    solution.horizontalTension = np.array(H)
+    solution.weightPerUnitLength = np.array(w)
+    solution.xHigh = xHigh
+    solution.xLow = xLow
+    solution.dHigh = dHigh
+    solution.dLow = dLow
+    solution.lineLength = L
+    solution.sagOriginDrop = np.where(fromXYZ[:, 2] > toXYZ[:, 2], dHigh, dLow)
+    solution.valid = (S > 0) & np.isfinite(D) & np.isfinite(H) & (H > 0) & np.isfinite(L)
+    return solution
+
+
+def solveSpanSags(fromXYZ, toXYZ, weightPerUnitLength, sagToSpanRatio=None, horizontalTension=None):
+    # Only the sag D of solveSpans(), for callers that need no span shape (tower placement).
+    fromXYZ = asXYZArray(fromXYZ)
+    toXYZ = asXYZArray(toXYZ)
+    S, spanLength3D, h = spanGeometry(fromXYZ, toXYZ)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        if sagToSpanRatio is not None:
+            D = np.asarray(sagToSpanRatio, dtype=np.float64) * S
+        elif horizontalTension is not None:
+            catenaryConstant = np.asarray(horizontalTension, dtype=np.float64) / np.asarray(weightPerUnitLength, dtype=np.float64)
+            D = catenaryConstant * (np.cosh((spanLength3D / 2) / catenaryConstant) - 1)
+        else:
+            raise ValueError("solveSpanSags needs a sag to span ratio or a horizontal tension.")
+    return np.array(np.broadcast_to(D, S.shape))
+
+
+def adjacentSpanMaximums(spanValues):
+    # For N spans along a line, the greater value of the (one or two) spans at each of the N + 1 towers.
+    # NaN values (unsolvable spans) are ignored where the other span has a value.
+    spanValues = np.asarray(spanValues, dtype=np.float64)
+    towerValues = np.empty(len(spanValues) + 1, dtype=np.float64)
+    towerValues[0] = spanValues[0]
+    towerValues[-1] = spanValues[-1]
+    towerValues[1:-1] = np.fmax(spanValues[:-1], spanValues[1:])
+    return towerValues
+
+
+def exactLowestPoint(S, dz, a):
+    # Distance s0 along the span from the fromPoint to the lowest point of the catenary z = a * cosh((s - s0) / a) + c
+    # through both attachment points (dz = toZ - fromZ). s0 is outside of [0, S] for uplift.
+    return S / 2 - a * np.arcsinh(dz / (2 * a * np.sinh(S / (2 * a))))
+
+
+def exactMidspanSag(S, dz, a):
+    # Vertical distance from the chord to the catenary at mid span, the sag D of the parabolic formulas.
+    # The catenary rise from the fromPoint to mid span, a * (cosh(q) - cosh(k - q)), is written as
+    # 2a * sinh(k / 2) * sinh(q - k / 2) so it stays accurate for flat spans (large a).
+    k = S / (2 * a)
+    q = (S / 2 - exactLowestPoint(S, dz, a)) / a
+    return dz / 2 - 2 * a * np.sinh(k / 2) * np.sinh(q - k / 2)
+
+
+def solveExactSpans(fromXYZ, toXYZ, weightPerUnitLength, sagToSpanRatio=None, horizontalTension=None, sagDistance=None,
+                    tolerance=1e-9, maxIterations=50):
+    # Exact inclined span catenaries, for all spans at once.
+    # With a horizontal tension the catenary constant a = H / w is known, and the lowest point has a closed form.
+    # With a sag (ratio or distance), a is found with a vectorized Newton iteration on log(a) until the mid span sag
+    # is within tolerance (relative) of the target; iterations and convergence are kept per span on the solution.
+    # xHigh/xLow and dHigh/dLow are exact, so the shapes need no visual correction.
+    fromXYZ = asXYZArray(fromXYZ)
+    toXYZ = asXYZArray(toXYZ)
+    S, spanLength3D, h = spanGeometry(fromXYZ, toXYZ)
+    dz = toXYZ[:, 2] - fromXYZ[:, 2]
+    w = np.broadcast_to(np.asarray(weightPerUnitLength, dtype=np.float64), S.shape)
+    iterations = np.zeros(S.shape, dtype=np.int64)
+    converged = np.ones(S.shape, dtype=bool)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        if sagToSpanRatio is not None or horizontalTension is None:
+            if sagToSpanRatio is not None:
+                targetD = np.broadcast_to(np.asarray(sagToSpanRatio, dtype=np.float64) * S, S.shape)
+            elif sagDistance is not None:
+                targetD = np.broadcast_to(np.asarray(sagDistance, dtype=np.float64), S.shape)
+            else:
+                raise ValueError("solveExactSpans needs a sag to span ratio, a horizontal tension or a sag distance.")
+
+            # Start from the parabola, a = S^2 / 8D, and iterate on log(a): the sag falls monotonically with a.
+            a = np.square(S) / (8 * targetD)
+            active = np.isfinite(a) & (a > 0)
+            converged = np.zeros(S.shape, dtype=bool)
+            for iteration in range(0, maxIterations):
+                if not active.any():
+                    break
+                aActive = a[active]
+                SActive = S[active]
+                dzActive = dz[active]
+                residual = exactMidspanSag(SActive, dzActive, aActive) - targetD[active]
+                done = np.abs(residual) <= tolerance * targetD[active]
+                # Derivative of the sag with respect to log(a), by central difference.
+                step = 1e-6
+                slope = (exactMidspanSag(SActive, dzActive, aActive * math.exp(step)) -
+                         exactMidspanSag(SActive, dzActive, aActive * math.exp(-step))) / (2 * step)
+                logStep = np.clip(-residual / slope, -2.0, 2.0)
+                logStep = np.where(done | ~np.isfinite(logStep), 0.0, logStep)
+
+                activeIndices = np.flatnonzero(active)
+                a[activeIndices] = aActive * np.exp(logStep)
+                iterations[activeIndices] += np.where(done, 0, 1)
+                converged[activeIndices[done]] = True
+                active[activeIndices[done | ~np.isfinite(residual)]] = False
+            H = a * w
+        else:
+            H = np.broadcast_to(np.asarray(horizontalTension, dtype=np.float64), S.shape)
+            a = H / w
+
+        s0 = exactLowestPoint(S, dz, a)
+        D = exactMidspanSag(S, dz, a)
+        fromIsHigher = fromXYZ[:, 2] > toXYZ[:, 2]
+        xHigh = np.where(fromIsHigher, s0, S - s0)
+        xLow = np.where(fromIsHigher, S - s0, s0)
+        # a * (cosh(x / a) - 1), written as 2a * sinh^2(x / 2a).
+        dHigh = 2 * a * np.square(np.sinh(xHigh / (2 * a)))
+        dLow = 2 * a * np.square(np.sinh(xLow / (2 * a)))
+        # Arc length from the fromPoint (s = 0) to the toPoint (s = S).
+        L = a * (np.sinh((S - s0) / a) + np.sinh(s0 / a))
+
+    solution = SpanSolution()
+    solution.spanLength2D = S
+    solution.spanLength3D = spanLength3D
+    solution.heightDifference = h
+    solution.sagDistance = np.array(D)
+    solution.horizontalTension = np.array(H)
+    solution.weightPerUnitLength = np.array(w)
+    solution.xHigh = xHigh
+    solution.xLow = xLow
+    solution.dHigh = dHigh
+    solution.dLow = dLow
+    solution.lineLength = L
+    solution.sagOriginDrop = np.where(fromIsHigher, dHigh, dLow)
+    solution.iterations = iterations
+    solution.converged = converged
+    solution.valid = converged & (S > 0) & np.isfinite(D) & (D > 0) & np.isfinite(H) & (H > 0) & np.isfinite(L)
+    return solution
+
+
+def catenaryVertices(fromXYZ, toXYZ, xHigh, xLow, dHigh, dLow, H, w, stepCount=100, template=None, visualCorrection=True):
+    # Array version of the vertex loop in makeSpanPolylineShapeAndLineGuide().
+    # Returns an (N, stepCount + 1, 3) block of span vertices, visual correction included.
+    spanCount = len(asXYZArray(fromXYZ))
+    stepCounts = np.full(spanCount, stepCount, dtype=np.int64)
+    vertices = catenaryVerticesFlat(fromXYZ, toXYZ, xHigh, xLow, dHigh, dLow, H, w, stepCounts, template, visualCorrection)
+    return vertices.reshape(spanCount, stepCount + 1, 3)
+
+
+def catenaryVerticesFlat(fromXYZ, toXYZ, xHigh, xLow, dHigh, dLow, H, w, stepCounts, template=None, visualCorrection=True):
+    # Same as catenaryVertices(), but every span has its own step count.
+    # Vertices of all spans are returned as one flat (sum(stepCounts + 1), 3) array, span after span.
+    # With a CatenaryTemplate (all spans share H / w), heights are interpolated from its table instead of using cosh.
+    # Exact solutions (solveExactSpans) already pass through both attachment points: use visualCorrection=False.
+    fromXYZ = asXYZArray(fromXYZ)
+    toXYZ = asXYZArray(toXYZ)
+    xHigh, xLow, dHigh, dLow, H, w = [np.asarray(value, dtype=np.float64).reshape(-1) for value in (xHigh, xLow, dHigh, dLow, H, w)]
+    stepCounts = np.asarray(stepCounts, dtype=np.int64).reshape(-1)
+    spanVector2D = toXYZ[:, 0:2] - fromXYZ[:, 0:2]
+    S = np.hypot(spanVector2D[:, 0], spanVector2D[:, 1])
+
+    # Index of the span and of the step within the span, for every output vertex.
+    vertexCounts = stepCounts + 1
+    spanIndex = np.repeat(np.arange(len(S)), vertexCounts)
+    firstVertexIndex = np.cumsum(vertexCounts) - vertexCounts
+    steps = (np.arange(len(spanIndex)) - firstVertexIndex[spanIndex]).astype(np.float64)
+
+    # T is moving from fromTower to toTower, X origin is at lowest point in span.
+    T = (steps * S[spanIndex]) / stepCounts[spanIndex]
+    fromIsHigher = fromXYZ[:, 2] > toXYZ[:, 2]
+    xOrigin = np.where(fromIsHigher, xHigh, xLow)
+    sagOriginDrop = np.where(fromIsHigher, dHigh, dLow)
+    a = H / w
+    if template is None:
+        def catenaryZ(x, a):
+            return a * (np.cosh(x / a) - 1)
+    else:
+        if not np.allclose(a, template.a):
+            raise ValueError("Catenary template is for H / w = " + str(template.a) + ", not for all of these spans.")
+        def catenaryZ(x, a):
+            return template.evaluate(x)
+
+    # abs(T - x) also covers negative x (uplift), where the loop used abs(x) + T.
+    x = np.abs(T - xOrigin[spanIndex])
+    listZ = catenaryZ(x, a[spanIndex])
+
+    # Visual correction: shift so the first vertex is on the fromPoint, and shear so the last vertex is on the toPoint.
+    firstZCalced = catenaryZ(np.abs(xOrigin), a)
+    lastZCalced = catenaryZ(np.abs(S - xOrigin), a)
+    if visualCorrection:
+        firstFixZ = sagOriginDrop - firstZCalced
+        firstElevDiff = fromXYZ[:, 2] - (firstZCalced + sagOriginDrop)
+        lastElevDiff = toXYZ[:, 2] - (lastZCalced + sagOriginDrop)
+        shearZIncrement = (lastElevDiff - firstElevDiff) / stepCounts
+    else:
+        firstFixZ = np.zeros(len(S))
+        shearZIncrement = np.zeros(len(S))
+
+    vertices = np.empty((len(spanIndex), 3), dtype=np.float64)
+    unitVector2D = spanVector2D / S[:, np.newaxis]
+    vertices[:, 0:2] = fromXYZ[spanIndex, 0:2] + T[:, np.newaxis] * unitVector2D[spanIndex]
+    sagOriginZ = fromXYZ[:, 2] - sagOriginDrop
+    vertices[:, 2] = (sagOriginZ + firstFixZ)[spanIndex] + listZ + shearZIncrement[spanIndex] * steps
+    return vertices
+
+
+def adaptiveStepCounts(fromXYZ, toXYZ, xHigh, xLow, H, w, tolerance, minStepCount=2, maxStepCount=100):
+    # Number of steps per span so that no chord is further than tolerance from the catenary.
+    # For a chord over step length d, the deviation is at most d^2 / 8 * max|z''|, with z'' = cosh(x / a) / a
+    # largest at the span end furthest from the lowest point. The visual correction is linear, so it adds nothing.
+    fromXYZ = asXYZArray(fromXYZ)
+    toXYZ = asXYZArray(toXYZ)
+    xHigh, xLow, H, w = [np.asarray(value, dtype=np.float64).reshape(-1) for value in (xHigh, xLow, H, w)]
+    S = np.hypot(toXYZ[:, 0] - fromXYZ[:, 0], toXYZ[:, 1] - fromXYZ[:, 1])
+    xOrigin = np.where(fromXYZ[:, 2] > toXYZ[:, 2], xHigh, xLow)
+    a = H / w
+    with np.errstate(over='ignore', invalid='ignore'):
+        xMax = np.maximum(np.abs(xOrigin), np.abs(S - xOrigin))
+        maxCurvature = np.cosh(xMax / a) / a
+        stepCounts = np.ceil(S * np.sqrt(maxCurvature / (8 * tolerance)))
+    stepCounts = np.where(np.isfinite(stepCounts), stepCounts, maxStepCount)
+    return np.clip(stepCounts, minStepCount, maxStepCount).astype(np.int64)
+
+
+def splitVertices(vertices, stepCounts):
+    # Splits a flat vertex array from catenaryVerticesFlat() into one (stepCount + 1, 3) array per span.
+    vertexCounts = np.asarray(stepCounts, dtype=np.int64) + 1
+    return np.split(vertices, np.cumsum(vertexCounts)[:-1])
+
+
+def sampleSpanVertices(fromXYZ, toXYZ, solution, stepCount=100, template=None):
+    # (N, stepCount + 1, 3) vertex block for a SpanSolution from solveSpans().
+    # Exact solutions (solution.converged is set) are sampled without the visual correction.
+    return catenaryVertices(fromXYZ, toXYZ, solution.xHigh, solution.xLow, solution.dHigh, solution.dLow,
+                            solution.horizontalTension, solution.weightPerUnitLength, stepCount, template,
+                            solution.converged is None)
+
+
+def sampleSpanVerticesAdaptive(fromXYZ, toXYZ, solution, tolerance, maxStepCount=100, template=None):
+    # Error bounded sampling: returns a list with one (M, 3) vertex array per span, M picked from tolerance.
+    stepCounts = adaptiveStepCounts(fromXYZ, toXYZ, solution.xHigh, solution.xLow, solution.horizontalTension,
+                                    solution.weightPerUnitLength, tolerance, maxStepCount=maxStepCount)
+    vertices = catenaryVerticesFlat(fromXYZ, toXYZ, solution.xHigh, solution.xLow, solution.dHigh, solution.dLow,
+                                    solution.horizontalTension, solution.weightPerUnitLength, stepCounts, template,
+                                    solution.converged is None)
+    return splitVertices(vertices, stepCounts)
+
+
+class CatenaryTemplate(object):
+    # a * (cosh(x / a) - 1) for one catenary constant a = H / w, sampled densely on [0, xMax].
+    # All spans with the same conductor weight and tension are windows on this one curve, so their heights can be
+    # interpolated from the table. The sample spacing keeps the interpolation error below tolerance
+    # (linear interpolation error is at most spacing^2 / 8 * max|z''|, with z'' = cosh(x / a) / a).
+    def __init__(self, a, xMax, tolerance=0.0001, maxSampleCount=1000000):
+        self.a = float(a)
+        self.xMax = float(xMax)
+        self.tolerance = tolerance
+        maxCurvature = math.cosh(self.xMax / self.a) / self.a
+        sampleCount = int(math.ceil(self.xMax * math.sqrt(maxCurvature / (8 * tolerance)))) + 1
+        sampleCount = min(max(sampleCount, 2), maxSampleCount)
+        self.x = np.linspace(0, self.xMax, sampleCount)
+        self.z = self.a * (np.cosh(self.x / self.a) - 1)
+
+    def covers(self, xMax):
+        return xMax <= self.xMax
+
+    def evaluate(self, x):
+        return np.interp(x, self.x, self.z)
+
+
+# Templates per (a, tolerance), shared by all batches of a session. A template is rebuilt (twice as long) when a
+# span reaches beyond its table.
+catenaryTemplates = {}
+
+
+def getCatenaryTemplate(horizontalTension, weightPerUnitLength, xMax, tolerance=0.0001):
+    a = float(horizontalTension) / float(weightPerUnitLength)
+    key = (a, tolerance)
+    template = catenaryTemplates.get(key)
+    if template is None or not template.covers(xMax):
+        if template is not None:
+            xMax = max(xMax, 2 * template.xMax)
+        template = CatenaryTemplate(a, xMax, tolerance)
+        catenaryTemplates[key] = template
+    return template
+
+
+def lineGuideVertices(fromXYZ, toXYZ, sagOriginDrop):
+    # (N, 2, 3) line guides: a flat line at the lowest point of the catenary, with the length of the span in XY.
+    fromXYZ = asXYZArray(fromXYZ)
+    toXYZ = asXYZArray(toXYZ)
+    vertices = np.empty((len(fromXYZ), 2, 3), dtype=np.float64)
+    vertices[:, 0, :] = fromXYZ
+    vertices[:, 0, 2] -= np.asarray(sagOriginDrop, dtype=np.float64)
+    vertices[:, 1, 0:2] = vertices[:, 0, 0:2] + (toXYZ[:, 0:2] - fromXYZ[:, 0:2])
+    vertices[:, 1, 2] = vertices[:, 0, 2]
+    return vertices
+
+
+def solveAndSampleSpans(fromXYZ, toXYZ, weightPerUnitLength, sagToSpanRatio=None, horizontalTension=None, vertexTolerance=None,
+                        templateTolerance=None, exact=False):
+    # Solves the spans, and samples the vertices and line guides of the valid ones.
+    # Returns (solution, validIndices, span vertices, line guide vertices); the vertex blocks only hold the valid spans.
+    # With templateTolerance, spans that share one weight and tension are sampled from a CatenaryTemplate.
+    fromXYZ = asXYZArray(fromXYZ)
+    toXYZ = asXYZArray(toXYZ)
+    solution = solveSpans(fromXYZ, toXYZ, weightPerUnitLength, sagToSpanRatio=sagToSpanRatio,
+                          horizontalTension=horizontalTension, exact=exact)
+    validIndices = np.flatnonzero(solution.valid)
+    validSolution = solution.select(validIndices)
+
+    template = None
+    if templateTolerance is not None and sagToSpanRatio is None and len(validIndices) > 0 and \
+            np.ndim(horizontalTension) == 0 and np.ndim(weightPerUnitLength) == 0:
+        xMax = np.max(np.maximum(np.abs(validSolution.xHigh), np.abs(validSolution.xLow)))
+        template = getCatenaryTemplate(horizontalTension, weightPerUnitLength, xMax, templateTolerance)
+
+    if vertexTolerance is None:
+        spanVertices = sampleSpanVertices(fromXYZ[validIndices], toXYZ[validIndices], validSolution, template=template)
+    else:
+        spanVertices = sampleSpanVerticesAdaptive(fromXYZ[validIndices], toXYZ[validIndices], validSolution, vertexTolerance,
+                                                  template=template)
+    guideVertices = lineGuideVertices(fromXYZ[validIndices], toXYZ[validIndices], validSolution.sagOriginDrop)
+    return solution, validIndices, spanVertices, guideVertices
+
+
+def solveSpanChunk(chunk):
+    # Process pool worker: chunk is the solveAndSampleSpans() argument tuple.
+    # Only arrays go in and out, and this module doesn't import arcpy, so it can run in a child process.
+    return solveAndSampleSpans(*chunk)
+
+
+def makeSpanChunks(fromXYZ, toXYZ, weightPerUnitLength, sagToSpanRatio=None, horizontalTension=None, vertexTolerance=None,
+                   chunkSize=2000, templateTolerance=None, exact=False):
+    # Splits a batch into solveSpanChunk() arguments of at most chunkSize spans. Returns (offset, chunk) pairs.
+    fromXYZ = asXYZArray(fromXYZ)
+    toXYZ = asXYZArray(toXYZ)
+
+    def chunkOf(values, start, end):
+        # Per-span values are sliced, scalars and None are passed on.
+        if values is None or np.ndim(values) == 0:
+            return values
+        return np.asarray(values, dtype=np.float64)[start:end]
+
+    chunks = []
+    for start in range(0, len(fromXYZ), chunkSize):
+        end = start + chunkSize
+        chunks.append((start, (fromXYZ[start:end], toXYZ[start:end], chunkOf(weightPerUnitLength, start, end),
+                               chunkOf(sagToSpanRatio, start, end), chunkOf(horizontalTension, start, end),
+                               vertexTolerance, templateTolerance, exact)))
+    return chunks
+
+
+def verticesToNodes(vertices, nodeClass):
+    # Turns an (M, 3) vertex array into a list of VectorGeometry nodes.
+    return [nodeClass(x, y, z) for x, y, z in vertices.tolist()]
+
+
+def swayGrid(fromXYZ, toXYZ, spanVertices, angles):
+    # Array version of the sway loop in create_3D_swaysurface.makeSways().
+    # The catenary is swung around the chord between the attachment points, for every angle (degrees, 0 = hanging down).
+    # spanVertices is (V, 3) for one span or (N, V, 3) for N spans; returns an (N, A, V, 3) grid of sway line vertices.
+    fromXYZ = asXYZArray(fromXYZ)
+    toXYZ = asXYZArray(toXYZ)
+    spanVertices = np.asarray(spanVertices, dtype=np.float64).reshape(len(fromXYZ), -1, 3)
+    angles = np.asarray(angles, dtype=np.float64)
+
+    # Span frame: along the span, normal to the vertical span plane, and normal to the span in the span plane.
+    spanVector3D = toXYZ - fromXYZ
+    normalToSpanPlane = np.cross(spanVector3D, np.array([0.0, 0.0, 1.0]))
+    normalInSpanPlane = np.cross(spanVector3D, normalToSpanPlane)
+    unitSpan = spanVector3D / np.linalg.norm(spanVector3D, axis=1)[:, np.newaxis]
+    unitNormalToSpanPlane = normalToSpanPlane / np.linalg.norm(normalToSpanPlane, axis=1)[:, np.newaxis]
+    unitNormalInSpanPlane = normalInSpanPlane / np.linalg.norm(normalInSpanPlane, axis=1)[:, np.newaxis]
+
+    # Points and span in the 2D XZ span plane: t along the chord, r distance from the chord.
+    spanLength2D = np.hypot(spanVector3D[:, 0], spanVector3D[:, 1])
+    spanVector2DNoY = np.stack((spanLength2D, spanVector3D[:, 2]), axis=1)
+    pointVectors = spanVertices - spanVertices[:, 0:1, :]
+    pointVectors2DNoY = np.stack((np.hypot(pointVectors[:, :, 0], pointVectors[:, :, 1]), pointVectors[:, :, 2]), axis=2)
+    h = np.linalg.norm(pointVectors2DNoY, axis=2)
+    t = np.einsum('nvk,nk->nv', pointVectors2DNoY, spanVector2DNoY) / np.linalg.norm(spanVector2DNoY, axis=1)[:, np.newaxis]
+    r = np.sqrt(np.maximum(h * h - t * t, 0))
+
+    alphaRadians = np.radians(90 - angles)
+    u = r[:, np.newaxis, :] * np.cos(alphaRadians)[np.newaxis, :, np.newaxis]
+    v = r[:, np.newaxis, :] * np.sin(alphaRadians)[np.newaxis, :, np.newaxis]
+
+    grid = (fromXYZ[:, np.newaxis, np.newaxis, :]
+            + t[:, np.newaxis, :, np.newaxis] * unitSpan[:, np.newaxis, np.newaxis, :]
+            + u[:, :, :, np.newaxis] * unitNormalToSpanPlane[:, np.newaxis, np.newaxis, :]
+            + v[:, :, :, np.newaxis] * unitNormalInSpanPlane[:, np.newaxis, np.newaxis, :])
+    # Sway lines start and end exactly on the attachment points.
+    grid[:, :, 0, :] = fromXYZ[:, np.newaxis, :]
+    grid[:, :, -1, :] = toXYZ[:, np.newaxis, :]
+    return grid
+
+
+def swayMesh(swayGrid):
+    # Indexed triangle mesh of the sway surface between neighbouring sway lines of an (A, V, 3) sway grid.
+    # All sway lines share their first and last vertex (the attachment points), so these are stored once.
+    # Returns the (M, 3) vertex array and the (F, 3) face index array.
+    angleCount, vertexCount = swayGrid.shape[0], swayGrid.shape[1]
+    innerCount = vertexCount - 2
+    vertices = np.concatenate((swayGrid[0, 0:1], swayGrid[:, 1:-1].reshape(-1, 3), swayGrid[0, -1:]))
+
+    # Vertex index for every (sway line, vertex) of the grid.
+    gridIndex = np.empty((angleCount, vertexCount), dtype=np.int64)
+    gridIndex[:, 0] = 0
+    gridIndex[:, 1:-1] = 1 + np.arange(angleCount * innerCount).reshape(angleCount, innerCount)
+    gridIndex[:, -1] = len(vertices) - 1
+
+    # Panel corners: n0 this sway/this node, n1 next sway/this node,
+    # n2 next sway/next node, n3 this sway/next node.
+    n0 = gridIndex[:-1, :-1]
+    n1 = gridIndex[1:, :-1]
+    n2 = gridIndex[1:, 1:]
+    n3 = gridIndex[:-1, 1:]
+    # Every quad is split in (n0, n1, n2) and (n0, n2, n3). The first panel has no n1 and the last panel no n3.
+    firstTriangles = np.stack((n0, n1, n2), axis=2)[:, 1:]
+    secondTriangles = np.stack((n0, n2, n3), axis=2)[:, :-1]
+    faces = np.concatenate((firstTriangles.reshape(-1, 3), secondTriangles.reshape(-1, 3)))
+    return vertices, faces
+
+
+def mergeMeshes(meshes):
+    # One (vertices, faces) mesh from a list of meshes, e.g. the sway surfaces of all spans of a line.
+    vertexCounts = [len(vertices) for vertices, faces in meshes]
+    offsets = np.cumsum([0] + vertexCounts[:-1])
+    vertices = np.concatenate([vertices for vertices, faces in meshes])
+    faces = np.concatenate([faces + offset for (vertices, faces), offset in zip(meshes, offsets)])
+    return vertices, faces
+
+
+# Attachment points as one structured array, the way they are read with arcpy.da.FeatureClassToNumPyArray.
+attachmentPointDtype = np.dtype([("x", np.float64), ("y", np.float64), ("z", np.float64), ("line", np.int64), ("tower", np.int64)])
+
+
+def asAttachmentPointArray(records):
+    # Copies (x, y, z, line, tower) records (a structured array in that field order, or tuples) into attachmentPointDtype.
+    points = np.empty(len(records), dtype=attachmentPointDtype)
+    if isinstance(records, np.ndarray) and records.dtype.names is not None:
+        for name, recordName in zip(attachmentPointDtype.names, records.dtype.names):
+            points[name] = records[recordName]
+    else:
+        for fieldIndex, name in enumerate(attachmentPointDtype.names):
+            points[name] = [record[fieldIndex] for record in records]
+    return points
+
+
+def attachmentPointXYZ(points):
+    return np.column_stack((points["x"], points["y"], points["z"]))
+
+
+def groupAttachmentPoints(points):
+    # Sorts the points by (line, tower) with one lexsort.
+    # Returns the sorted points and the (lineNumber, start, end) slice of every line in them.
+    points = points[np.lexsort((points["tower"], points["line"]))]
+    lineBreaks = np.flatnonzero(points["line"][1:] != points["line"][:-1]) + 1
+    starts = np.concatenate(([0], lineBreaks))
+    ends = np.concatenate((lineBreaks, [len(points)]))
+    if len(points) == 0:
+        return points, []
+    return points, [(int(points["line"][start]), int(start), int(end)) for start, end in zip(starts, ends)]
+
+
+def spanEndpointIndices(points):
+    # For points sorted by groupAttachmentPoints(): from and to index of every span, i.e. of each pair of
+    # neighbouring points on the same line.
+    fromIndices = np.flatnonzero(points["line"][1:] == points["line"][:-1])
+    return fromIndices, fromIndices + 1
+
+
+class LRUCache(object):
+    # In memory LRU of at most maxSize entries. With cacheDirectory, every entry is also pickled to disk, one file per
+    # key named by the SHA-1 of repr(key), so later runs can reuse it. Keys must be tuples of plain values.
+    # Shared by SpanCache and TowerModels.TowerModelCache; kept here because this module does not import arcpy.
+    def __init__(self, maxSize=1000, cacheDirectory=None):
+        self.maxSize = maxSize
+        self.cacheDirectory = cacheDirectory
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if cacheDirectory is not None and not os.path.isdir(cacheDirectory):
+            os.makedirs(cacheDirectory)
+
+    def _diskPath(self, key):
+        return os.path.join(self.cacheDirectory, hashlib.sha1(repr(key).encode("utf-8")).hexdigest() + ".pkl")
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        if self.cacheDirectory is not None:
+            path = self._diskPath(key)
+            if os.path.exists(path):
+                with open(path, "rb") as cacheFile:
+                    entry = pickle.load(cacheFile)
+                self._remember(key, entry)
+                self.hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def put(self, key, entry):
+        self._remember(key, entry)
+        if self.cacheDirectory is not None:
+            with open(self._diskPath(key), "wb") as cacheFile:
+                pickle.dump(entry, cacheFile, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SpanCache(LRUCache):
+    # Memoizes solved spans. A span is translation invariant, so entries are keyed by the quantized
+    # from -> to delta plus the inputs that decide the shape (w, H, sag ratio, sag distance, vertex tolerance, solver),
+    # and hold the vertices relative to the from point plus the reported values:
+    # (polylineOffsets, lineGuideOffsets, sagDistance, horizontalTension, lineLength, weightPerUnitLength).
+    # With cacheDirectory, later runs (create, adjust, reruns) can reuse them.
+    def __init__(self, maxSize=10000, quantum=0.001, cacheDirectory=None):
+        LRUCache.__init__(self, maxSize, cacheDirectory)
+        self.quantum = quantum
+
+    def quantizeDeltas(self, fromXYZ, toXYZ):
+        # (N, 3) from -> to deltas, in quantum steps. Takes (N, 3) arrays or single (x, y, z) tuples.
+        fromXYZ = np.asarray(fromXYZ, dtype=np.float64).reshape(-1, 3)
+        toXYZ = np.asarray(toXYZ, dtype=np.float64).reshape(-1, 3)
+        return np.round((toXYZ - fromXYZ) / self.quantum)
+
+    def makeKey(self, fromXYZ, toXYZ, weightPerUnitLength, horizontalTension, sagToSpanRatio, sagDistance, vertexTolerance=None,
+                templateTolerance=None, exact=False):
+        return self._makeKey(self.quantizeDeltas(fromXYZ, toXYZ)[0], weightPerUnitLength, horizontalTension, sagToSpanRatio,
+                             sagDistance, vertexTolerance, templateTolerance, exact)
+
+    def makeKeys(self, fromXYZ, toXYZ, weightPerUnitLength, horizontalTension, sagToSpanRatios, vertexTolerance=None,
+                 templateTolerance=None, exact=False):
+        # makeKey() for a batch of spans that share w and H; sagToSpanRatios is None, one value or one value per span.
+        # Spans are grouped on their quantized delta (and sag ratio) with one np.unique, so there is one key per group.
+        # Returns (keys, firstIndices, keyIndices): the unique keys, the first span with each key, and the key of every span.
+        deltas = self.quantizeDeltas(fromXYZ, toXYZ)
+        if sagToSpanRatios is None:
+            keyColumns = deltas
+        else:
+            keyColumns = np.column_stack((deltas, np.broadcast_to(np.asarray(sagToSpanRatios, dtype=np.float64), (len(deltas),))))
+        uniqueColumns, firstIndices, keyIndices = np.unique(keyColumns, axis=0, return_index=True, return_inverse=True)
+        keys = [self._makeKey(columns[0:3], weightPerUnitLength, horizontalTension,
+                              None if sagToSpanRatios is None else float(columns[3]), None, vertexTolerance, templateTolerance, exact)
+                for columns in uniqueColumns]
+        return keys, firstIndices, keyIndices.reshape(-1)
+
+    def _makeKey(self, quantizedDelta, weightPerUnitLength, horizontalTension, sagToSpanRatio, sagDistance, vertexTolerance,
+                 templateTolerance, exact):
+        return (tuple(int(value) for value in quantizedDelta), self.quantum, weightPerUnitLength, horizontalTension, sagToSpanRatio,
+                sagDistance, vertexTolerance, templateTolerance, bool(exact))
+
+    @staticmethod
+    def makeEntry(fromXYZ, polylineVertices, lineGuideVertices, sagDistance, horizontalTension, lineLength, weightPerUnitLength):
+        fromXYZ = asXYZArray(fromXYZ)[0]
+        return (polylineVertices - fromXYZ, lineGuideVertices - fromXYZ, sagDistance, horizontalTension, lineLength,
+                weightPerUnitLength)
+
+    @staticmethod
+    def entryVertices(entry, fromXYZ, toXYZ):
+        # (polyline vertices, line guide vertices) of a cached span, placed on these attachment points.
+        # The key only holds the delta to within quantum, so the polyline is sheared (like the visual correction) to end
+        # exactly on toXYZ, and the line guide end is put above or below it.
+        fromXYZ = asXYZArray(fromXYZ)[0]
+        toXYZ = asXYZArray(toXYZ)[0]
+        polylineOffsets, lineGuideOffsets = entry[0], entry[1]
+        polylineVertices = polylineOffsets + fromXYZ
+        endError = toXYZ - polylineVertices[-1]
+        polylineVertices += np.linspace(0.0, 1.0, len(polylineVertices))[:, np.newaxis] * endError
+        lineGuideVertices = lineGuideOffsets + fromXYZ
+        lineGuideVertices[-1, 0:2] = toXYZ[0:2]
+        return polylineVertices, lineGuideVertices
+
+
+def spanReport(fromXYZ, toXYZ, solution):
+    # Report values that need no vertices: the lowest point of the catenary (x, y, z; it lies outside of the span
+    # for uplift) and the conductor length a * (sinh(xHigh / a) + sinh(xLow / a)), a = H / w.
+    # Returns (lowPointXYZ (N, 3), conductorLength (N,)).
+    fromXYZ = asXYZArray(fromXYZ)
+    toXYZ = asXYZArray(toXYZ)
+    spanVector2D = toXYZ[:, 0:2] - fromXYZ[:, 0:2]
+    S = np.hypot(spanVector2D[:, 0], spanVector2D[:, 1])
+    fromIsHigher = fromXYZ[:, 2] > toXYZ[:, 2]
+    # Distance from the fromPoint to the lowest point, along the span.
+    xOrigin = np.where(fromIsHigher, solution.xHigh, solution.xLow)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        lowPointXYZ = np.empty((len(S), 3), dtype=np.float64)
+        lowPointXYZ[:, 0:2] = fromXYZ[:, 0:2] + (xOrigin / S)[:, np.newaxis] * spanVector2D
+        lowPointXYZ[:, 2] = fromXYZ[:, 2] - solution.sagOriginDrop
+        a = solution.horizontalTension / solution.weightPerUnitLength
+        conductorLength = a * (np.sinh(solution.xHigh / a) + np.sinh(solution.xLow / a))
+    return lowPointXYZ, conductorLength
+
+
+class LoadCase(object):
+    # One loading condition for a study: the conductor weight per unit length (bare, or with ice and wind),
+    # and the horizontal tension or sag to span ratio for that condition (temperature).
+    def __init__(self, name, weightPerUnitLength, horizontalTension=None, sagToSpanRatio=None):
+        if weightPerUnitLength is None:
+            raise ValueError("Load case " + str(name) + " has no weight per unit length.")
+        if horizontalTension is None and sagToSpanRatio is None:
+            raise ValueError("Load case " + str(name) + " needs a horizontal tension or a sag to span ratio.")
+        self.name = name
+        self.weightPerUnitLength = weightPerUnitLength
+        self.horizontalTension = horizontalTension
+        self.sagToSpanRatio = sagToSpanRatio
+
+
+def _loadCaseGroups(loadCases):
+    # Cases with a sag to span ratio and cases with a tension are solved in their own broadcast.
+    ratioCases = [index for index, loadCase in enumerate(loadCases) if loadCase.sagToSpanRatio is not None]
+    tensionCases = [index for index, loadCase in enumerate(loadCases) if loadCase.sagToSpanRatio is None]
+    return [group for group in (ratioCases, tensionCases) if len(group) > 0]
+
+
+def _tileLoadCases(fromXYZ, toXYZ, loadCases, caseIndices, sagToSpanRatioScale):
+    # Spans x cases as one (C * N) batch: span arrays tiled, case values repeated per span.
+    spanCount = len(fromXYZ)
+    caseCount = len(caseIndices)
+    w = np.repeat([float(loadCases[index].weightPerUnitLength) for index in caseIndices], spanCount)
+    sagToSpanRatio = None
+    horizontalTension = None
+    if loadCases[caseIndices[0]].sagToSpanRatio is not None:
+        sagToSpanRatio = np.repeat([float(loadCases[index].sagToSpanRatio) for index in caseIndices], spanCount)
+        if sagToSpanRatioScale is not None:
+            sagToSpanRatio = sagToSpanRatio * np.tile(np.broadcast_to(sagToSpanRatioScale, (spanCount,)), caseCount)
+    else:
+        horizontalTension = np.repeat([float(loadCases[index].horizontalTension) for index in caseIndices], spanCount)
+    return np.tile(fromXYZ, (caseCount, 1)), np.tile(toXYZ, (caseCount, 1)), w, sagToSpanRatio, horizontalTension
+
+
+def solveLoadCases(fromXYZ, toXYZ, loadCases, sagToSpanRatioScale=None, exact=False):
+    # Solves all spans for all load cases; returns one SpanSolution (N spans) per case, in loadCases order.
+    # sagToSpanRatioScale (per span) scales the sag ratio of ratio cases, e.g. 0.5 for shield wires.
+    fromXYZ = asXYZArray(fromXYZ)
+    toXYZ = asXYZArray(toXYZ)
+    spanCount = len(fromXYZ)
+    solutions = [None] * len(loadCases)
+    for caseIndices in _loadCaseGroups(loadCases):
+        tiledFrom, tiledTo, w, sagToSpanRatio, horizontalTension = _tileLoadCases(fromXYZ, toXYZ, loadCases, caseIndices,
+                                                                                  sagToSpanRatioScale)
+        solution = solveSpans(tiledFrom, tiledTo, w, sagToSpanRatio=sagToSpanRatio, horizontalTension=horizontalTension, exact=exact)
+        for position, caseIndex in enumerate(caseIndices):
+            solutions[caseIndex] = solution.select(slice(position * spanCount, (position + 1) * spanCount))
+    return solutions
+
+
+def solveAndSampleLoadCases(fromXYZ, toXYZ, loadCases, sagToSpanRatioScale=None, vertexTolerance=None, exact=False):
+    # solveAndSampleSpans() for all spans x load cases in one pass per group of cases.
+    # Returns one (solution, validIndices, span vertices, line guide vertices) tuple per case, in loadCases order.
+    fromXYZ = asXYZArray(fromXYZ)
+    toXYZ = asXYZArray(toXYZ)
+    spanCount = len(fromXYZ)
+    results = [None] * len(loadCases)
+    for caseIndices in _loadCaseGroups(loadCases):
+        tiledFrom, tiledTo, w, sagToSpanRatio, horizontalTension = _tileLoadCases(fromXYZ, toXYZ, loadCases, caseIndices,
+                                                                                  sagToSpanRatioScale)
+        solution, validIndices, spanVertices, guideVertices = solveAndSampleSpans(tiledFrom, tiledTo, w, sagToSpanRatio,
+                                                                                  horizontalTension, vertexTolerance, exact=exact)
+        for position, caseIndex in enumerate(caseIndices):
+            start = position * spanCount
+            validPositions = np.flatnonzero((validIndices >= start) & (validIndices < start + spanCount))
+            if isinstance(spanVertices, np.ndarray):
+                caseVertices = spanVertices[validPositions]
+            else:
+                caseVertices = [spanVertices[validPosition] for validPosition in validPositions]
+            results[caseIndex] = (solution.select(slice(start, start + spanCount)), validIndices[validPositions] - start,
+                                  caseVertices, guideVertices[validPositions])
+    return results
+
+
+def tensionSectionStarts(lineNumbers, fromTowers, deadEndTowers=None):
+    # True for every span that starts a tension section: the first span of a line, and spans that leave a dead-end tower.
+    # Spans must be in (line, tower) order, like spanEndpointIndices() gives them.
+    lineNumbers = np.asarray(lineNumbers)
+    starts = np.ones(len(lineNumbers), dtype=bool)
+    starts[1:] = lineNumbers[1:] != lineNumbers[:-1]
+    if deadEndTowers is not None and len(deadEndTowers) > 0:
+        starts |= np.isin(np.asarray(fromTowers), list(deadEndTowers))
+    return starts
+
+
+def rulingSpanLengths(spanLengths, sectionStarts):
+    # Ruling span sqrt(sum(S^3) / sum(S)) of every tension section, given for every span of the section.
+    spanLengths = np.asarray(spanLengths, dtype=np.float64)
+    sectionFirstSpans = np.flatnonzero(sectionStarts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rulingSpans = np.sqrt(np.add.reduceat(spanLengths ** 3, sectionFirstSpans) / np.add.reduceat(spanLengths, sectionFirstSpans))
+    sectionIndex = np.cumsum(sectionStarts) - 1
+    return rulingSpans[sectionIndex]
+
+
+def rulingSpanSags(spanLengths, sectionStarts, weightPerUnitLength, sagToSpanRatio=None, horizontalTension=None):
+    # Per span sag and tension from the ruling span of its tension section: all spans of a section share one horizontal
+    # tension, the tension of the ruling span (from its sag ratio, or the given tension), and sag with S^2:
+    # D = w * S^2 / 8H. Returns (D, H) arrays.
+    spanLengths = np.asarray(spanLengths, dtype=np.float64)
+    w = np.broadcast_to(np.asarray(weightPerUnitLength, dtype=np.float64), spanLengths.shape)
+    rulingSpans = rulingSpanLengths(spanLengths, sectionStarts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if sagToSpanRatio is not None:
+            # Ruling span sag D_RS = ratio * RS, so H = w * RS^2 / (8 * D_RS) = w * RS / (8 * ratio).
+            H = w * rulingSpans / (8 * np.asarray(sagToSpanRatio, dtype=np.float64))
+        elif horizontalTension is not None:
+            H = np.broadcast_to(np.asarray(horizontalTension, dtype=np.float64), spanLengths.shape)
+        else:
+            raise ValueError("rulingSpanSags needs a sag to span ratio or a horizontal tension.")
+        D = w * np.square(spanLengths) / (8 * H)
+    return D, np.array(H)
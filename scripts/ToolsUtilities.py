@@ -4,6 +4,7 @@ Created on Jun 7, 2017
 @author: chri7180
 '''
 
+import os
 import time
 import arcpy
 
@@ -187,3 +188,102 @@ class NewRow(object):
     def addFields(self, fieldInsertDictionary):
         self.fieldInsertDictionary.update(fieldInsertDictionary)
 
+
+# InsertCursorWriter: keeps one arcpy.da.InsertCursor open on a table for a whole run.
+# Rows are collected and written through the open cursor every flushSize rows, and on close().
+# fieldNameList must be in the same order as the value lists that are inserted (NewRow.getFieldNamesList()).
+
+class InsertCursorWriter(object):
+
+    def __init__(self, table, fieldNameList, flushSize=1000):
+        self.table = table
+        self.fieldNameList = list(fieldNameList)
+        self.flushSize = flushSize
+        self.cursor = None
+        self.pendingRows = []
+        self.rowCount = 0
+
+    def insertRow(self, fieldValuesList):
+        self.pendingRows.append(fieldValuesList)
+        if self.flushSize is None or len(self.pendingRows) >= self.flushSize:
+            self.flush()
+
+    def insertNewRow(self, newRow):
+        self.insertRow(newRow.getFieldValuesList())
+
+    def flush(self):
+        if len(self.pendingRows) == 0:
+            return
+        if self.cursor is None:
+            self.cursor = arcpy.da.InsertCursor(self.table, self.fieldNameList)
+        for fieldValuesList in self.pendingRows:
+            self.cursor.insertRow(fieldValuesList)
+        self.rowCount += len(self.pendingRows)
+        self.pendingRows = []
+
+    def close(self):
+        self.flush()
+        if self.cursor is not None:
+            del self.cursor
+            self.cursor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# FeatureClassAccumulator: collects the features of a series of feature classes into one output.
+# The output is created once, with the first source as schema template, and every source is then streamed in
+# through one open InsertCursorWriter, instead of an Exists / Append / Copy per source.
+# Like Append with NO_TEST, fields are matched by name: fields a source doesn't have stay null, and source fields
+# the output doesn't have are skipped.
+
+class FeatureClassAccumulator(object):
+
+    def __init__(self, outputFC, flushSize=1000):
+        self.outputFC = outputFC
+        self.flushSize = flushSize
+        self.fieldNameList = None
+        self.writer = None
+
+    def create(self, templateFC):
+        description = arcpy.Describe(templateFC)
+        if arcpy.Exists(self.outputFC):
+            arcpy.Delete_management(self.outputFC)
+        arcpy.CreateFeatureclass_management(os.path.dirname(self.outputFC), os.path.basename(self.outputFC),
+                                            description.shapeType.upper(), templateFC,
+                                            "ENABLED" if description.hasM else "DISABLED",
+                                            "ENABLED" if description.hasZ else "DISABLED",
+                                            description.spatialReference)
+        fieldNames = [field.name for field in arcpy.ListFields(self.outputFC)
+                      if field.type not in ("OID", "Geometry") and field.editable]
+        self.fieldNameList = ["SHAPE@"] + fieldNames
+        self.writer = InsertCursorWriter(self.outputFC, self.fieldNameList, self.flushSize)
+
+    def append(self, sourceFC):
+        if self.writer is None:
+            self.create(sourceFC)
+        sourceFieldNames = {field.name.lower(): field.name for field in arcpy.ListFields(sourceFC)}
+        # Positions in the output row of the fields the source shares with the output.
+        sharedPositions = [position for position in range(1, len(self.fieldNameList))
+                           if self.fieldNameList[position].lower() in sourceFieldNames]
+        searchFieldNames = ["SHAPE@"] + [sourceFieldNames[self.fieldNameList[position].lower()] for position in sharedPositions]
+        with arcpy.da.SearchCursor(sourceFC, searchFieldNames) as cursor:
+            for row in cursor:
+                values = [None] * len(self.fieldNameList)
+                values[0] = row[0]
+                for position, value in zip(sharedPositions, row[1:]):
+                    values[position] = value
+                self.writer.insertRow(values)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
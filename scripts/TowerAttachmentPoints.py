@@ -0,0 +1,216 @@
+"""
+Conductor and shield wire attachment points of the towers, computed the way the TransmissionTower_ExportPoints rule
+(rule_packages/PowerTower_Jan18.cga) places them, so spans can be made without a FeaturesFromCityEngineRules call.
+The offsets are worked out once per tower configuration in the tower's local frame, and placed at all towers with one
+vectorized rotation and translation. Does not import arcpy.
+"""
+
+import sys
+import importlib
+
+import numpy as np
+
+import SpanArrays as sa
+if 'SpanArrays' in sys.modules:
+    importlib.reload(sa)
+
+
+class UnsupportedTowerConfiguration(Exception): pass
+
+
+# Rule constants (PowerTower_Jan18.cga), all lengths relative to the conductor clearances HC and VC.
+metersPerFoot = 0.3048
+insulatorWidthPerHC = 0.03
+distPoleDiameterPerHC = 0.2
+shieldHeightPerVC_AlignV_Shields1 = 2
+poleShieldArmHeightPerVC = 1
+poleShieldArmLengthPerVC = 0.75
+poleCrossBeamHeightPerVC = 0.1
+poleCrossBeamWidthPerVC_Circ1 = 0.5
+substationAttachmentHeightPerVC = 0.7
+substationShieldWireHeightPerVC = 0.25
+
+
+def meters(towerConfiguration, length):
+    # The rule's meters(): clearances and sag allowances are in the configuration's units.
+    if towerConfiguration.units == "Feet":
+        return length * metersPerFoot
+    return length
+
+
+def getClearances(towerConfiguration):
+    HC = meters(towerConfiguration, towerConfiguration.conductor_horizontal_clearance)
+    VC = meters(towerConfiguration, towerConfiguration.conductor_vertical_clearance)
+    return HC, VC
+
+
+def getHighestAttachmentPointAboveLowest(towerConfiguration, VC):
+    if towerConfiguration.line_type == "Distribution":
+        return VC if towerConfiguration.circuits == 2 else 0
+    if towerConfiguration.alignment == "Horizontal":
+        return 0
+    if towerConfiguration.alignment == "Vertical":
+        return VC * 2
+    return VC
+
+
+def getConductorOffsets(towerConfiguration, structureType, HC, VC):
+    # (line, x, y, z) of the conductors: the rule's AttPoints_* PointLocation() calls.
+    circuits = towerConfiguration.circuits
+    alignment = towerConfiguration.alignment
+
+    if towerConfiguration.line_type == "Distribution":
+        insulatorWidth = HC * insulatorWidthPerHC
+        distPoleDiameter = HC * distPoleDiameterPerHC
+        halfBoard = distPoleDiameter / 2 + insulatorWidth * 3 + HC
+        middlePointOffsetX = distPoleDiameter / 2 + insulatorWidth * 3
+        rightPointOffsetX = halfBoard - insulatorWidth / 2
+        distPointOffsetZ = distPoleDiameter / 2 * 1.25
+        offsets = []
+        if circuits > 0:
+            offsets += [(1, -rightPointOffsetX, 0, distPointOffsetZ), (2, middlePointOffsetX, 0, distPointOffsetZ),
+                        (3, rightPointOffsetX, 0, distPointOffsetZ)]
+        if circuits == 2:
+            offsets += [(4, -rightPointOffsetX, VC, distPointOffsetZ), (5, middlePointOffsetX, VC, distPointOffsetZ),
+                        (6, rightPointOffsetX, VC, distPointOffsetZ)]
+        return offsets
+
+    if towerConfiguration.line_type != "Transmission":
+        return []
+
+    if circuits == 1:
+        if structureType == "Substation":
+            return [(1, -HC * 0.25, 0, 0), (2, 0, 0, 0), (3, HC * 0.25, 0, 0)]
+        if alignment == "Horizontal":
+            return [(1, -HC, 0, 0), (2, 0, 0, 0), (3, HC, 0, 0)]
+        if alignment == "Vertical":
+            return [(1, -HC * 0.75, VC * 2, 0), (2, -HC * 0.75, VC, 0), (3, -HC * 0.75, 0, 0)]
+        return [(1, -HC * 0.75, VC, 0), (2, HC * 0.75, VC * 0.5, 0), (3, -HC * 0.75, 0, 0)]
+
+    if circuits == 2:
+        if structureType == "Substation":
+            return [(1, -HC * 0.625, 0, 0), (2, -HC * 0.375, 0, 0), (3, -HC * 0.125, 0, 0),
+                    (4, HC * 0.125, 0, 0), (5, HC * 0.375, 0, 0), (6, HC * 0.625, 0, 0)]
+        if alignment == "Horizontal":
+            return [(1, -HC * 2.5, 0, 0), (2, -HC * 1.5, 0, 0), (3, -HC * 0.5, 0, 0),
+                    (4, HC * 0.5, 0, 0), (5, HC * 1.5, 0, 0), (6, HC * 2.5, 0, 0)]
+        if alignment == "Vertical":
+            return [(1, -HC * 0.75, VC * 2, 0), (2, -HC * 0.75, VC, 0), (3, -HC * 0.75, 0, 0),
+                    (4, HC * 0.75, VC * 2, 0), (5, HC * 0.75, VC, 0), (6, HC * 0.75, 0, 0)]
+        return [(1, -HC * 1.1, VC, 0), (2, -HC * 1.6, 0, 0), (3, -HC * 0.6, 0, 0),
+                (4, HC * 1.1, VC, 0), (5, HC * 0.6, 0, 0), (6, HC * 1.6, 0, 0)]
+
+    return []
+
+
+def getShieldWireOffsets(towerConfiguration, structureType, HC, VC):
+    # (line, x, y, z) of the shield wires (lines -1 and -2). Substations place them with PointLocation() too, lattice
+    # towers and transmission poles mount them on the modelled structure: the vertical lattice peak and the pole shield
+    # arms are reproduced here, the horizontal lattice ears and the inverted peak arms are not.
+    shieldWires = towerConfiguration.shield_wires
+    circuits = towerConfiguration.circuits
+    alignment = towerConfiguration.alignment
+
+    if towerConfiguration.line_type != "Transmission" or shieldWires == 0 or circuits not in (1, 2):
+        return []
+
+    if structureType == "Substation":
+        substationShieldWireHeight = VC * substationShieldWireHeightPerVC
+        if shieldWires == 1:
+            return [(-1, 0, substationShieldWireHeight, 0)]
+        shieldWireOffsetX = HC * (0.125 if circuits == 1 else 0.5)
+        return [(-1, -shieldWireOffsetX, substationShieldWireHeight, 0), (-2, shieldWireOffsetX, substationShieldWireHeight, 0)]
+
+    highestAttachmentPointAboveLowest = getHighestAttachmentPointAboveLowest(towerConfiguration, VC)
+
+    if structureType == "Lattice":
+        if alignment != "Horizontal" and shieldWires == 1:
+            # Peak of the vertical cage: the cage and peak heights add up to the shield support height above
+            # the highest conductor.
+            return [(-1, 0, highestAttachmentPointAboveLowest + VC * shieldHeightPerVC_AlignV_Shields1, 0)]
+        raise UnsupportedTowerConfiguration("Shield wires of " + alignment + " lattice towers with " + str(shieldWires) +
+                                            " shield wires are placed on the tower model.")
+
+    if structureType == "Pole":
+        armTipSizeInsulatorLength = HC * insulatorWidthPerHC
+        poleBoxSize = VC * poleCrossBeamHeightPerVC * 1.2
+        poleShieldArmLength = VC * poleShieldArmLengthPerVC
+        if alignment == "Horizontal" and circuits == 1:
+            poleShieldArmLength = poleShieldArmLength / 3
+        shieldWireX = poleBoxSize / 2 + poleShieldArmLength - armTipSizeInsulatorLength
+        shieldWireY = highestAttachmentPointAboveLowest + VC * poleShieldArmHeightPerVC + poleBoxSize / 2
+        poleX = 0
+        if alignment == "Horizontal":
+            # Double pole: the left pole carries shield wire -1, the right pole shield wire -2.
+            poleX = HC * VC * poleCrossBeamWidthPerVC_Circ1 / 2 if circuits == 1 else HC
+        offsets = [(-1, -poleX - shieldWireX, shieldWireY, 0)]
+        if shieldWires > 1:
+            offsets.append((-2, poleX + shieldWireX, shieldWireY, 0))
+        return offsets
+
+    raise UnsupportedTowerConfiguration("Shield wires of " + str(structureType) + " structures are placed on the tower model.")
+
+
+def getAttachmentPointOffsets(towerConfiguration, structureType):
+    # Line numbers (K,) and offsets (K, 3) in meters of all attachment points of one tower, in the tower's local frame:
+    # x to the right of the line direction, y up from the lowest attachment height, z backwards.
+    # Raises UnsupportedTowerConfiguration when a point can only be found on the tower model.
+    HC, VC = getClearances(towerConfiguration)
+    offsets = getConductorOffsets(towerConfiguration, structureType, HC, VC) + \
+              getShieldWireOffsets(towerConfiguration, structureType, HC, VC)
+    lineNumbers = np.array([offset[0] for offset in offsets], dtype=np.int64)
+    xyz = np.array([offset[1:] for offset in offsets], dtype=np.float64).reshape(-1, 3)
+    return lineNumbers, xyz
+
+
+def isSupported(towerConfiguration, structureTypes):
+    try:
+        for structureType in set(structureTypes):
+            getAttachmentPointOffsets(towerConfiguration, structureType)
+    except UnsupportedTowerConfiguration:
+        return False
+    return True
+
+
+def getDispatchHeights(towerConfiguration, structureTypes, maximumSagAllowances):
+    # Height of the lowest attachment point above the tower base, per tower, in meters.
+    HC, VC = getClearances(towerConfiguration)
+    lowestAttachmentHeights = meters(towerConfiguration, towerConfiguration.minimum_ground_clearance + np.asarray(maximumSagAllowances, dtype=np.float64))
+    return np.where(np.asarray(structureTypes) == "Substation", VC * substationAttachmentHeightPerVC, lowestAttachmentHeights)
+
+
+def makeAttachmentPoints(towerConfiguration, baseXYZ, cardinalDirections, towerNumbers, structureTypes, maximumSagAllowances, metersPerUnit=1.0):
+    # Attachment points of all towers of a line as a SpanArrays.attachmentPointDtype array, like the Line/Tower points
+    # the ExportPoints RPK makes. baseXYZ is (N, 3) in map units, cardinalDirections in degrees clockwise from north.
+    # metersPerUnit converts the rule's meters to the map units of baseXYZ.
+    baseXYZ = sa.asXYZArray(baseXYZ)
+    cardinalDirections = np.radians(np.asarray(cardinalDirections, dtype=np.float64))
+    towerNumbers = np.asarray(towerNumbers, dtype=np.int64)
+    structureTypes = np.asarray(structureTypes)
+    dispatchHeights = getDispatchHeights(towerConfiguration, structureTypes, maximumSagAllowances)
+
+    pointArrays = []
+    for structureType in np.unique(structureTypes):
+        towerIndices = np.flatnonzero(structureTypes == structureType)
+        lineNumbers, offsets = getAttachmentPointOffsets(towerConfiguration, structureType)
+        if len(lineNumbers) == 0:
+            continue
+        # The rule turns the tower by -Cardinal_Direction around its up axis: local x points to the right of the
+        # line direction (cos c, -sin c), local z backwards (-sin c, -cos c).
+        cosines = np.cos(cardinalDirections[towerIndices])[:, np.newaxis]
+        sines = np.sin(cardinalDirections[towerIndices])[:, np.newaxis]
+        x = offsets[:, 0] / metersPerUnit
+        y = offsets[:, 1] / metersPerUnit
+        z = offsets[:, 2] / metersPerUnit
+
+        points = np.empty((len(towerIndices), len(lineNumbers)), dtype=sa.attachmentPointDtype)
+        points["x"] = baseXYZ[towerIndices, 0][:, np.newaxis] + x * cosines - z * sines
+        points["y"] = baseXYZ[towerIndices, 1][:, np.newaxis] - x * sines - z * cosines
+        points["z"] = baseXYZ[towerIndices, 2][:, np.newaxis] + dispatchHeights[towerIndices][:, np.newaxis] / metersPerUnit + y
+        points["line"] = lineNumbers
+        points["tower"] = towerNumbers[towerIndices][:, np.newaxis]
+        pointArrays.append(points.ravel())
+
+    if len(pointArrays) == 0:
+        return np.empty(0, dtype=sa.attachmentPointDtype)
+    return np.concatenate(pointArrays)
@@ -0,0 +1,51 @@
+"""
+Tower model instancing. Towers of one line share a handful of distinct models: they only differ in
+Cardinal_Direction and Maximum_Sag_Allowance. The model of each distinct (tower configuration, structure type,
+quantized sag allowance) is made once with the ExportModel RPK, and placed at every tower as a turned and moved copy
+of its WKB. Does not import arcpy.
+"""
+
+import math
+import sys
+import importlib
+
+import GeometryEncoding as ge
+if 'GeometryEncoding' in sys.modules:
+    importlib.reload(ge)
+import SpanArrays as sa
+if 'SpanArrays' in sys.modules:
+    importlib.reload(sa)
+
+
+class TowerModel(object):
+    # The features the RPK made for one tower at prototypeBaseXYZ, facing north (Cardinal_Direction 0).
+    def __init__(self, prototypeBaseXYZ, wkbParts):
+        self.prototypeBaseXYZ = tuple(float(value) for value in prototypeBaseXYZ)
+        self.templates = [ge.WKBTemplate(wkb) for wkb in wkbParts]
+
+    def place(self, baseXYZ, cardinalDirection):
+        # WKB of every feature of the model for a tower at baseXYZ; the rule turns towers clockwise by Cardinal_Direction.
+        return [template.moved(self.prototypeBaseXYZ, baseXYZ, cardinalDirection) for template in self.templates]
+
+
+class TowerModelCache(sa.LRUCache):
+    # LRU of at most maxSize models, and with cacheDirectory every model is also pickled to disk so later runs can skip
+    # the RPK (SpanArrays.LRUCache).
+    # Sag allowances are rounded to sagQuantum (in the configuration's units): a copy can be up to sagQuantum / 2
+    # taller or shorter than its own tower would be. signature is added to every key, it should change with anything
+    # else that changes the models (RPK file, spatial reference).
+    def __init__(self, sagQuantum=0.5, cacheDirectory=None, signature=None, maxSize=1000):
+        sa.LRUCache.__init__(self, maxSize, cacheDirectory)
+        self.sagQuantum = sagQuantum
+        self.signature = signature
+
+    def quantizeSag(self, maximumSagAllowance):
+        if maximumSagAllowance is None or not math.isfinite(maximumSagAllowance) or not self.sagQuantum:
+            return maximumSagAllowance
+        return round(maximumSagAllowance / self.sagQuantum) * self.sagQuantum
+
+    def makeKey(self, towerConfiguration, structureType, maximumSagAllowance):
+        # The per tower values (structure type, sag) replace the ones on the configuration.
+        configuration = tuple(sorted((name, value) for name, value in vars(towerConfiguration).items()
+                                     if name not in ("structure_type", "maximum_sag_allowance")))
+        return (configuration, structureType, self.quantizeSag(maximumSagAllowance), self.sagQuantum, self.signature)
@@ -113,7 +113,7 @@ def funPolylineToArcpyPolyline(funPolylines):
                 for funPoint in funPoints:
                     newArcpyPoint = arcpy.Point(funPoint.x, funPoint.y, funPoint.z, None, 0)
                     newArcpyPoints.append(newArcpyPoint)
-                    pointArray = arcpy.Array(newArcpyPoints)
+                pointArray = arcpy.Array(newArcpyPoints)
                 polylineArray.append(pointArray)
             else:
                 pint("Error: funPolylineToArcpyPolyline: polyline is None.")
@@ -139,7 +139,7 @@ def funPolygonToArcpyPolygon(funPolygons):
                 for funPoint in funPoints:
                     newArcpyPoint = arcpy.Point(funPoint.x, funPoint.y, funPoint.z, None, 0)
                     newArcpyPoints.append(newArcpyPoint)
-                    pointArray = arcpy.Array(newArcpyPoints)
+                pointArray = arcpy.Array(newArcpyPoints)
                 polygonArray.append(pointArray)
             else:
                 pint("Error: funPolygonToArcpyPolygon: polygon is None.")
@@ -445,7 +445,11 @@ def drawRectangleWithTwoPoints(pointA, pointB, thickness):
 def normalVector2D(vector):
     return crossProduct(vector, Vector(0,0,1))
 
+# Node, Point and Vector use __slots__: catenaries and sway surfaces make very many of them.
+# The Node slots include the attributes that are attached to nodes later (u, v, and the polygon split flags).
 class Node(object):
+    __slots__ = ("x", "y", "z", "turnCode", "u", "v", "isSplitNode", "nodeIndex", "hasBeenJumpedFrom", "isAboveSplit", "jumpsTo")
+
     def __init__(self, x,y,z):
         self.x = float(x)
         self.y = float(y)
@@ -472,6 +476,8 @@ class Edge(object):
 
 
 class Point(object):
+    __slots__ = ("x", "y", "z")
+
     def __init__(self, x,y,z):
         self.x = float(x)
         self.y = float(y)
@@ -490,6 +496,8 @@ class Line(object):
         return "Line from: " + str(self.pointA) + " to  " + str(self.pointB)
 
 class Vector(object):
+    __slots__ = ("x", "y", "z")
+
     def __init__(self, x,y,z):
         self.x = float(x)
         self.y = float(y)
@@ -42,87 +42,52 @@ def p(label, value):
         arcpy.AddMessage(label + " " + str(value))
 
 
+# Where clause that selects all rows for a set of (FromTower, ToTower, LineNumber) keys with one query.
+# The IN-lists can select a few extra rows (other combinations of the same values), so rows are checked against the keys too.
+def makeSpanKeysWhereClause(spanKeys):
+    fromTowers = sorted(set([str(key[0]) for key in spanKeys]))
+    toTowers = sorted(set([str(key[1]) for key in spanKeys]))
+    lineNumbers = sorted(set([str(key[2]) for key in spanKeys]))
+    return "FromTower IN (" + ", ".join(fromTowers) + ") and ToTower IN (" + ", ".join(toTowers) + \
+           ") and LineNumber IN (" + ", ".join(lineNumbers) + ")"
+
+
+def deleteSpanKeys(lc_table, spanKeys, whereClause):
+    # One UpdateCursor pass over the table for all keys.
+    deleteFieldList = ["FromTower", "ToTower", "LineNumber"]
+    deleteCount = 0
+    with arcpy.da.UpdateCursor(lc_table, deleteFieldList, whereClause) as deleteCursor:
+        for row in deleteCursor:
+            if (row[0], row[1], row[2]) in spanKeys:
+                deleteCursor.deleteRow()
+                deleteCount += 1
+    return deleteCount
+
+
 def doSpanRemoveAndInsert(lc_includedTransmissionLinesFC, lc_includedTransmissionLineGuides, lc_listOfSpans):
     try:
-        # Delete and Insert features into 4 tables.
-        fieldListSpans = ['SHAPE@', 'FromTower', 'ToTower', 'LineNumber', 'SagDistance', 'HorizontalTension', 'LineLength', 'WeightPerUnitLength']
-        fieldListGuideLines = ['SHAPE@', 'FromTower', 'ToTower', 'LineNumber', 'FromX', 'FromY', 'FromZ', 'ToX', 'ToY', 'ToZ', 'SagDistance', 'WeightPerUnitLength']
-        deleteFieldList = ["FromTower", "ToTower", "LineNumber"]
-
-        newRow = utils.NewRow()
-        newRow.setFieldNames(fieldListSpans)
+        # Delete and Insert features into 2 tables.
+        # All adjusted spans are replaced together: one delete pass and one insert cursor per table.
+        if len(lc_listOfSpans) == 0:
+            return
 
+        spanKeys = set()
         for span in lc_listOfSpans:
-            fromTower = span.fromTower
-            toTower = span.toTower
-            lineNumber = span.lineNumber
-            deleteWhereClause = "FromTower = " + str(fromTower) + " and ToTower = " + \
-                                str(toTower) + " and LineNumber = " + str(lineNumber)
-            # All new rows have these fields/values.
-            newRow.set('FromTower', fromTower)
-            newRow.set('ToTower', toTower)
-            newRow.set('LineNumber', lineNumber)
-
-            # Delete existing TransmissionLines.
-            deleteCursor = arcpy.da.UpdateCursor(lc_includedTransmissionLinesFC, deleteFieldList, deleteWhereClause)
-            for row in deleteCursor:
-                deleteCursor.deleteRow()
-            if deleteCursor:
-                del deleteCursor
+            spanKeys.add((span.fromTower, span.toTower, span.lineNumber))
+        deleteWhereClause = makeSpanKeysWhereClause(spanKeys)
 
-            # Delete existing LineGuides.
-            deleteCursor = arcpy.da.UpdateCursor(lc_includedTransmissionLineGuides, deleteFieldList, deleteWhereClause)
-            for row in deleteCursor:
-                deleteCursor.deleteRow()
-            if deleteCursor:
-                del deleteCursor
-
-            ####################################
-
-            # Insert new transmisson line.
-            cursorInsertLine = arcpy.da.InsertCursor(lc_includedTransmissionLinesFC, newRow.getFieldNamesList())
-            lineShape = vg.funPolylineToArcpyPolyline([span.polyline])
-            newRow.set('SHAPE@', lineShape)
-            newRow.set('FromTower', span.fromTower)
-            newRow.set('ToTower', span.toTower)
-            newRow.set('LineNumber', span.lineNumber)
-            # XX Added extra reporting fields here:
-            newRow.set('SagDistance', span.sagDistance)
-            newRow.set('HorizontalTension', span.horizontalTension)
-            newRow.set('LineLength', span.lineLength)
-            newRow.set('WeightPerUnitLength', span.weightPerUnitLength)
-
-            cursorInsertLine.insertRow(newRow.getFieldValuesList())
-            del cursorInsertLine
-
-            # Insert new lineGuide.
-            newRowGuideLines = utils.NewRow()
-
-            fromX = span.fromPoint.x
-            fromY = span.fromPoint.y
-            fromZ = span.fromPoint.z
-
-            toX = span.toPoint.x
-            toY = span.toPoint.y
-            toZ = span.toPoint.z
-
-            newRowGuideLines.setFieldNames(fieldListGuideLines)
-            cursorInsertLineGuide = arcpy.da.InsertCursor(lc_includedTransmissionLineGuides, newRowGuideLines.getFieldNamesList())
-            polylineShape = vg.funPolylineToArcpyPolyline([span.lineGuide])
-            newRowGuideLines.set('SHAPE@', polylineShape)
-            newRowGuideLines.set('FromTower', fromTower)
-            newRowGuideLines.set('ToTower', toTower)
-            newRowGuideLines.set('LineNumber', lineNumber)
-            newRowGuideLines.set('FromX', fromX)
-            newRowGuideLines.set('FromY', fromY)
-            newRowGuideLines.set('FromZ', fromZ)
-            newRowGuideLines.set('ToX', toX)
-            newRowGuideLines.set('ToY', toY)
-            newRowGuideLines.set('ToZ', toZ)
-            newRowGuideLines.set('SagDistance', span.sagDistance)
-            newRowGuideLines.set('WeightPerUnitLength', span.weightPerUnitLength)
-            cursorInsertLineGuide.insertRow(newRowGuideLines.getFieldValuesList())
-            del cursorInsertLineGuide
+        # Delete existing TransmissionLines and LineGuides.
+        deleteSpanKeys(lc_includedTransmissionLinesFC, spanKeys, deleteWhereClause)
+        deleteSpanKeys(lc_includedTransmissionLineGuides, spanKeys, deleteWhereClause)
+
+        ####################################
+
+        # Insert new transmission lines and lineGuides.
+        spanWriter, guideWriter = create_3D_catenary.makeSpanWriters(lc_includedTransmissionLinesFC, lc_includedTransmissionLineGuides)
+        create_3D_catenary.doInsertSpanAndGuideLine(lc_includedTransmissionLinesFC, lc_includedTransmissionLineGuides,
+                                                    lc_listOfSpans, spanWriter, guideWriter)
+        spanWriter.close()
+        guideWriter.close()
 
     except arcpy.ExecuteError:
         # Get the tool error messages
@@ -134,8 +99,12 @@ def doSpanRemoveAndInsert(lc_includedTransmissionLinesFC, lc_includedTransmissio
     pass
 
 
-def adjustSpans(lc_scratch_ws, lc_catenary, lc_guide_lines, lc_adjust_all, lc_debug, lc_use_in_memory):
+def adjustSpans(lc_scratch_ws, lc_catenary, lc_guide_lines, lc_adjust_all, lc_debug, lc_use_in_memory, lc_span_cache=False, lc_span_cache_dir=None):
     try:
+        # lc_span_cache / lc_span_cache_dir: see create_3D_catenary.makeSpanCache(). Only the "adjust all" spans, which get
+        # a known sag distance, are cached; the span that takes its sag from the moved line guide is always solved.
+        spanCache = create_3D_catenary.makeSpanCache(lc_span_cache, lc_span_cache_dir)
+
         # First, find the from and to points, and line number for this guide line.
         fieldList = ["FromTower", "ToTower", "LineNumber", "FromX", "FromY", "FromZ", "ToX", "ToY", "ToZ", "SagDistance", "WeightPerUnitLength"]
         fieldAccess = utils.FieldAccess(fieldList)
@@ -168,9 +137,14 @@ def adjustSpans(lc_scratch_ws, lc_catenary, lc_guide_lines, lc_adjust_all, lc_de
 
                 p("Initial sagDistance on feature:", sagDistance)
 
+                # Load the line guides between these towers once, from the full feature class (not just selection).
+                # makeSpan() and "adjust all" read from this index instead of querying per span.
+                lineGuideIndex = create_3D_catenary.LineGuideIndex(common_lib.get_full_path_from_layer(lc_guide_lines),
+                                                                   "FromTower = " + str(fromTower) + " and ToTower = " + str(toTower))
+
                 # sag distance is None because we need to calculate it from the lineGuide
                 # horizontal tension is not supplied.
-                adjustedSpan = create_3D_catenary.makeSpan(fromPoint, toPoint, lc_guide_lines, weightPerUnitLength, None, None, None)
+                adjustedSpan = create_3D_catenary.makeSpan(fromPoint, toPoint, lineGuideIndex, weightPerUnitLength, None, None, None)
                 newSpanDistance = adjustedSpan.sagDistance
                 p("new sagDistance on feature:", newSpanDistance)
 
@@ -181,38 +155,19 @@ def adjustSpans(lc_scratch_ws, lc_catenary, lc_guide_lines, lc_adjust_all, lc_de
             # We have already created the span with a sag distance.
             # For simplicity, we'll throw out that span object and make all six using that sag.
             adjustedSpans = []
-            fieldList = ["FromTower", "ToTower", "LineNumber", "FromX", "FromY", "FromZ", "ToX", "ToY", "ToZ"]
-            fieldAccess = utils.FieldAccess(fieldList)
-            whereClause = "FromTower = " + str(fromTower) + " and ToTower = " + str(toTower)
-
             p("sagDistance for all lines", newSpanDistance)
 
-            # search in full feature class, not just selection
-            i = 0
-            cursor = arcpy.da.SearchCursor(common_lib.get_full_path_from_layer(lc_guide_lines), fieldList, whereClause)
-            for row in cursor:
-                fieldAccess.setRow(row)
-                lineNumber = fieldAccess.getValue("LineNumber")
-                fromTower = fieldAccess.getValue("FromTower")
-                toTower = fieldAccess.getValue("ToTower")
-                fromX = fieldAccess.getValue("FromX")
-                fromY = fieldAccess.getValue("FromY")
-                fromZ = fieldAccess.getValue("FromZ")
-                toX = fieldAccess.getValue("ToX")
-                toY = fieldAccess.getValue("ToY")
-                toZ = fieldAccess.getValue("ToZ")
-                fromPointXYZ = vg.Point(fromX, fromY, fromZ)
-                toPointXYZ = vg.Point(toX, toY, toZ)
+            # all lines between these towers, from the full feature class (not just selection)
+            for lineGuideRecord in lineGuideIndex.getLineGuidesBetweenTowers(fromTower, toTower):
                 # Change to attachment point objects.
-                fromPoint = create_3D_catenary.AttachmentPoint(fromPointXYZ, lineNumber, fromTower)
-                toPoint = create_3D_catenary.AttachmentPoint(toPointXYZ, lineNumber, toTower)
+                fromPoint, toPoint = lineGuideRecord.getAttachmentPoints()
 
                 p("newSpanDistance in loop", newSpanDistance)
-                adjustedSpan = create_3D_catenary.makeSpan(fromPoint, toPoint, common_lib.get_full_path_from_layer(lc_guide_lines), weightPerUnitLength, newSpanDistance, None)
-                adjustedSpans.append(adjustedSpan)
-
-                i+=1
-                # arcpy.AddMessage(str(i))
+                adjustedSpan = create_3D_catenary.makeSpan(fromPoint, toPoint, lineGuideIndex, weightPerUnitLength,
+                                                           sagToSpanRatio=None, sagDistance=newSpanDistance, horizontalTension=None,
+                                                           spanCache=spanCache)
+                if adjustedSpan is not None:
+                    adjustedSpans.append(adjustedSpan)
 
             doSpanRemoveAndInsert(lc_catenary, common_lib.get_full_path_from_layer(lc_guide_lines), adjustedSpans)
         else:
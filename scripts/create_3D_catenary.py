@@ -6,6 +6,11 @@ import os
 import arcpy
 import sys
 import math
+import itertools
+import collections
+import multiprocessing
+import concurrent.futures
+import numpy as np
 import importlib
 
 import ToolsUtilities as utils
@@ -14,6 +19,12 @@ if 'ToolsUtilities' in sys.modules:
 import VectorGeometry as vg
 if 'VectorGeometry' in sys.modules:
     importlib.reload(vg)
+import SpanArrays as sa
+if 'SpanArrays' in sys.modules:
+    importlib.reload(sa)
+import GeometryEncoding as ge
+if 'GeometryEncoding' in sys.modules:
+    importlib.reload(ge)
 import common_lib
 if 'common_lib' in sys.modules:
     importlib.reload(common_lib)  # force reload of the module
@@ -43,23 +54,44 @@ def p(label, value):
 ###############################################################################################
 
 
+class AttachmentPointsNotOrdered(Exception): pass
+
 
 class AttachmentPoint(object):
+    # Slotted; x, y and z are read from the point instead of being copied.
+    __slots__ = ("point", "lineNumber", "towerNumber")
+
     def __init__(self, point, lineNumber, towerNumber):
         self.point = point
-        self.x = point.x
-        self.y = point.y
-        self.z = point.z
         self.lineNumber = lineNumber
         self.towerNumber = towerNumber
 
+    @property
+    def x(self):
+        return self.point.x
+
+    @property
+    def y(self):
+        return self.point.y
+
+    @property
+    def z(self):
+        return self.point.z
+
     def __str__(self):
         return "AttachmentPoint: " + str(self.point) + ",  " + str(self.lineNumber) + ",  " + str(self.towerNumber)
 
 class Span(object):
+    __slots__ = ("_polyline", "fromPoint", "toPoint", "lineNumber", "fromTower", "toTower", "_swayLines", "_surfacePanels",
+                 "swayGrid", "swayMesh", "_lineGuide", "polylineVertices", "lineGuideVertices",
+                 "sagDistance", "horizontalTension", "lineLength", "weightPerUnitLength")
+
+    # This is the increment that sway lines and sway surfaces are gridded in the direction of the sway.
+    swayIncrements = 10 # degrees
+
     def __init__(self, fromPoint, toPoint):
-        # Shape of polyline feature (in VG module format).
-        self.polyline = None
+        # Shape of polyline feature (in VG module format). Only made on first use, from polylineVertices (see below).
+        self._polyline = None
         # Attachment Points and line number are the primary key for the span features, at least for now.
         self.fromPoint = fromPoint
         self.toPoint = toPoint
@@ -67,26 +99,141 @@ class Span(object):
         # Tower numbers come from AttachmentPoints.
         self.fromTower = fromPoint.towerNumber
         self.toTower = toPoint.towerNumber
-        # This is the increment that sway lines and sway surfaces are gridded in the direction of the sway.
-        self.swayIncrements = 10 # degrees
         # Storage of sway lines and surfaces, to be entered into their own feature classes.
-        self.swayLines = []
-        self.surfacePanels = []
-        self.lineGuide = None
+        # The lists are only made when the sway tool uses them (see the properties below).
+        self._swayLines = None
+        self._surfacePanels = None
+        # (angles, vertices, 3) array of the sway line vertices, made with the sway lines.
+        self.swayGrid = None
+        # (vertices, faces) triangle mesh of the sway surface.
+        self.swayMesh = None
+        self._lineGuide = None
+        # (M, 3) vertex arrays of polyline and lineGuide. These are the shapes of the span; the writers, the span cache
+        # and the WKB/JSON encoders only read these.
+        self.polylineVertices = None
+        self.lineGuideVertices = None
         # These are reports to be written to fields in Spans feature class.
         self.sagDistance = None
         self.horizontalTension = None
         self.lineLength = None
         self.weightPerUnitLength = None
 
+    @property
+    def polyline(self):
+        if self._polyline is None and self.polylineVertices is not None:
+            self._polyline = vg.Polyline(sa.verticesToNodes(self.polylineVertices, vg.Node))
+        return self._polyline
+
+    @polyline.setter
+    def polyline(self, polyline):
+        self._polyline = polyline
+
+    @property
+    def lineGuide(self):
+        if self._lineGuide is None and self.lineGuideVertices is not None:
+            self._lineGuide = vg.Polyline(sa.verticesToNodes(self.lineGuideVertices, vg.Node))
+        return self._lineGuide
+
+    @lineGuide.setter
+    def lineGuide(self, lineGuide):
+        self._lineGuide = lineGuide
+
+    @property
+    def swayLines(self):
+        if self._swayLines is None:
+            self._swayLines = []
+        return self._swayLines
+
+    @swayLines.setter
+    def swayLines(self, swayLines):
+        self._swayLines = swayLines
+
+    @property
+    def surfacePanels(self):
+        if self._surfacePanels is None:
+            self._surfacePanels = []
+        return self._surfacePanels
+
+    @surfacePanels.setter
+    def surfacePanels(self, surfacePanels):
+        self._surfacePanels = surfacePanels
+
+
+class LineGuideRecord(object):
+    # One line guide feature: its key, the height of the guide, and the attachment points it was made for.
+    def __init__(self, lineNumber, fromTower, toTower, lineGuideZ, fromPoint, toPoint, sagDistance, weightPerUnitLength):
+        self.lineNumber = lineNumber
+        self.fromTower = fromTower
+        self.toTower = toTower
+        self.lineGuideZ = lineGuideZ
+        self.fromPoint = fromPoint
+        self.toPoint = toPoint
+        self.sagDistance = sagDistance
+        self.weightPerUnitLength = weightPerUnitLength
+
+    def getAttachmentPoints(self):
+        fromPoint = AttachmentPoint(self.fromPoint, self.lineNumber, self.fromTower)
+        toPoint = AttachmentPoint(self.toPoint, self.lineNumber, self.toTower)
+        return fromPoint, toPoint
+
+class LineGuideIndex(object):
+    # Loads the line guide table in one scan, keyed by (LineNumber, FromTower, ToTower).
+    # makeSpan() takes it in place of the line guide table, so spans are adjusted without a query per span.
+    # Without a table the index is empty, and makeSpan() uses the default line guide height for every span.
+    # whereClause limits the scan to some of the line guides, e.g. the lines between two towers.
+    def __init__(self, lc_includedTransmissionLineGuides, whereClause=None):
+        self.table = lc_includedTransmissionLineGuides
+        self.lineGuides = {}
+        if lc_includedTransmissionLineGuides is None:
+            return
+        fieldList = ["SHAPE@", "FromTower", "ToTower", "LineNumber", "FromX", "FromY", "FromZ", "ToX", "ToY", "ToZ", "SagDistance", "WeightPerUnitLength"]
+        fieldAccess = utils.FieldAccess(fieldList)
+        with arcpy.da.SearchCursor(lc_includedTransmissionLineGuides, fieldList, whereClause) as cursor:
+            for row in cursor:
+                fieldAccess.setRow(row)
+                lineGuideShape = fieldAccess.getValue("SHAPE@")
+                lineGuideZ = None
+                if lineGuideShape is not None:
+                    lineGuideZ = lineGuideShape.firstPoint.Z
+                fromPoint = vg.Point(fieldAccess.getValue("FromX"), fieldAccess.getValue("FromY"), fieldAccess.getValue("FromZ"))
+                toPoint = vg.Point(fieldAccess.getValue("ToX"), fieldAccess.getValue("ToY"), fieldAccess.getValue("ToZ"))
+                record = LineGuideRecord(fieldAccess.getValue("LineNumber"), fieldAccess.getValue("FromTower"),
+                                         fieldAccess.getValue("ToTower"), lineGuideZ, fromPoint, toPoint,
+                                         fieldAccess.getValue("SagDistance"), fieldAccess.getValue("WeightPerUnitLength"))
+                self.lineGuides[(record.lineNumber, record.fromTower, record.toTower)] = record
+
+    def get(self, lineNumber, fromTower, toTower):
+        return self.lineGuides.get((lineNumber, fromTower, toTower))
+
+    def getLineGuideZ(self, lineNumber, fromTower, toTower):
+        record = self.get(lineNumber, fromTower, toTower)
+        if record is None:
+            return None
+        return record.lineGuideZ
+
+    def getLineGuidesBetweenTowers(self, fromTower, toTower):
+        # All lines of one span, sorted by line number (used by "adjust all").
+        records = [record for record in self.lineGuides.values() if record.fromTower == fromTower and record.toTower == toTower]
+        return sorted(records, key=lambda record: record.lineNumber)
+
 
 '''
 NOTE: Formulas used are from document epdf.tips_electric-power-generation-transmission-and-distrib.pdf,
 except that one misprinted formula. We moved parenthesis to correct that.
 '''
 
-def makeSpan(fromPoint, toPoint, lc_includedTransmissionLineGuides, lc_testLineWeight, sagToSpanRatio, sagDistance, horizontalTension):
+def makeSpan(fromPoint, toPoint, lc_includedTransmissionLineGuides, lc_testLineWeight, sagToSpanRatio, sagDistance, horizontalTension, vertexTolerance=None, spanCache=None):
     try:
+        # With a SpanCache, spans with the same shape inputs are solved once. Spans that take their sag from
+        # a line guide are not cached, the guide can be moved between runs.
+        spanCacheKey = None
+        if spanCache is not None and (sagToSpanRatio is not None or horizontalTension is not None or sagDistance is not None):
+            spanCacheKey = spanCache.makeKey((fromPoint.x, fromPoint.y, fromPoint.z), (toPoint.x, toPoint.y, toPoint.z), lc_testLineWeight,
+                                             horizontalTension, sagToSpanRatio, sagDistance, vertexTolerance, exact=False)
+            cachedSpan = spanCache.get(spanCacheKey)
+            if cachedSpan is not None:
+                return makeSpanFromCacheEntry(fromPoint, toPoint, cachedSpan)
+
         span = Span(fromPoint, toPoint)
         # Define span shape here, then set polyline on Span object.
         spanVector3D = vg.getVectorFromTwoPoints(fromPoint, toPoint)
@@ -130,13 +277,6 @@ def makeSpan(fromPoint, toPoint, lc_includedTransmissionLineGuides, lc_testLineW
         # When called from adjust_3D_catenary the first time sagDistance is None:
         elif sagDistance is None and lc_includedTransmissionLineGuides is not None:
 
-            # Query LineGuides for line with matching from, to, and line.
-            fieldListLineGuides = ["SHAPE@", "FromTower", "ToTower", "LineNumber"]
-            fieldAccessLineGuides = utils.FieldAccess(fieldListLineGuides)
-            whereClauseLineGuides = "FromTower = " + str(fromTower) + " and ToTower = " + str(
-                toTower) + " and LineNumber = " + str(lineNumber)
-            cursor = arcpy.da.SearchCursor(lc_includedTransmissionLineGuides, fieldListLineGuides, whereClauseLineGuides)
-
             msg_body = create_msg_body("Creating span for line number " + str(lineNumber) + " from tower " + str(
                                                                     fromTower) + " to tower " + str(toTower) + ".", 0, 0)
             msg(msg_body)
@@ -150,13 +290,24 @@ def makeSpan(fromPoint, toPoint, lc_includedTransmissionLineGuides, lc_testLineW
             else:
                 defaultLineGuideZ = fromPoint.z - 10
 
-            for row in cursor:
-                fieldAccessLineGuides.setRow(row)
-                lineGuideShape = fieldAccessLineGuides.getValue("SHAPE@")
-                lineGuide = vg.arcpyPolylineToVGPolyline(lineGuideShape)
-                lineGuideZ = lineGuide.nodes[0].z
-            if cursor:
-                del cursor
+            if isinstance(lc_includedTransmissionLineGuides, LineGuideIndex):
+                # Line guides were loaded once, no query per span.
+                lineGuideZ = lc_includedTransmissionLineGuides.getLineGuideZ(lineNumber, fromTower, toTower)
+            else:
+                # Query LineGuides for line with matching from, to, and line.
+                fieldListLineGuides = ["SHAPE@", "FromTower", "ToTower", "LineNumber"]
+                fieldAccessLineGuides = utils.FieldAccess(fieldListLineGuides)
+                whereClauseLineGuides = "FromTower = " + str(fromTower) + " and ToTower = " + str(
+                    toTower) + " and LineNumber = " + str(lineNumber)
+                cursor = arcpy.da.SearchCursor(lc_includedTransmissionLineGuides, fieldListLineGuides, whereClauseLineGuides)
+
+                for row in cursor:
+                    fieldAccessLineGuides.setRow(row)
+                    lineGuideShape = fieldAccessLineGuides.getValue("SHAPE@")
+                    lineGuide = vg.arcpyPolylineToVGPolyline(lineGuideShape)
+                    lineGuideZ = lineGuide.nodes[0].z
+                if cursor:
+                    del cursor
 
             # If no user line exists, this span has not been run yet, so use default.
             # Only issue warning if user-adjusted line is above either attachment point.
@@ -214,7 +365,7 @@ def makeSpan(fromPoint, toPoint, lc_includedTransmissionLineGuides, lc_testLineW
 
 
         # Use external function for 3D polyline (below).
-        makeSpanPolylineShapeAndLineGuide(span, xHigh, xLow, dHigh, dLow, H, w)
+        makeSpanPolylineShapeAndLineGuide(span, xHigh, xLow, dHigh, dLow, H, w, vertexTolerance)
 
 
         # LineLength (uses these values from above calculations):
@@ -232,6 +383,9 @@ def makeSpan(fromPoint, toPoint, lc_includedTransmissionLineGuides, lc_testLineW
         span.lineLength = L
         span.weightPerUnitLength = w
 
+        if spanCacheKey is not None:
+            spanCache.put(spanCacheKey, makeSpanCacheEntry(span))
+
         return span
 
     except arcpy.ExecuteError:
@@ -243,105 +397,240 @@ def makeSpan(fromPoint, toPoint, lc_includedTransmissionLineGuides, lc_testLineW
         arcpy.AddMessage("Unhandled exception: " + str(e.args[0]))
     pass
 
-def makeSpanPolylineShapeAndLineGuide(span, xHigh, xLow, dHigh, dLow, H, w):
-    fromPoint = span.fromPoint
-    toPoint = span.toPoint
-    spanVector3D = vg.getVectorFromTwoPoints(fromPoint, toPoint)
-    spanVector2DNoZ = vg.Vector(spanVector3D.x, spanVector3D.y, 0)
-    spanLength2D = vg.magnitude(spanVector2DNoZ)
-    # Make a list of values along the length of the span.
-    # listZ holds the calculated z-values of each point on the line (relative to a flat 2D line between the towers).
-    listZ = []
-    # listT
-    listT = []
-    #Function z(t) is parameterized from 0 to 1 in X direction.
-    def zAsAFunctionOfX(_x, _h, _w):
-        a = _h / _w
-        coshXoverA = math.cosh(_x / a)
-        coshXoverA_MinusOne = coshXoverA - 1
-        a_times_coshXoverA_MinusOne = a * coshXoverA_MinusOne
-        z = a_times_coshXoverA_MinusOne
-        return z
-
-    for xStep in range(0, 101, 1):
-        # T is moving from fromTower to toTower.
-        T = (xStep * spanLength2D) / 100
-        listT.append(T)
-        # X origin is at lowest point in span, and x is positive in both directions.
-        if fromPoint.z > toPoint.z:
-            sagOriginDrop = dHigh
-            # XX This condition is to handle a condition when an X value is negative... not sure about it. (uplift)
-            if xHigh < 0:
-                xAsFunctionOfT = abs(xHigh) + T
-            else:
-                xAsFunctionOfT = abs(T - xHigh)
-        else:
-            sagOriginDrop = dLow
-            # XX This condition is to handle a condition when an X value is negative... not sure about it. (uplift)
-            if xLow < 0:
-                xAsFunctionOfT = abs(xLow) + T
-            else:
-                xAsFunctionOfT = abs(T - xLow)
-
-        x = xAsFunctionOfT
-        zValue = zAsAFunctionOfX(x, H, w)
-        listZ.append(zValue)
-
-    # XX Visual correction code is here!!!  This is just a fix, until we have someone with math or industry knowledge.
-
-    firstZCalced = listZ[0] # z-relative to sag origin
-    lastZCalced = listZ[-1] # z-relative to sag origin
-    fromPointZ = span.fromPoint.z # feature z-value
-    toPointZ = span.toPoint.z # feature z-value
-    firstZCalcedPlusSagOriginDrop = firstZCalced + sagOriginDrop #CW TODO ref before init (maybe this was fixed?) maybe I got a runtime error for this? Too many weeks back.
-    firstFixZ  = sagOriginDrop - firstZCalced
-    firstElevDiff = fromPointZ - firstZCalcedPlusSagOriginDrop
-    lastZCalcedPlusSagOriginDrop = lastZCalced + sagOriginDrop
-    lastElevDiff = toPointZ - lastZCalcedPlusSagOriginDrop
-    totalShearZ = lastElevDiff - firstElevDiff
-    shearZIncrement = (totalShearZ / 100)
-
-
-    # The is where we are calculating the line shape based on the known z-values determined above.
-    # Start at fromPoint, and drop it by sag.
-    sagDropVector = vg.Vector(0, 0, -sagOriginDrop)
-    sagOriginPoint = vg.copyNode(fromPoint, sagDropVector)
-    pointsForSpanPolyline = []
-    for index in range(0, len(listT)):
-        xAlongSpanVector = vg.setVectorMagnitude(spanVector2DNoZ, listT[index])
-        shearZ = shearZIncrement * index # shearZ is part of visual fix
-        zMoveUpValue = listZ[index] + firstFixZ + shearZ # firstFixZ is part of visual fix.
-        zMoveUpVector = vg.Vector(0, 0, zMoveUpValue)
-        originPointMoveVector = vg.addVectors(xAlongSpanVector, zMoveUpVector)
-        thisPoint = vg.copyNode(sagOriginPoint, originPointMoveVector)
-        pointsForSpanPolyline.append(thisPoint)
-
-
-    # Make line shape from points.
-    span.polyline = vg.Polyline(pointsForSpanPolyline)
-
-    # Make lineGuide.
-    lineGuideEndPoint = vg.copyNode(sagOriginPoint, spanVector2DNoZ)
-    lineGuide = vg.Polyline([sagOriginPoint, lineGuideEndPoint])
-    span.lineGuide = lineGuide
+def makeSpanCacheEntry(span):
+    # Vertices relative to the from point, and the reported values (see SpanArrays.SpanCache).
+    return sa.SpanCache.makeEntry(sa.asXYZArray([span.fromPoint]), span.polylineVertices, span.lineGuideVertices, span.sagDistance,
+                                  span.horizontalTension, span.lineLength, span.weightPerUnitLength)
+
+def makeSpanFromCacheEntry(fromPoint, toPoint, cacheEntry):
+    # The cached shape is placed on fromPoint and made to end on toPoint (see SpanArrays.SpanCache.entryVertices).
+    polylineOffsets, lineGuideOffsets, sagDistance, horizontalTension, lineLength, weightPerUnitLength = cacheEntry
+    span = Span(fromPoint, toPoint)
+    polylineVertices, lineGuideVertices = sa.SpanCache.entryVertices(cacheEntry, sa.asXYZArray([fromPoint]), sa.asXYZArray([toPoint]))
+    setSpanPolylineAndLineGuide(span, polylineVertices, lineGuideVertices)
+    span.sagDistance = sagDistance
+    span.horizontalTension = horizontalTension
+    span.lineLength = lineLength
+    span.weightPerUnitLength = weightPerUnitLength
+    return span
+
+def makeSpanCache(lc_span_cache=False, lc_span_cache_dir=None):
+    # lc_span_cache: spans with the same shape inputs are solved once (SpanArrays.SpanCache). With lc_span_cache_dir the
+    # solved spans are also kept on disk, so later create and adjust runs reuse them.
+    if not lc_span_cache:
+        return None
+    return sa.SpanCache(cacheDirectory=lc_span_cache_dir)
+
+def makeProcessPool(workers):
+    # Inside ArcGIS Pro sys.executable is ArcGISPro.exe, so child processes are started with the Python of the Pro
+    # environment instead.
+    pythonExecutable = os.path.join(sys.exec_prefix, "pythonw.exe")
+    if os.path.exists(pythonExecutable):
+        multiprocessing.set_executable(pythonExecutable)
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+
+def solveSpanBatch(fromXYZ, toXYZ, lc_testLineWeight, sagToSpanRatios, horizontalTension, vertexTolerance=None, workers=None, chunkSize=2000,
+                   templateTolerance=None, exact=False, executor=None):
+    # Returns a list of (offset, solveAndSampleSpans() result) pairs.
+    # With workers, the batch is split in chunks that are solved in a process pool; only arrays travel between processes.
+    # executor is a pool from makeProcessPool() to reuse; without it a pool is started for this batch.
+    if (executor is None and (workers is None or workers < 2)) or len(fromXYZ) <= chunkSize:
+        return [(0, sa.solveAndSampleSpans(fromXYZ, toXYZ, lc_testLineWeight, sagToSpanRatios, horizontalTension, vertexTolerance,
+                                            templateTolerance, exact))]
+
+    chunks = sa.makeSpanChunks(fromXYZ, toXYZ, lc_testLineWeight, sagToSpanRatios, horizontalTension, vertexTolerance, chunkSize,
+                               templateTolerance, exact)
+    if executor is not None:
+        results = list(executor.map(sa.solveSpanChunk, [chunk for offset, chunk in chunks]))
+    else:
+        with makeProcessPool(workers) as executor:
+            results = list(executor.map(sa.solveSpanChunk, [chunk for offset, chunk in chunks]))
+    return [(chunks[index][0], results[index]) for index in range(0, len(chunks))]
+
+
+# Batch version of makeSpan() for the create path (sagToSpanRatio or horizontalTension supplied).
+# All spans are solved in one vectorized pass with SpanArrays.solveSpans(), and sampled with SpanArrays.sampleSpanVertices().
+# sagToSpanRatios can be None, a single value or one value per span. Returns a list of Span objects, None for spans that failed.
+# With vertexTolerance, the vertex count per span is picked so the polyline stays within that distance of the catenary.
+def makeSpanBatch(fromPoints, toPoints, lc_testLineWeight, sagToSpanRatios, horizontalTension, vertexTolerance=None, workers=None, templateTolerance=None,
+                  exact=False, executor=None, spanCache=None):
+    if len(fromPoints) == 0:
+        return []
+
+    # Vertices for all valid spans in (N, 101, 3) blocks (or lists of arrays when adaptive), and the matching line guides.
+    return solveAndMakeSpans(sa.asXYZArray(fromPoints), sa.asXYZArray(toPoints), lc_testLineWeight, sagToSpanRatios, horizontalTension,
+                             vertexTolerance, workers, templateTolerance, exact, executor, spanCache,
+                             lambda index: fromPoints[index], lambda index: toPoints[index])
+
+
+def makeSpanBatchFromPointArray(points, fromIndices, toIndices, lc_testLineWeight, sagToSpanRatios, horizontalTension, vertexTolerance=None, workers=None,
+                                templateTolerance=None, exact=False, executor=None, spanCache=None):
+    # Same as makeSpanBatch(), for span ends given as indices in an attachment point array (SpanArrays.attachmentPointDtype).
+    # AttachmentPoint objects are only made for the ends of the spans that are solved.
+    if len(fromIndices) == 0:
+        return []
+
+    xyz = sa.attachmentPointXYZ(points)
+    return solveAndMakeSpans(xyz[fromIndices], xyz[toIndices], lc_testLineWeight, sagToSpanRatios, horizontalTension,
+                             vertexTolerance, workers, templateTolerance, exact, executor, spanCache,
+                             lambda index: attachmentPointFromRecord(points[fromIndices[index]]),
+                             lambda index: attachmentPointFromRecord(points[toIndices[index]]))
+
+
+def solveAndMakeSpans(fromXYZ, toXYZ, lc_testLineWeight, sagToSpanRatios, horizontalTension, vertexTolerance, workers, templateTolerance, exact,
+                      executor, spanCache, getFromPoint, getToPoint):
+    # solveSpanBatch() and makeSpansFromSolvedChunks(). With a spanCache, spans found in the cache are made from their
+    # cached vertices, and only one span per missing key is solved; the others with that key are copies of it.
+    spanCount = len(fromXYZ)
+    if spanCache is None:
+        solvedChunks = solveSpanBatch(fromXYZ, toXYZ, lc_testLineWeight, sagToSpanRatios, horizontalTension, vertexTolerance, workers,
+                                      templateTolerance=templateTolerance, exact=exact, executor=executor)
+        return makeSpansFromSolvedChunks(solvedChunks, spanCount, getFromPoint, getToPoint)
+
+    if sagToSpanRatios is not None:
+        sagToSpanRatios = np.broadcast_to(np.asarray(sagToSpanRatios, dtype=np.float64), (spanCount,))
+    # One key and one cache lookup per group of spans with the same quantized delta and sag ratio.
+    keys, firstIndices, keyIndices = spanCache.makeKeys(fromXYZ, toXYZ, lc_testLineWeight, horizontalTension, sagToSpanRatios,
+                                                        vertexTolerance, templateTolerance, exact)
+    cacheEntries = [spanCache.get(key) for key in keys]
+    spans = [None] * spanCount
+
+    # The first span of every key that is not cached yet is solved; the other spans with that key are copies of it.
+    missingKeys = np.array([keyIndex for keyIndex in range(0, len(keys)) if cacheEntries[keyIndex] is None], dtype=np.int64)
+    if len(missingKeys) > 0:
+        solveIndices = firstIndices[missingKeys]
+        solvedChunks = solveSpanBatch(fromXYZ[solveIndices], toXYZ[solveIndices], lc_testLineWeight,
+                                      None if sagToSpanRatios is None else sagToSpanRatios[solveIndices], horizontalTension,
+                                      vertexTolerance, workers, templateTolerance=templateTolerance, exact=exact, executor=executor)
+        solvedSpans = makeSpansFromSolvedChunks(solvedChunks, len(solveIndices), lambda index: getFromPoint(solveIndices[index]),
+                                                lambda index: getToPoint(solveIndices[index]))
+        for keyIndex, solveIndex, span in zip(missingKeys, solveIndices, solvedSpans):
+            if span is None:
+                continue
+            cacheEntries[keyIndex] = makeSpanCacheEntry(span)
+            spanCache.put(keys[keyIndex], cacheEntries[keyIndex])
+            spans[solveIndex] = span
+
+    for index in range(0, spanCount):
+        cacheEntry = cacheEntries[keyIndices[index]]
+        if spans[index] is None and cacheEntry is not None:
+            spans[index] = makeSpanFromCacheEntry(getFromPoint(index), getToPoint(index), cacheEntry)
+    return spans
+
+
+def attachmentPointFromRecord(record):
+    return AttachmentPoint(vg.Point(record["x"], record["y"], record["z"]), int(record["line"]), int(record["tower"]))
+
+
+def makeSpansFromSolvedChunks(solvedChunks, spanCount, getFromPoint, getToPoint):
+    # Makes the Span objects for solveSpanBatch() results; None where a span could not be solved.
+    spans = [None] * spanCount
+    for offset, (solution, validIndices, spanVerticesBlock, lineGuideVerticesBlock) in solvedChunks:
+        if solution.iterations is not None and len(solution) > 0:
+            arcpy.AddMessage("Exact catenary solve: " + str(int(np.count_nonzero(solution.converged))) + " of " + str(len(solution)) +
+                             " spans converged, at most " + str(int(solution.iterations.max())) + " Newton iterations.")
+        for index in np.flatnonzero(~solution.valid):
+            index = offset + index
+            fromPoint = getFromPoint(index)
+            toPoint = getToPoint(index)
+            arcpy.AddWarning("Can't solve span for line number " + str(toPoint.lineNumber) + " from tower " +
+                             str(fromPoint.towerNumber) + " to tower " + str(toPoint.towerNumber) + ".")
+
+        for validIndex in range(0, len(validIndices)):
+            chunkIndex = validIndices[validIndex]
+            index = offset + chunkIndex
+            span = Span(getFromPoint(index), getToPoint(index))
+            setSpanPolylineAndLineGuide(span, spanVerticesBlock[validIndex], lineGuideVerticesBlock[validIndex])
+            span.sagDistance = float(solution.sagDistance[chunkIndex])
+            span.horizontalTension = float(solution.horizontalTension[chunkIndex])
+            span.lineLength = float(solution.lineLength[chunkIndex])
+            span.weightPerUnitLength = float(solution.weightPerUnitLength[chunkIndex])
+            spans[index] = span
+
+    return spans
+
+
+def makeSpanPolylineShapeAndLineGuide(span, xHigh, xLow, dHigh, dLow, H, w, vertexTolerance=None):
+    # The catenary height (z-value) along the 2D line from tower to tower is calculated for 101 points in one array
+    # operation (SpanArrays.catenaryVertices), which also applies the visual correction.
+    # XX Visual correction code is in there!!!  This is just a fix, until we have someone with math or industry knowledge.
+    # With vertexTolerance, fewer points are used when the chords stay within that distance of the curve (short, flat spans).
+    fromXYZ = sa.asXYZArray([span.fromPoint])
+    toXYZ = sa.asXYZArray([span.toPoint])
+    if vertexTolerance is None:
+        spanVertices = sa.catenaryVertices(fromXYZ, toXYZ, xHigh, xLow, dHigh, dLow, H, w)[0]
+    else:
+        stepCounts = sa.adaptiveStepCounts(fromXYZ, toXYZ, xHigh, xLow, H, w, vertexTolerance)
+        spanVertices = sa.catenaryVerticesFlat(fromXYZ, toXYZ, xHigh, xLow, dHigh, dLow, H, w, stepCounts)
+    if span.fromPoint.z > span.toPoint.z:
+        sagOriginDrop = dHigh
+    else:
+        sagOriginDrop = dLow
+    lineGuideVertices = sa.lineGuideVertices(fromXYZ, toXYZ, sagOriginDrop)
+    setSpanPolylineAndLineGuide(span, spanVertices, lineGuideVertices[0])
+    pass
 
+def setSpanPolylineAndLineGuide(span, spanVertices, lineGuideVertices):
+    # Line shape and lineGuide as (M, 3) vertex arrays. VG polylines are only made when span.polyline or
+    # span.lineGuide is read.
+    span.polyline = None
+    span.lineGuide = None
+    span.polylineVertices = spanVertices
+    span.lineGuideVertices = lineGuideVertices
     pass
 
-def doInsertSpanAndGuideLine(lc_includedTransmissionLinesFC, lc_includedTransmissionLineGuides,  lc_listOfSpans):
+# Field lists for the two span outputs. The InsertCursorWriters and the rows in doInsertSpanAndGuideLine use this order.
+# Shapes are written as WKB or Esri JSON (GeometryEncoding), so the shape field is SHAPE@WKB or SHAPE@JSON.
+def getSpanFieldLists(geometryFormat=ge.WKB):
+    shapeToken = ge.shapeToken(geometryFormat)
+    fieldListSpans = [shapeToken, 'FromTower', 'ToTower', 'LineNumber', 'SagDistance', 'HorizontalTension', 'LineLength', 'WeightPerUnitLength']
+    fieldListGuideLines = [shapeToken, 'FromTower', 'ToTower', 'LineNumber', 'FromX', 'FromY', 'FromZ', 'ToX', 'ToY', 'ToZ', 'SagDistance', 'WeightPerUnitLength']
+    return fieldListSpans, fieldListGuideLines
+
+# Span shapes as WKB or Esri JSON, from the vertex arrays when the span has them.
+def encodeSpanPolyline(span, geometryFormat=ge.WKB):
+    if span.polylineVertices is not None:
+        return ge.encodePolyline(span.polylineVertices, geometryFormat)
+    return ge.encodePolyline(span.polyline, geometryFormat)
+
+def encodeSpanLineGuide(span, geometryFormat=ge.WKB):
+    if span.lineGuideVertices is not None:
+        return ge.encodePolyline(span.lineGuideVertices, geometryFormat)
+    return ge.encodePolyline(span.lineGuide, geometryFormat)
+
+# One long-lived insert cursor per output for the whole run. The guide line writer is None when there is no guide output.
+def makeSpanWriters(lc_includedTransmissionLinesFC, lc_includedTransmissionLineGuides, lc_flush_size=1000, lc_geometry_format=ge.WKB):
+    fieldListSpans, fieldListGuideLines = getSpanFieldLists(lc_geometry_format)
+    spanWriter = utils.InsertCursorWriter(lc_includedTransmissionLinesFC, fieldListSpans, lc_flush_size)
+    if lc_includedTransmissionLineGuides is not None:
+        guideWriter = utils.InsertCursorWriter(lc_includedTransmissionLineGuides, fieldListGuideLines, lc_flush_size)
+    else:
+        guideWriter = None
+    return spanWriter, guideWriter
+
+def doInsertSpanAndGuideLine(lc_includedTransmissionLinesFC, lc_includedTransmissionLineGuides,  lc_listOfSpans, lc_span_writer=None, lc_guide_writer=None, lc_geometry_format=ge.WKB):
     try:
         # Insert features into 2 tables.
+        # Rows go through the writers from makeSpanWriters(), so cursors stay open between calls.
+        # Without writers, one pair is made (and closed) for this list of spans.
+        closeWriters = False
+        if lc_span_writer is None:
+            lc_span_writer, lc_guide_writer = makeSpanWriters(lc_includedTransmissionLinesFC, lc_includedTransmissionLineGuides,
+                                                              lc_geometry_format=lc_geometry_format)
+            closeWriters = True
 
-        fieldListSpans = ['SHAPE@', 'FromTower', 'ToTower', 'LineNumber', 'SagDistance', 'HorizontalTension', 'LineLength', 'WeightPerUnitLength']
-        fieldListGuideLines = ['SHAPE@', 'FromTower', 'ToTower', 'LineNumber', 'FromX', 'FromY', 'FromZ', 'ToX', 'ToY', 'ToZ', 'SagDistance', 'WeightPerUnitLength']
+        fieldListSpans, fieldListGuideLines = getSpanFieldLists(lc_geometry_format)
+        shapeToken = ge.shapeToken(lc_geometry_format)
 
         newRow = utils.NewRow()
         newRow.setFieldNames(fieldListSpans)
+        newRowGuideLines = utils.NewRow()
+        newRowGuideLines.setFieldNames(fieldListGuideLines)
         for span in lc_listOfSpans:
             fromTower = span.fromTower
             toTower = span.toTower
             lineNumber = span.lineNumber
-            deleteWhereClause = "FromTower = " + str(fromTower) + " and ToTower = " + \
-                                str(toTower) + " and LineNumber = " + str(lineNumber)
             # All new rows have these fields/values.
             newRow.set('FromTower', fromTower)
             newRow.set('ToTower', toTower)
@@ -352,50 +641,32 @@ def doInsertSpanAndGuideLine(lc_includedTransmissionLinesFC, lc_includedTransmis
             newRow.set('LineLength', span.lineLength)
             newRow.set('WeightPerUnitLength', span.weightPerUnitLength)
 
-
             ####################################
 
-
-
             # Insert new transmission line.
-            cursorInsertLine = arcpy.da.InsertCursor(lc_includedTransmissionLinesFC, newRow.getFieldNamesList())
-            lineShape = vg.funPolylineToArcpyPolyline([span.polyline])
-            newRow.set('SHAPE@', lineShape)
-            cursorInsertLine.insertRow(newRow.getFieldValuesList())
-            del cursorInsertLine
+            newRow.set(shapeToken, encodeSpanPolyline(span, lc_geometry_format))
+            lc_span_writer.insertNewRow(newRow)
 
-            if lc_includedTransmissionLineGuides is not None:
+            if lc_guide_writer is not None:
                 # Insert new lineGuide.
-                newRowGuideLines = utils.NewRow()
-
-                fromX = span.fromPoint.x
-                fromY = span.fromPoint.y
-                fromZ = span.fromPoint.z
-
-                toX = span.toPoint.x
-                toY = span.toPoint.y
-                toZ = span.toPoint.z
-
-                # guideLineFieldList = fieldListSpans
-                # guideLineFieldList.extend(["FromX", "FromY", "FromZ", "ToX", "ToY", "ToZ", "SagDistance"])
-                newRowGuideLines.setFieldNames(fieldListGuideLines)
-                cursorInsertLineGuide = arcpy.da.InsertCursor(lc_includedTransmissionLineGuides, newRowGuideLines.getFieldNamesList())
-                polylineShape = vg.funPolylineToArcpyPolyline([span.lineGuide])
-                newRowGuideLines.set('SHAPE@', polylineShape)
+                newRowGuideLines.set(shapeToken, encodeSpanLineGuide(span, lc_geometry_format))
                 newRowGuideLines.set('FromTower', fromTower)
                 newRowGuideLines.set('ToTower', toTower)
                 newRowGuideLines.set('LineNumber', lineNumber)
-                newRowGuideLines.set('FromX', fromX)
-                newRowGuideLines.set('FromY', fromY)
-                newRowGuideLines.set('FromZ', fromZ)
-                newRowGuideLines.set('ToX', toX)
-                newRowGuideLines.set('ToY', toY)
-                newRowGuideLines.set('ToZ', toZ)
+                newRowGuideLines.set('FromX', span.fromPoint.x)
+                newRowGuideLines.set('FromY', span.fromPoint.y)
+                newRowGuideLines.set('FromZ', span.fromPoint.z)
+                newRowGuideLines.set('ToX', span.toPoint.x)
+                newRowGuideLines.set('ToY', span.toPoint.y)
+                newRowGuideLines.set('ToZ', span.toPoint.z)
                 newRowGuideLines.set('SagDistance', span.sagDistance)
                 newRowGuideLines.set('WeightPerUnitLength', span.weightPerUnitLength)
+                lc_guide_writer.insertNewRow(newRowGuideLines)
 
-                cursorInsertLineGuide.insertRow(newRowGuideLines.getFieldValuesList())
-                del cursorInsertLineGuide
+        if closeWriters:
+            lc_span_writer.close()
+            if lc_guide_writer is not None:
+                lc_guide_writer.close()
 
     except arcpy.ExecuteError:
         # Get the tool error messages
@@ -411,8 +682,289 @@ def doInsertSpanAndGuideLine(lc_includedTransmissionLinesFC, lc_includedTransmis
 ############################################################################################### Chris ends...................
 
 
-def makeSpans(lc_scratch_ws, lc_inPoints, lc_testLineWeight, lc_sag_to_span_ratio, lc_horizontal_tension, lc_output_features, lc_debug, lc_use_in_memory, lc_cleanup, lc_caller):
+def getSagToSpanRatioForLine(lc_sag_to_span_ratio, lineNumber):
+    # This is to give shield wires less sag, but only works when using the Easy Way.
+    sagToSpanRatioForMakeSpan = None
+    if lc_sag_to_span_ratio is not None:
+        sagToSpanRatioForMakeSpan = lc_sag_to_span_ratio
+        if lineNumber < 0:
+            sagToSpanRatioForMakeSpan = sagToSpanRatioForMakeSpan * 0.5
+    return sagToSpanRatioForMakeSpan
+
+
+def getSagToSpanRatiosForLines(lc_sag_to_span_ratio, lineNumbers):
+    # Array version of getSagToSpanRatioForLine(): one ratio per span, half the ratio for shield wires (line number < 0).
+    # With a ratio of 1.0 this is the scale that load cases apply to their own ratios.
+    if lc_sag_to_span_ratio is None:
+        return None
+    return np.where(np.asarray(lineNumbers) < 0, 0.5, 1.0) * lc_sag_to_span_ratio
+
+
+def getRulingSpanSagToSpanRatios(fromXYZ, toXYZ, lineNumbers, fromTowers, sagToSpanRatios, lc_testLineWeight, deadEndTowers=None):
+    # Sags from the ruling span of each tension section (SpanArrays.rulingSpanSags), as per span sag to span ratios
+    # for the batch solvers. Sections end at line ends and at the towers in deadEndTowers.
+    fromXYZ = sa.asXYZArray(fromXYZ)
+    toXYZ = sa.asXYZArray(toXYZ)
+    spanLengths2D = np.hypot(toXYZ[:, 0] - fromXYZ[:, 0], toXYZ[:, 1] - fromXYZ[:, 1])
+    sectionStarts = sa.tensionSectionStarts(lineNumbers, fromTowers, deadEndTowers)
+    D, H = sa.rulingSpanSags(spanLengths2D, sectionStarts, lc_testLineWeight, sagToSpanRatio=sagToSpanRatios)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return D / spanLengths2D
+
+
+def iterAttachmentPointsPerLine(lc_inPoints):
+    # Streams the attachment points of one line at a time: (lineNumber, points sorted by tower).
+    # The points are read ordered by (Line, Tower), so only the points of the current line are in memory.
+    fieldList = ["SHAPE@X", "SHAPE@Y", "SHAPE@Z", "Line", "Tower"]
+    seenLineNumbers = set()
+    with arcpy.da.SearchCursor(lc_inPoints, fieldList, sql_clause=(None, "ORDER BY Line, Tower")) as cursor:
+        for lineNumber, rows in itertools.groupby(cursor, key=lambda row: row[3]):
+            # Workspaces without ORDER BY support return the points unordered, which would split lines.
+            if lineNumber in seenLineNumbers:
+                raise AttachmentPointsNotOrdered
+            seenLineNumbers.add(lineNumber)
+            attachmentPoints = [AttachmentPoint(vg.Point(row[0], row[1], row[2]), row[3], row[4]) for row in rows]
+            yield lineNumber, sorted(attachmentPoints, key=lambda attachmentPoint: attachmentPoint.towerNumber)
+
+
+def iterSpansPerLine(attachmentPointsPerLine, lc_testLineWeight, lc_sag_to_span_ratio, lc_horizontal_tension, lc_vertex_tolerance=None, lc_workers=None,
+                     lc_template_tolerance=None, lc_exact=False, lc_ruling_span=False, lc_dead_end_towers=None, lc_line_guides=None,
+                     lc_executor=None, lc_span_cache=None):
+    # Yields the list of spans for each (lineNumber, sorted points) item, solved together per line with makeSpanBatch().
+    # Without a sag to span ratio and a horizontal tension, the sags come from lc_line_guides (a LineGuideIndex of the
+    # input line guides, never the output that is being written) through makeSpan().
+    for lineNumber, attachmentPoints in attachmentPointsPerLine:
+        fromPoints = attachmentPoints[:-1]
+        toPoints = attachmentPoints[1:]
+        if lc_sag_to_span_ratio is None and lc_horizontal_tension is None:
+            spans = [makeSpan(fromPoint, toPoint, lc_line_guides, lc_testLineWeight, sagToSpanRatio=None, sagDistance=None,
+                              horizontalTension=None, vertexTolerance=lc_vertex_tolerance, spanCache=lc_span_cache)
+                     for fromPoint, toPoint in zip(fromPoints, toPoints)]
+            yield [span for span in spans if span is not None]
+            continue
+        sagToSpanRatios = getSagToSpanRatioForLine(lc_sag_to_span_ratio, lineNumber)
+        if lc_ruling_span and sagToSpanRatios is not None and len(fromPoints) > 0:
+            sagToSpanRatios = getRulingSpanSagToSpanRatios(fromPoints, toPoints, [lineNumber] * len(fromPoints),
+                                                           [point.towerNumber for point in fromPoints], sagToSpanRatios,
+                                                           lc_testLineWeight, lc_dead_end_towers)
+        spans = makeSpanBatch(fromPoints, toPoints, lc_testLineWeight, sagToSpanRatios,
+                              lc_horizontal_tension, lc_vertex_tolerance, lc_workers, lc_template_tolerance, lc_exact, lc_executor,
+                              lc_span_cache)
+        yield [span for span in spans if span is not None]
+
+
+def readAttachmentPointArray(lc_inPoints):
+    # All attachment points in one structured array (SpanArrays.attachmentPointDtype), without a Python object per point.
+    fieldList = ["SHAPE@X", "SHAPE@Y", "SHAPE@Z", "Line", "Tower"]
+    return sa.asAttachmentPointArray(arcpy.da.FeatureClassToNumPyArray(lc_inPoints, fieldList))
+
+
+def writeAllSpans(includedTransmissionLinesFC, includedTransmissionLineGuides, lc_inPoints, lc_testLineWeight, lc_sag_to_span_ratio,
+                  lc_horizontal_tension, lc_batch=True, lc_vertex_tolerance=None, lc_flush_size=1000, lc_workers=None, lc_template_tolerance=None,
+                  lc_exact=False, lc_ruling_span=False, lc_dead_end_towers=None, lc_executor=None, lc_span_cache=None, lc_line_guides=None):
+    # Reads all attachment points, makes the spans of all lines, then writes them.
+    # Points are sorted by (line, tower) in one array; span ends are the neighbouring points on a line.
+    points = sa.groupAttachmentPoints(readAttachmentPointArray(lc_inPoints))[0]
+    fromIndices, toIndices = sa.spanEndpointIndices(points)
+
+    # The batch solver needs a sag to span ratio or a horizontal tension. Without either, the sags come from the
+    # line guides in lc_line_guides (a LineGuideIndex), which only makeSpan() reads.
+    if lc_batch and (lc_sag_to_span_ratio is not None or lc_horizontal_tension is not None):
+        # Batch mode: the spans of all lines are solved together.
+        sagToSpanRatios = getSagToSpanRatiosForLines(lc_sag_to_span_ratio, points["line"][fromIndices])
+        if sagToSpanRatios is not None and lc_ruling_span:
+            xyz = sa.attachmentPointXYZ(points)
+            sagToSpanRatios = getRulingSpanSagToSpanRatios(xyz[fromIndices], xyz[toIndices], points["line"][fromIndices],
+                                                           points["tower"][fromIndices], sagToSpanRatios, lc_testLineWeight,
+                                                           lc_dead_end_towers)
+        # With lc_workers, solving and sampling runs in a process pool; the spans are still written from here, single threaded.
+        spans = makeSpanBatchFromPointArray(points, fromIndices, toIndices, lc_testLineWeight, sagToSpanRatios, lc_horizontal_tension,
+                                            lc_vertex_tolerance, lc_workers, lc_template_tolerance, lc_exact, lc_executor, lc_span_cache)
+    else:
+        spans = []
+        for index in range(0, len(fromIndices)):
+            fromPoint = attachmentPointFromRecord(points[fromIndices[index]])
+            toPoint = attachmentPointFromRecord(points[toIndices[index]])
+            sagToSpanRatioForMakeSpan = getSagToSpanRatioForLine(lc_sag_to_span_ratio, fromPoint.lineNumber)
+            spans.append(makeSpan(fromPoint, toPoint, lc_line_guides, lc_testLineWeight, sagToSpanRatio=sagToSpanRatioForMakeSpan,
+                                  sagDistance=None, horizontalTension=lc_horizontal_tension, vertexTolerance=lc_vertex_tolerance,
+                                  spanCache=lc_span_cache))
+
+    # One insert cursor per output for the whole run. Spans are in (line, tower) order.
+    spanWriter, guideWriter = makeSpanWriters(includedTransmissionLinesFC, includedTransmissionLineGuides, lc_flush_size)
+    # not TODO: CW, yes is has to run: switch is driven by includedTransmissionLineGuides inside the function.
+    doInsertSpanAndGuideLine(includedTransmissionLinesFC, includedTransmissionLineGuides, [span for span in spans if span is not None],
+                             spanWriter, guideWriter)
+    spanWriter.close()
+    if guideWriter is not None:
+        guideWriter.close()
+    pass
+
+
+def makeSpanReport(lc_inPoints, lc_report_table, lc_testLineWeight, lc_sag_to_span_ratio, lc_horizontal_tension, lc_exact=False, lc_flush_size=1000):
+    # Report only: solves the spans analytically and writes their attributes to a table, without making any geometry.
+    reportFieldsDict = {"FromTower": "LONG",
+                        "ToTower": "LONG",
+                        "LineNumber": "LONG",
+                        "SagDistance": "DOUBLE",
+                        "HorizontalTension": "DOUBLE",
+                        "LineLength": "DOUBLE",
+                        "WeightPerUnitLength": "DOUBLE",
+                        "LowPointX": "DOUBLE",
+                        "LowPointY": "DOUBLE",
+                        "LowPointZ": "DOUBLE",
+                        "ConductorLength": "DOUBLE"
+                        }
+
+    if arcpy.Exists(lc_report_table):
+        arcpy.Delete_management(lc_report_table)
+    arcpy.CreateTable_management(os.path.dirname(lc_report_table), os.path.basename(lc_report_table))
+    arcpy.management.AddFields(lc_report_table, [[k, v] for k, v in reportFieldsDict.items()])
+
+    points = sa.groupAttachmentPoints(readAttachmentPointArray(lc_inPoints))[0]
+    fromIndices, toIndices = sa.spanEndpointIndices(points)
+    xyz = sa.attachmentPointXYZ(points)
+    fromXYZ = xyz[fromIndices]
+    toXYZ = xyz[toIndices]
+
+    sagToSpanRatios = getSagToSpanRatiosForLines(lc_sag_to_span_ratio, points["line"][fromIndices])
+    solution = sa.solveSpans(fromXYZ, toXYZ, lc_testLineWeight, sagToSpanRatio=sagToSpanRatios,
+                             horizontalTension=lc_horizontal_tension, exact=lc_exact)
+    lowPointXYZ, conductorLength = sa.spanReport(fromXYZ, toXYZ, solution)
+
+    fieldList = list(reportFieldsDict.keys())
+    with utils.InsertCursorWriter(lc_report_table, fieldList, lc_flush_size) as reportWriter:
+        for index in range(0, len(solution)):
+            if not solution.valid[index]:
+                arcpy.AddWarning("Can't solve span for line number " + str(points["line"][toIndices[index]]) + " from tower " +
+                                 str(points["tower"][fromIndices[index]]) + " to tower " + str(points["tower"][toIndices[index]]) + ".")
+                continue
+            reportWriter.insertRow([int(points["tower"][fromIndices[index]]), int(points["tower"][toIndices[index]]),
+                                    int(points["line"][toIndices[index]]),
+                                    float(solution.sagDistance[index]), float(solution.horizontalTension[index]),
+                                    float(solution.lineLength[index]), float(solution.weightPerUnitLength[index]),
+                                    float(lowPointXYZ[index, 0]), float(lowPointXYZ[index, 1]), float(lowPointXYZ[index, 2]),
+                                    float(conductorLength[index])])
+
+    return lc_report_table
+
+
+def makeLoadCaseReport(lc_inPoints, lc_report_table, lc_load_cases, lc_exact=False, lc_flush_size=1000):
+    # Report only, for several load cases (SpanArrays.LoadCase): one row per span, with the attributes of every case
+    # in their own columns (SagDistance_<case name>, ...). All spans x cases are solved in one broadcast.
+    caseFields = ["SagDistance", "HorizontalTension", "LineLength", "WeightPerUnitLength", "LowPointZ", "ConductorLength"]
+    reportFieldsDict = {"FromTower": "LONG", "ToTower": "LONG", "LineNumber": "LONG"}
+    for loadCase in lc_load_cases:
+        for caseField in caseFields:
+            reportFieldsDict[arcpy.ValidateFieldName(caseField + "_" + str(loadCase.name))] = "DOUBLE"
+
+    if arcpy.Exists(lc_report_table):
+        arcpy.Delete_management(lc_report_table)
+    arcpy.CreateTable_management(os.path.dirname(lc_report_table), os.path.basename(lc_report_table))
+    arcpy.management.AddFields(lc_report_table, [[k, v] for k, v in reportFieldsDict.items()])
+
+    points = sa.groupAttachmentPoints(readAttachmentPointArray(lc_inPoints))[0]
+    fromIndices, toIndices = sa.spanEndpointIndices(points)
+    xyz = sa.attachmentPointXYZ(points)
+    fromXYZ = xyz[fromIndices]
+    toXYZ = xyz[toIndices]
+    sagToSpanRatioScale = getSagToSpanRatiosForLines(1.0, points["line"][fromIndices])
+
+    solutions = sa.solveLoadCases(fromXYZ, toXYZ, lc_load_cases, sagToSpanRatioScale, lc_exact)
+    # (cases, fields, spans) block of report values; NaN (written as null) where a case could not be solved.
+    values = np.empty((len(lc_load_cases), len(caseFields), len(fromIndices)), dtype=np.float64)
+    for caseIndex in range(0, len(lc_load_cases)):
+        solution = solutions[caseIndex]
+        lowPointXYZ, conductorLength = sa.spanReport(fromXYZ, toXYZ, solution)
+        values[caseIndex] = [solution.sagDistance, solution.horizontalTension, solution.lineLength, solution.weightPerUnitLength,
+                             lowPointXYZ[:, 2], conductorLength]
+        values[caseIndex][:, ~solution.valid] = np.nan
+    values = values.reshape(-1, len(fromIndices))
+
+    with utils.InsertCursorWriter(lc_report_table, list(reportFieldsDict.keys()), lc_flush_size) as reportWriter:
+        for index in range(0, len(fromIndices)):
+            caseValues = [None if np.isnan(value) else value for value in values[:, index].tolist()]
+            reportWriter.insertRow([int(points["tower"][fromIndices[index]]), int(points["tower"][toIndices[index]]),
+                                    int(points["line"][toIndices[index]])] + caseValues)
+
+    return lc_report_table
+
+
+def getLoadCaseFeatureClasses(lc_output_features, lc_load_cases):
+    # <output>_<case name>_3D for every case, made valid for the output workspace. Raises ValueError when two cases
+    # end up with the same feature class name.
+    workspace = os.path.dirname(lc_output_features)
+    caseFeatureClasses = []
+    for loadCase in lc_load_cases:
+        caseName = arcpy.ValidateTableName(os.path.basename(lc_output_features) + "_" + str(loadCase.name) + "_3D", workspace)
+        caseFC = os.path.join(workspace, caseName)
+        if caseFC in caseFeatureClasses:
+            raise ValueError("Load case " + str(loadCase.name) + " has the same output feature class as another case: " + caseName + ".")
+        caseFeatureClasses.append(caseFC)
+    return caseFeatureClasses
+
+
+def writeLoadCaseSpans(lc_inPoints, lc_output_features, lc_load_cases, spatial_reference, lc_vertex_tolerance=None, lc_exact=False, lc_flush_size=1000):
+    # Span geometry for several load cases: one lines feature class per case, <output>_<case name>_3D,
+    # all solved and sampled in one pass. No line guides are made for load cases.
+    caseFeatureClasses = getLoadCaseFeatureClasses(lc_output_features, lc_load_cases)
+    points = sa.groupAttachmentPoints(readAttachmentPointArray(lc_inPoints))[0]
+    fromIndices, toIndices = sa.spanEndpointIndices(points)
+    xyz = sa.attachmentPointXYZ(points)
+    sagToSpanRatioScale = getSagToSpanRatiosForLines(1.0, points["line"][fromIndices])
+    caseResults = sa.solveAndSampleLoadCases(xyz[fromIndices], xyz[toIndices], lc_load_cases, sagToSpanRatioScale,
+                                             lc_vertex_tolerance, lc_exact)
+
+    spanFieldsDict = {"FromTower": "LONG", "ToTower": "LONG", "LineNumber": "LONG", "COUNT": "LONG", "SagDistance": "DOUBLE",
+                      "HorizontalTension": "DOUBLE", "LineLength": "DOUBLE", "WeightPerUnitLength": "DOUBLE"}
+    for caseIndex in range(0, len(lc_load_cases)):
+        caseFC = caseFeatureClasses[caseIndex]
+        if arcpy.Exists(caseFC):
+            arcpy.Delete_management(caseFC)
+        arcpy.CreateFeatureclass_management(os.path.dirname(caseFC), os.path.basename(caseFC), "POLYLINE", "", "DISABLED", "ENABLED",
+                                            spatial_reference)
+        arcpy.management.AddFields(caseFC, [[k, v] for k, v in spanFieldsDict.items()])
+
+        spans = makeSpansFromSolvedChunks([(0, caseResults[caseIndex])], len(fromIndices),
+                                          lambda index: attachmentPointFromRecord(points[fromIndices[index]]),
+                                          lambda index: attachmentPointFromRecord(points[toIndices[index]]))
+        spanWriter, guideWriter = makeSpanWriters(caseFC, None, lc_flush_size)
+        doInsertSpanAndGuideLine(caseFC, None, [span for span in spans if span is not None], spanWriter, guideWriter)
+        spanWriter.close()
+
+    return caseFeatureClasses
+
+
+def makeSpans(lc_scratch_ws, lc_inPoints, lc_testLineWeight, lc_sag_to_span_ratio, lc_horizontal_tension, lc_output_features, lc_debug, lc_use_in_memory, lc_cleanup, lc_caller, lc_batch=True, lc_vertex_tolerance=None, lc_flush_size=1000, lc_workers=None, lc_stream=False, lc_template_tolerance=None, lc_exact=False, lc_report_only=False, lc_load_cases=None,
+              lc_ruling_span=False, lc_dead_end_towers=None, lc_span_cache=False, lc_span_cache_dir=None, lc_line_guides=None):
     try:
+        # lc_line_guides: line guides of an earlier run, for spans made without a sag to span ratio and a horizontal
+        # tension; their sags come from the guide heights. They are read once, before the outputs are (re)made.
+        # Without them, these spans get the default line guide height.
+        lineGuideIndex = None
+        if lc_sag_to_span_ratio is None and lc_horizontal_tension is None:
+            lineGuideIndex = LineGuideIndex(lc_line_guides)
+
+        # lc_load_cases: list of SpanArrays.LoadCase. Instead of lc_testLineWeight, lc_sag_to_span_ratio and
+        # lc_horizontal_tension, every case is solved: as a wide report table, or as one lines feature class per case.
+        if lc_load_cases:
+            if lc_report_only:
+                reportTable = makeLoadCaseReport(lc_inPoints, lc_output_features + "_SpanReport", lc_load_cases, lc_exact, lc_flush_size)
+                msg_body = create_msg_body("Created load case report table " + common_lib.get_name_from_feature_class(reportTable) + ".", 0, 0)
+                msg(msg_body)
+                return reportTable, None
+            caseFeatureClasses = writeLoadCaseSpans(lc_inPoints, lc_output_features, lc_load_cases, arcpy.Describe(lc_inPoints).spatialReference,
+                                                    lc_vertex_tolerance, lc_exact, lc_flush_size)
+            return caseFeatureClasses, None
+
+        if lc_report_only:
+            # Only the span attributes, in a table next to the output: no feature classes are made.
+            reportTable = makeSpanReport(lc_inPoints, lc_output_features + "_SpanReport", lc_testLineWeight, lc_sag_to_span_ratio,
+                                         lc_horizontal_tension, lc_exact, lc_flush_size)
+            msg_body = create_msg_body("Created span report table " + common_lib.get_name_from_feature_class(reportTable) + ".", 0, 0)
+            msg(msg_body)
+            return reportTable, None
+
         geometry_type = "POLYLINE"
         has_m = "DISABLED"
         has_z = "ENABLED"
@@ -548,67 +1100,38 @@ def makeSpans(lc_scratch_ws, lc_inPoints, lc_testLineWeight, lc_sag_to_span_rati
             includedTransmissionLineGuides = None
 
         ############################################################################################### Chris continues...................
-        attachmentPointList = []
-
-        fieldList = ["SHAPE@X", "SHAPE@Y", "SHAPE@Z", "Line", "Tower"]
-        fieldAccess = utils.FieldAccess(fieldList)
-        cursor = arcpy.da.SearchCursor(lc_inPoints, fieldList)
-        for row in cursor:
-            fieldAccess.setRow(row)
-            x = fieldAccess.getValue("SHAPE@X")
-            y = fieldAccess.getValue("SHAPE@Y")
-            z = fieldAccess.getValue("SHAPE@Z")
-            lineNumber = fieldAccess.getValue("Line")
-            towerNumber = fieldAccess.getValue("Tower")
-            point = vg.Point(x, y, z)
-            attachmentPoint = AttachmentPoint(point, lineNumber, towerNumber)
-            attachmentPointList.append(attachmentPoint)
-        if cursor:
-            del cursor
-
-        # Organize points into lists per line.
-        dictionaryOfListsOfAttachmentPointsPerLine = {}
-        for attachmentPoint in attachmentPointList:
-            lineNumber = attachmentPoint.lineNumber
-            if lineNumber in dictionaryOfListsOfAttachmentPointsPerLine.keys():
-                listOfAttachmentPointsPerLine = dictionaryOfListsOfAttachmentPointsPerLine[lineNumber]
+        # lc_template_tolerance: with one horizontal tension for all spans, span heights are interpolated from one
+        # densely sampled catenary (SpanArrays.CatenaryTemplate) within this tolerance.
+        # lc_exact: batch spans are solved as exact inclined catenaries (SpanArrays.solveExactSpans), without visual correction.
+        # lc_ruling_span: with a sag to span ratio, the ratio sets the sag of the ruling span of each tension section
+        # (split at line ends and at lc_dead_end_towers), and all spans of the section get the sag of its tension.
+        # With a horizontal tension all spans share that tension already, so this changes nothing.
+        # lc_span_cache / lc_span_cache_dir: see makeSpanCache().
+        spanCache = makeSpanCache(lc_span_cache, lc_span_cache_dir)
+        # lc_workers: one process pool for the whole run, shared by every batch (and every line when streaming).
+        executor = None
+        if lc_workers is not None and lc_workers > 1:
+            executor = makeProcessPool(lc_workers)
+        try:
+            if lc_stream:
+                # Streaming: points are read per line (ordered by Line, Tower), and the spans of each line are written
+                # before the next line is read. Memory use stays at about one line of spans.
+                spanWriter, guideWriter = makeSpanWriters(includedTransmissionLinesFC, includedTransmissionLineGuides, lc_flush_size)
+                for spanListPerThisLine in iterSpansPerLine(iterAttachmentPointsPerLine(lc_inPoints), lc_testLineWeight,
+                                                            lc_sag_to_span_ratio, lc_horizontal_tension, lc_vertex_tolerance, lc_workers,
+                                                            lc_template_tolerance, lc_exact, lc_ruling_span, lc_dead_end_towers,
+                                                            lineGuideIndex, executor, spanCache):
+                    doInsertSpanAndGuideLine(includedTransmissionLinesFC, includedTransmissionLineGuides, spanListPerThisLine, spanWriter, guideWriter)
+                spanWriter.close()
+                if guideWriter is not None:
+                    guideWriter.close()
             else:
-                listOfAttachmentPointsPerLine = []
-                dictionaryOfListsOfAttachmentPointsPerLine[lineNumber] = listOfAttachmentPointsPerLine
-            listOfAttachmentPointsPerLine.append(attachmentPoint)
-
-        # Sort attachment points in each line list.
-        # And make a list of line numbers for use in another dictionary.
-        dictionaryOfSpanListsPerLine = {}
-        lineNumberList = []
-        for lineNumber in dictionaryOfListsOfAttachmentPointsPerLine.keys():
-            lineNumberList.append(lineNumber)
-            listOfAttachmentPointsPerLine = dictionaryOfListsOfAttachmentPointsPerLine[lineNumber]
-            listOfAttachmentPointsPerLineSorted = sorted(listOfAttachmentPointsPerLine, key=lambda attachmentPoint: attachmentPoint.towerNumber)
-            spanListPerThisLine = []
-            for index in range(0, len(listOfAttachmentPointsPerLineSorted) - 1):
-                fromPoint = listOfAttachmentPointsPerLineSorted[index]
-                toPoint = listOfAttachmentPointsPerLineSorted[index + 1]
-
-                # This is to give shield wires less sag, but only works when using the Easy Way.
-                sagToSpanRatioForMakeSpan = None
-                if lc_sag_to_span_ratio is not None:
-                    sagToSpanRatioForMakeSpan = lc_sag_to_span_ratio
-                    if lineNumber < 0:
-                        sagToSpanRatioForMakeSpan = sagToSpanRatioForMakeSpan * 0.5
-
-                span = makeSpan(fromPoint, toPoint, includedTransmissionLineGuides, lc_testLineWeight, sagToSpanRatio=sagToSpanRatioForMakeSpan,sagDistance=None, horizontalTension=lc_horizontal_tension)
-                spanListPerThisLine.append(span)
-            dictionaryOfSpanListsPerLine[lineNumber] = spanListPerThisLine
-
-#        msg_body = create_msg_body("Writing all span lines to " + includedTransmissionLinesFC_basename + ".", 0, 0)
-#        msg(msg_body)
-
-        for index in range(0,len(lineNumberList)):
-            lineNumber = lineNumberList[index]
-            spanListPerThisLine = dictionaryOfSpanListsPerLine[lineNumber]
-            # not TODO: CW, yes is has to run: switch is driven by includedTransmissionLineGuides inside the function.
-            doInsertSpanAndGuideLine(includedTransmissionLinesFC, includedTransmissionLineGuides, spanListPerThisLine)
+                writeAllSpans(includedTransmissionLinesFC, includedTransmissionLineGuides, lc_inPoints, lc_testLineWeight, lc_sag_to_span_ratio,
+                              lc_horizontal_tension, lc_batch, lc_vertex_tolerance, lc_flush_size, lc_workers, lc_template_tolerance,
+                              lc_exact, lc_ruling_span, lc_dead_end_towers, executor, spanCache, lineGuideIndex)
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
         if includedTransmissionLineGuides is not None:  # not TODO: CW, nope: see inside doInsertSpanAndGuideLine but could be coded more elegantly
             msg_body = create_msg_body(
@@ -636,6 +1159,12 @@ def makeSpans(lc_scratch_ws, lc_inPoints, lc_testLineWeight, lc_sag_to_span_rati
 
         return includedTransmissionLinesFC, includedTransmissionLineGuides
 
+    except AttachmentPointsNotOrdered:
+        print("Attachment points can't be read ordered by Line and Tower from this workspace, so they can't be streamed per line. "
+              "Run without lc_stream. Exiting...")
+        arcpy.AddError("Attachment points can't be read ordered by Line and Tower from this workspace, so they can't be streamed per line. "
+                       "Run without lc_stream. Exiting...")
+
     except arcpy.ExecuteError:
         # Get the tool error messages
         msgs = arcpy.GetMessages(2)
@@ -7,7 +7,9 @@ Created on Jun 7, 2017
 import arcpy
 import sys
 import time
+import collections
 import math
+import numpy as np
 import importlib
 import os
 
@@ -19,6 +21,18 @@ import VectorGeometry as vg
 if 'VectorGeometry' in sys.modules:
     importlib.reload(vg)
 
+import SpanArrays as sa
+if 'SpanArrays' in sys.modules:
+    importlib.reload(sa)
+
+import TowerAttachmentPoints as tap
+if 'TowerAttachmentPoints' in sys.modules:
+    importlib.reload(tap)
+
+import TowerModels as tm
+if 'TowerModels' in sys.modules:
+    importlib.reload(tm)
+
 import create_3D_catenary
 if 'create_3D_catenary' in sys.modules:
     importlib.reload(create_3D_catenary)
@@ -30,11 +44,17 @@ from common_lib import create_msg_body, msg, trace
 
 TOOLNAME = "Create3Dcatenaryfromline"
 
+# Tower base point field that tags the input line in batch FFCER mode.
+line_id_field = "LineID"
+# Prototype base point field that tags the model in tower model instancing mode.
+model_key_field = "ModelKey"
+
 ###################################
 # debugging and notifications
 
 
 class MultipartInputNotSupported(Exception): pass
+class JunctionPointsNotMatched(Exception): pass
 
 # Feedback functions (print to GP tool output):
 
@@ -81,7 +101,21 @@ class TowerPlacementLine(object):
         # Find tower directions, and max sag allowed per tower based on adjacent spans.
         # Note: there is one less span than there are towers.
         cardinalDirection = None
-        greaterOfAdjacentSpanMaximumSags = None
+
+        # The sag of every span is solved once for the whole line (sag only, no span shapes),
+        # each tower then takes the greater sag of its adjacent spans.
+        # As in makeSpan(): sag to span ratio times the 2D span length, or the catenary sag of the horizontal tension
+        # over the 3D span length.
+        towerXYZ = sa.asXYZArray(self.nodes)
+        spanSags = sa.solveSpanSags(towerXYZ[:-1], towerXYZ[1:], lineWeight, sagToSpanRatio, horizontalTension)
+        # Spans that can't be solved (e.g. cosh overflow for a low tension) are left out of the tower maximums,
+        # as makeSpansFromSolvedChunks() leaves them out of the spans. A tower without a solved span gets a sag of 0.
+        invalidSpans = ~(np.isfinite(spanSags) & (spanSags >= 0))
+        for spanIndex in np.flatnonzero(invalidSpans):
+            arcpy.AddWarning("Can't solve span sag from tower " + str(self.towerBasePoints[spanIndex].towerNumber) +
+                             " to tower " + str(self.towerBasePoints[spanIndex + 1].towerNumber) + ".")
+        spanSags[invalidSpans] = np.nan
+        maximumSags = np.nan_to_num(sa.adjacentSpanMaximums(spanSags), nan=0.0)
 
         endPointGertArgument = endPoints
 
@@ -89,7 +123,6 @@ class TowerPlacementLine(object):
             towerBasePoint = self.towerBasePoints[nodeIndex]
             towerBasePoint.structure_type = towerConfiguration.structure_type
             towerBasePoint.endPointGertArgument = endPointGertArgument
-            # Note: Using 3D length here with sagRatio, so that steep lines get similar sag to flat lines.
 
             if nodeIndex == 0:
                 # The first node's direction is pointing to the second node.
@@ -100,16 +133,6 @@ class TowerPlacementLine(object):
 
                 spanDirectionVector = vg.getVectorFromTwoPoints(fromPoint, toPoint)
                 cardinalDirection = vg.getCardinalDirectionFromVector2D(spanDirectionVector)
-                #spanVector3D = vg.getVectorFromTwoPoints(fromPoint, toPoint)
-                #spanLength3D = vg.magnitude(spanVector3D)
-
-                # Find max sag.
-                # to get max_sag, we need AttachmentPoint objects for the makeSpan() function.
-                thisFakeAttachmentPoint = create_3D_catenary.AttachmentPoint(thisTowerBasePoint.point,0,0)
-                nextFakeAttachmentPoint = create_3D_catenary.AttachmentPoint(nextTowerBasePoint.point,0,0)
-
-                nextSpan = create_3D_catenary.makeSpan(thisFakeAttachmentPoint, nextFakeAttachmentPoint, None, lineWeight, sagToSpanRatio, None, horizontalTension)
-                greaterOfAdjacentSpanMaximumSags = nextSpan.sagDistance
 
                 # Find endpoint type.
                 if endPointGertArgument == "Both" or endPointGertArgument == "Start":
@@ -122,14 +145,6 @@ class TowerPlacementLine(object):
                 spanDirectionVector = vg.getVectorFromTwoPoints(previousTowerBasePoint.point, thisTowerBasePoint.point)
                 cardinalDirection = vg.getCardinalDirectionFromVector2D(spanDirectionVector)
 
-                # find max sag.
-                thisFakeAttachmentPoint = create_3D_catenary.AttachmentPoint(thisTowerBasePoint.point,0,0)
-                previousFakeAttachmentPoint = create_3D_catenary.AttachmentPoint(previousTowerBasePoint.point,0,0)
-
-                previousSpan = create_3D_catenary.makeSpan(previousFakeAttachmentPoint, thisFakeAttachmentPoint, None, lineWeight, sagToSpanRatio, None, horizontalTension)
-                greaterOfAdjacentSpanMaximumSags = previousSpan.sagDistance
-
-
                 # Find endpoint type.
                 if endPointGertArgument == "Both" or endPointGertArgument == "End":
                     towerBasePoint.structure_type = "Substation"
@@ -145,30 +160,16 @@ class TowerPlacementLine(object):
                 spanDirectionBisector = vg.getBisectingVector2D(spanDirectionPrevious, spanDirectionThis)
                 cardinalDirection = vg.getCardinalDirectionFromVector2D(spanDirectionBisector)
 
-                # find max sag.
-                previousFakeAttachmentPoint = create_3D_catenary.AttachmentPoint(previousTowerBasePoint.point,0,0)
-                thisFakeAttachmentPoint = create_3D_catenary.AttachmentPoint(thisTowerBasePoint.point,0,0)
-                nextFakeAttachmentPoint = create_3D_catenary.AttachmentPoint(nextTowerBasePoint.point,0,0)
-
-                previousSpan = create_3D_catenary.makeSpan(previousFakeAttachmentPoint, thisFakeAttachmentPoint, None, lineWeight, sagToSpanRatio, None, horizontalTension)
-                nextSpan = create_3D_catenary.makeSpan(thisFakeAttachmentPoint, nextFakeAttachmentPoint, None, lineWeight, sagToSpanRatio, None, horizontalTension)
-
-                greaterOfAdjacentSpanMaximumSags = greaterOf(previousSpan.sagDistance, nextSpan.sagDistance)
-
                 # XX how could it have worked without the line below?
                 towerBasePoint.structure_type = towerConfiguration.structure_type
 
             # Fields set for each tower.
             towerBasePoint.cardinalDirection = cardinalDirection
-            towerBasePoint.maximum_sag_allowance = greaterOfAdjacentSpanMaximumSags
+            towerBasePoint.maximum_sag_allowance = float(maximumSags[nodeIndex])
             # start and end structures are also set for each base point. That is done in above code.
         # End for node loop.
     pass
 
-def greaterOf(value1, value2):
-    if value1 > value2: return value1
-    else: return value2
-
 # This is used so that the signature of makeTowersAndJunctions won't have to change if schema changes.
 class TowerConfiguration(object):
     def __init__(self):
@@ -197,43 +198,235 @@ class TowerBasePoint(object):
         self.maximum_sag_allowance = None #Gert, I added this.
         self.structure_type = None #Gert, I added this.
 
-def InsertTowerBasePoints(towerBasePoints, tower_configuration, lc_tower_placement_points, lc_fields):
+def makeTowerBasePointRow(towerBasePoint, tower_configuration, lc_fields, shapeToken, shape, lineID=None):
+    newRow = utils.NewRow()
+
+    newRow.set(shapeToken, shape)
+    newRow.set('Cardinal_Direction', towerBasePoint.cardinalDirection)
+    newRow.set('TowerNumber', towerBasePoint.towerNumber)
+    towerConfigIndex = 2
+    for k, v in vars(tower_configuration).items():
+        newRow.set(lc_fields[towerConfigIndex], v)
+        towerConfigIndex += 1
+    # Gert I did this after that loop, because I needed to update the value of these keys maximum_sag_allowance, and structure_type
+    # and those values are being set on tower base points now (not tower config), but lc_fields has those keys already.
+    newRow.set('maximum_sag_allowance', towerBasePoint.maximum_sag_allowance)
+    newRow.set('structure_type', towerBasePoint.structure_type)
+    # batch mode: tags the points of each input line, so the FFCER results can be split by line.
+    if lineID is not None:
+        newRow.set(line_id_field, lineID)
+    return newRow
+
+
+def InsertTowerBasePoints(towerBasePoints, tower_configuration, lc_tower_placement_points, lc_fields, lineID=None):
+    # One insert cursor for all points of the line; every row has the same field names, in the same order.
+    writer = None
     for index in range(0, len(towerBasePoints)):
         towerBasePoint = towerBasePoints[index]
         arcpyPoint = vg.funPointToArcpyPoint(towerBasePoint.point)
-        newRow = utils.NewRow()
-
-        newRow.set('SHAPE@', arcpyPoint)
-        newRow.set('Cardinal_Direction', towerBasePoint.cardinalDirection)
-        newRow.set('TowerNumber', towerBasePoint.towerNumber)
-        towerConfigIndex = 2
-        for k, v in vars(tower_configuration).items():
-            newRow.set(lc_fields[towerConfigIndex], v)
-            towerConfigIndex += 1
-        # Gert I did this after that loop, because I needed to update the value of these keys maximum_sag_allowance, and structure_type
-        # and those values are being set on tower base points now (not tower config), but lc_fields has those keys already.
-        newRow.set('maximum_sag_allowance', towerBasePoint.maximum_sag_allowance)
-        newRow.set('structure_type', towerBasePoint.structure_type)
+        newRow = makeTowerBasePointRow(towerBasePoint, tower_configuration, lc_fields, 'SHAPE@', arcpyPoint, lineID)
 
         ####################################
         # Insert
-        cursorInsert = arcpy.da.InsertCursor(lc_tower_placement_points, newRow.getFieldNamesList())
-        cursorInsert.insertRow(newRow.getFieldValuesList())
-        del cursorInsert
-        pass
+        if writer is None:
+            writer = utils.InsertCursorWriter(lc_tower_placement_points, newRow.getFieldNamesList())
+        writer.insertNewRow(newRow)
+    if writer is not None:
+        writer.close()
+    pass
+
+
+def joinLineIDToJunctionPoints(lc_junction_points, lc_tower_placement_points):
+    # Batch mode: the ExportPoints RPK runs with DROP_EXISTING_FIELDS, as it does per line, so LineID is joined back here.
+    # Every junction point takes the LineID of the nearest (XY) tower base point with the same tower number.
+    if "tower" not in [field.name.lower() for field in arcpy.ListFields(lc_junction_points)]:
+        raise JunctionPointsNotMatched
+    towers = arcpy.da.FeatureClassToNumPyArray(lc_tower_placement_points, ["SHAPE@X", "SHAPE@Y", "TowerNumber", line_id_field])
+    towersPerNumber = {}
+    for towerNumber in np.unique(towers["TowerNumber"]):
+        sameNumber = towers[towers["TowerNumber"] == towerNumber]
+        towersPerNumber[int(towerNumber)] = (np.column_stack((sameNumber["SHAPE@X"], sameNumber["SHAPE@Y"])), sameNumber[line_id_field])
+
+    arcpy.AddField_management(lc_junction_points, line_id_field, "LONG")
+    with arcpy.da.UpdateCursor(lc_junction_points, ["SHAPE@X", "SHAPE@Y", "Tower", line_id_field]) as cursor:
+        for row in cursor:
+            if row[2] is None or int(row[2]) not in towersPerNumber:
+                raise JunctionPointsNotMatched
+            towerXY, lineIDs = towersPerNumber[int(row[2])]
+            distances = np.hypot(towerXY[:, 0] - row[0], towerXY[:, 1] - row[1])
+            row[3] = int(lineIDs[np.argmin(distances)])
+            cursor.updateRow(row)
+
+
+def createTowerPlacementPointsFC(lc_tower_placement_points, spatial_reference, tower_base_point_field_dict, geometry_type="POINT"):
+    arcpy.CreateFeatureclass_management(os.path.dirname(lc_tower_placement_points),
+                                        os.path.basename(lc_tower_placement_points),
+                                        geometry_type, "", "DISABLED", "ENABLED",
+                                        spatial_reference)
+    # add required fields for towerPlacementPoints
+    arcpy.AddMessage("Adding required fields to tower placement points...")
+
+    start_time = time.clock()
+
+    listoffields = []
+    for k, v in tower_base_point_field_dict.items():
+        field = []
+        field.append(k)
+        field.append(v)
+        listoffields.append(field)
+
+    arcpy.management.AddFields(lc_tower_placement_points, listoffields)
+
+    end_time = time.clock()
+    msg_body = create_msg_body("Time to create fields...", start_time,
+                               end_time)
+    msg(msg_body)
+
+
+def makeTowerAttachmentPoints(towerBasePoints, tower_configuration, metersPerUnit):
+    # Attachment points of one line from the TowerAttachmentPoints generator, instead of the ExportPoints RPK.
+    return tap.makeAttachmentPoints(tower_configuration,
+                                    [towerBasePoint.point for towerBasePoint in towerBasePoints],
+                                    [towerBasePoint.cardinalDirection for towerBasePoint in towerBasePoints],
+                                    [towerBasePoint.towerNumber for towerBasePoint in towerBasePoints],
+                                    [towerBasePoint.structure_type for towerBasePoint in towerBasePoints],
+                                    [towerBasePoint.maximum_sag_allowance for towerBasePoint in towerBasePoints],
+                                    metersPerUnit)
+
+
+def createAttachmentPointsFC(lc_attachment_points, spatial_reference, lineID=False):
+    # Same Line and Tower fields as the _Points output of the ExportPoints RPK.
+    arcpy.CreateFeatureclass_management(os.path.dirname(lc_attachment_points),
+                                        os.path.basename(lc_attachment_points),
+                                        "POINT", "", "DISABLED", "ENABLED",
+                                        spatial_reference)
+    listoffields = [["Line", "LONG"], ["Tower", "LONG"]]
+    if lineID:
+        listoffields.append([line_id_field, "LONG"])
+    arcpy.management.AddFields(lc_attachment_points, listoffields)
+
+
+def InsertAttachmentPoints(attachmentPoints, lc_attachment_points, lineID=None):
+    fieldList = ["SHAPE@XYZ", "Line", "Tower"]
+    if lineID is not None:
+        fieldList.append(line_id_field)
+    with utils.InsertCursorWriter(lc_attachment_points, fieldList) as writer:
+        for point in attachmentPoints.tolist():
+            row = [(point[0], point[1], point[2]), point[3], point[4]]
+            if lineID is not None:
+                row.append(lineID)
+            writer.insertRow(row)
+
+
+class TowerModelPlacer(object):
+    # Writes the tower models of each line as moved copies of cached models (TowerModels.TowerModelCache), instead of
+    # running the ExportModel RPK on every tower. Models that are not cached yet are made with one RPK call per line,
+    # from one prototype base point (facing north, with the quantized sag allowance) per model.
+    # The copies are written as SHAPE@WKB, which has no materials: the models keep their shape but lose the RPK colors.
+    def __init__(self, modelCache, exportModelsRPK, lc_output_models, lc_prototype_points, lc_prototype_models,
+                 spatial_reference, tower_base_point_field_dict, lineID=False, lc_flush_size=1000):
+        self.modelCache = modelCache
+        self.exportModelsRPK = exportModelsRPK
+        self.outputModels = lc_output_models
+        self.prototypePoints = lc_prototype_points
+        self.prototypeModels = lc_prototype_models
+        self.fieldNames = list(tower_base_point_field_dict.keys())
+        self.flushSize = lc_flush_size
+        self.writer = None
+
+        prototype_field_dict = dict(tower_base_point_field_dict)
+        prototype_field_dict[model_key_field] = "LONG"
+        output_field_dict = dict(tower_base_point_field_dict)
+        if lineID:
+            output_field_dict[line_id_field] = "LONG"
+        for fc in [lc_prototype_points, lc_output_models]:
+            if arcpy.Exists(fc):
+                arcpy.Delete_management(fc)
+        createTowerPlacementPointsFC(lc_prototype_points, spatial_reference, prototype_field_dict)
+        createTowerPlacementPointsFC(lc_output_models, spatial_reference, output_field_dict, "MULTIPATCH")
+
+    def makeMissingModels(self, towerBasePoints, tower_configuration):
+        # Returns the model of every tower, after making the models that are not in the cache.
+        # Each key is looked up once; made models are kept with the ones found in the cache.
+        keys = [self.modelCache.makeKey(tower_configuration, towerBasePoint.structure_type, towerBasePoint.maximum_sag_allowance)
+                for towerBasePoint in towerBasePoints]
+        models = {}
+        missingModels = collections.OrderedDict()
+        for key, towerBasePoint in zip(keys, towerBasePoints):
+            if key in models or key in missingModels:
+                continue
+            towerModel = self.modelCache.get(key)
+            if towerModel is None:
+                missingModels[key] = towerBasePoint
+            else:
+                models[key] = towerModel
+        if len(missingModels) == 0:
+            return [models[key] for key in keys]
+
+        pint("Making " + str(len(missingModels)) + " tower models.")
+        arcpy.TruncateTable_management(self.prototypePoints)
+        prototypeBasePoints = []
+        with utils.InsertCursorWriter(self.prototypePoints, ["SHAPE@"] + self.fieldNames + [model_key_field]) as writer:
+            for modelIndex, (key, towerBasePoint) in enumerate(missingModels.items()):
+                prototypeBasePoint = TowerBasePoint(towerBasePoint.point)
+                prototypeBasePoint.cardinalDirection = 0
+                prototypeBasePoint.towerNumber = towerBasePoint.towerNumber
+                prototypeBasePoint.maximum_sag_allowance = self.modelCache.quantizeSag(towerBasePoint.maximum_sag_allowance)
+                prototypeBasePoint.structure_type = towerBasePoint.structure_type
+                newRow = makeTowerBasePointRow(prototypeBasePoint, tower_configuration, self.fieldNames,
+                                               'SHAPE@', vg.funPointToArcpyPoint(prototypeBasePoint.point))
+                newRow.set(model_key_field, modelIndex)
+                writer.insertRow(newRow.getFieldValuesList())
+                prototypeBasePoints.append(prototypeBasePoint)
+
+        if arcpy.Exists(self.prototypeModels):
+            arcpy.Delete_management(self.prototypeModels)
+        arcpy.ddd.FeaturesFromCityEngineRules(self.prototypePoints, self.exportModelsRPK,
+                                              self.prototypeModels, "INCLUDE_EXISTING_FIELDS",
+                                              "EXCLUDE_REPORTS", "FEATURE_PER_SHAPE")
+
+        wkbParts = [[] for key in missingModels]
+        with arcpy.da.SearchCursor(self.prototypeModels, ["SHAPE@WKB", model_key_field]) as cursor:
+            for row in cursor:
+                wkbParts[row[1]].append(bytes(row[0]))
+        for modelIndex, key in enumerate(missingModels.keys()):
+            point = prototypeBasePoints[modelIndex].point
+            models[key] = tm.TowerModel((point.x, point.y, point.z), wkbParts[modelIndex])
+            self.modelCache.put(key, models[key])
+        return [models[key] for key in keys]
+
+    def placeTowerModels(self, towerBasePoints, tower_configuration, lineID=None):
+        towerModels = self.makeMissingModels(towerBasePoints, tower_configuration)
+        for towerModel, towerBasePoint in zip(towerModels, towerBasePoints):
+            newRow = makeTowerBasePointRow(towerBasePoint, tower_configuration, self.fieldNames, 'SHAPE@WKB', None, lineID)
+            point = towerBasePoint.point
+            for wkb in towerModel.place((point.x, point.y, point.z), towerBasePoint.cardinalDirection):
+                newRow.set('SHAPE@WKB', wkb)
+                if self.writer is None:
+                    self.writer = utils.InsertCursorWriter(self.outputModels, newRow.getFieldNamesList(), self.flushSize)
+                self.writer.insertRow(newRow.getFieldValuesList())
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def makeTowerModelCache(exportModelsRPK, spatial_reference, lc_model_cache_dir, lc_sag_quantum):
+    # Models change with the RPK and the spatial reference, both are part of every key.
+    rpkStat = os.stat(exportModelsRPK)
+    signature = (os.path.basename(exportModelsRPK), rpkStat.st_size, rpkStat.st_mtime, spatial_reference.name)
+    return tm.TowerModelCache(lc_sag_quantum, lc_model_cache_dir, signature)
 
 
 def makeTowersAndJunctions(lc_scratch_ws, lc_rule_dir, lc_input_features, lc_testLineWeight, lc_sag_to_span_ratio, lc_horizontal_tension,
                                     lc_tower_configuration, lc_ends, lc_output_features,
-                                    lc_debug, lc_use_in_memory):
+                                    lc_debug, lc_use_in_memory, lc_batch_ffcer=False, lc_native_attachment_points=False,
+                                    lc_instance_tower_models=False, lc_model_cache_dir=None, lc_sag_quantum=0.5):
 
     try:
         # Making Tower configuration object to hold fields for TowerBasePoints layer.
         towerConfiguration = lc_tower_configuration
 
-        geometry_type = "POINT"
-        has_m = "DISABLED"
-        has_z = "ENABLED"
 
         in_memory = "in_memory"
         tower_placement_points_name = "TowerLocations"
@@ -323,147 +516,114 @@ def makeTowersAndJunctions(lc_scratch_ws, lc_rule_dir, lc_input_features, lc_tes
 
         num_features = int(arcpy.GetCount_management(lc_input_features).getOutput(0))
 
-        lineCursor = arcpy.da.SearchCursor(lc_input_features, fieldList)
-        i = 1
-
-        for row in lineCursor:
-            if lc_use_in_memory:
-                arcpy.AddMessage("Using in memory for processing")
-
-                # junctions points needed for FFCER
-                outJunctionPointsIntoFFCER = in_memory + "/" + junction_intoFFCER
-
-            else:
-                # junctions points needed for makeSpans: FFCER generates 3D points with _Points in name
-                outJunctionPointsIntoFFCER = os.path.join(lc_scratch_ws, junction_intoFFCER)
-
-            if arcpy.Exists(outJunctionPointsIntoFFCER):
-                arcpy.Delete_management(outJunctionPointsIntoFFCER)
-
-            # delete additional CE output
-            if arcpy.Exists(outJunctionPointsIntoFFCER + CE_additionP):
-                arcpy.Delete_management(outJunctionPointsIntoFFCER + CE_additionP)
-
-            if arcpy.Exists(outJunctionPointsIntoFFCER + CE_additionMP):
-                arcpy.Delete_management(outJunctionPointsIntoFFCER + CE_additionMP)
-
-            if arcpy.Exists(outJunctionPointsIntoFFCER + CE_additionL):
-                arcpy.Delete_management(outJunctionPointsIntoFFCER + CE_additionL)
-
-                # create temporary per line feature classes
-                # temp tower placement points
-            if lc_use_in_memory:
-                arcpy.AddMessage("Using in memory for processing")
-
-                temp_outTowerPlacementPoints = in_memory + "/" + tower_placement_points_name + "_temp"
-
-            else:
-                temp_outTowerPlacementPoints = os.path.join(lc_scratch_ws, tower_placement_points_name + "_temp")
-
-            # first time delete just to be sure
-            if i == 1 and arcpy.Exists(temp_outTowerPlacementPoints):
-                arcpy.Delete_management(temp_outTowerPlacementPoints)
-
-            if arcpy.Exists(temp_outTowerPlacementPoints):
-                arcpy.TruncateTable_management(temp_outTowerPlacementPoints)
-            else:
-                temp_outtowerPlacementPoints_dirname = os.path.dirname(temp_outTowerPlacementPoints)
-                temp_outtowerPlacementPoints_basename = os.path.basename(temp_outTowerPlacementPoints)
-
-                arcpy.CreateFeatureclass_management(temp_outtowerPlacementPoints_dirname,
-                                                    temp_outtowerPlacementPoints_basename,
-                                                    geometry_type, "", has_m, has_z,
-                                                    spatial_reference)
-                # add required fields for towerPlacementPoints
-                arcpy.AddMessage("Adding required fields to tower placement points...")
-
-                start_time = time.clock()
-
-#                for k, v in tower_base_point_field_dict.items():
-#                    common_lib.delete_add_field(temp_outTowerPlacementPoints, k, v)
-
-                listoffields = []
-                for k, v in tower_base_point_field_dict.items():
-                    field = []
-                    field.append(k)
-                    field.append(v)
-                    listoffields.append(field)
-
-                arcpy.management.AddFields(temp_outTowerPlacementPoints, listoffields)
-
-                end_time = time.clock()
-                msg_body = create_msg_body("Time to create fields...", start_time,
-                                           end_time)
-                msg(msg_body)
-
-            # temp tower models: multipatches generated from tower placement points
-            if lc_use_in_memory:
-                arcpy.AddMessage("Using in memory for processing")
-
-                temp_outTowerModels = in_memory + "/" + out_tower_models_name + "_temp"
-            else:
-                temp_outTowerModels = os.path.join(lc_scratch_ws, out_tower_models_name + "_temp")
-
-            if arcpy.Exists(temp_outTowerModels):
-                arcpy.Delete_management(temp_outTowerModels)
-
+        # lc_native_attachment_points: the junction points come from TowerAttachmentPoints, without the ExportPoints RPK.
+        # Shield wires that the rule places on the modelled structure (horizontal lattice, two shield wire vertical lattice)
+        # are not in the generator, those configurations still use the RPK.
+        useNativeAttachmentPoints = False
+        metersPerUnit = 1.0
+        if lc_native_attachment_points:
+            useNativeAttachmentPoints = tap.isSupported(towerConfiguration, [towerConfiguration.structure_type, "Substation"])
+            if not useNativeAttachmentPoints:
+                arcpy.AddWarning("Attachment points of this tower configuration are placed on the tower model, using "
+                                 + os.path.basename(exportPointsRPK) + ".")
+            metersPerUnit = spatial_reference.metersPerUnit
+
+        # lc_instance_tower_models: the ExportModel RPK only runs for tower models that are not in the model cache,
+        # every tower gets a moved and turned copy of its cached model. The cache is kept on disk in lc_model_cache_dir
+        # (default: TowerModelCache next to the scratch workspace), so later runs with the same RPK reuse it.
+        # Off by default: the copies are written as WKB, without the RPK materials and textures, so the towers look
+        # different from the ones the RPK writes.
+        towerModelPlacer = None
+        if lc_instance_tower_models:
+            arcpy.AddWarning("Tower models are instanced copies without the materials and textures of "
+                             + os.path.basename(exportModelsRPK) + ".")
+            if lc_model_cache_dir is None:
+                lc_model_cache_dir = os.path.join(os.path.dirname(lc_scratch_ws), "TowerModelCache")
             if lc_use_in_memory:
-                arcpy.AddMessage("Using in memory for processing")
-
-                temp_outJunctionPointsFromFFCER = in_memory + "/" + out_tower_models_name + "_temp"
-
+                prototypePoints = in_memory + "/" + tower_placement_points_name + "_prototypes"
+                prototypeModels = in_memory + "/" + out_tower_models_name + "_prototypes"
             else:
-                temp_outJunctionPointsFromFFCER = os.path.join(lc_scratch_ws, junction_points_name + "_temp")
-
-            if arcpy.Exists(temp_outJunctionPointsFromFFCER):
-                arcpy.Delete_management(temp_outJunctionPointsFromFFCER)
-
-            # output temp spans
+                prototypePoints = os.path.join(lc_scratch_ws, tower_placement_points_name + "_prototypes")
+                prototypeModels = os.path.join(lc_scratch_ws, out_tower_models_name + "_prototypes")
+            towerModelPlacer = TowerModelPlacer(makeTowerModelCache(exportModelsRPK, spatial_reference, lc_model_cache_dir, lc_sag_quantum),
+                                                exportModelsRPK, outTowerModels, prototypePoints, prototypeModels,
+                                                spatial_reference, tower_base_point_field_dict, lineID=lc_batch_ffcer)
+
+        if lc_batch_ffcer:
+            # lc_batch_ffcer: FeaturesFromCityEngineRules runs once per RPK for all input lines, instead of twice per line.
+            # The tower base points of all lines go into one staging feature class, tagged with LineID. The junction
+            # points get their LineID from joinLineIDToJunctionPoints(), and spans are made per line from the junction
+            # points of its LineID. LineID is removed from the outputs at the end, so they have the fields of the per line path.
             if lc_use_in_memory:
                 arcpy.AddMessage("Using in memory for processing")
-
+                outJunctionPointsIntoFFCER = in_memory + "/" + junction_intoFFCER
+                staging_outTowerPlacementPoints = in_memory + "/" + tower_placement_points_name + "_staging"
                 temp_outSpansIntoScript = in_memory + "/" + spans_name + "_temp"
-
             else:
+                outJunctionPointsIntoFFCER = os.path.join(lc_scratch_ws, junction_intoFFCER)
+                staging_outTowerPlacementPoints = os.path.join(lc_scratch_ws, tower_placement_points_name + "_staging")
                 temp_outSpansIntoScript = os.path.join(lc_scratch_ws, spans_name + "_temp")
 
-            if arcpy.Exists(temp_outSpansIntoScript):
-                arcpy.Delete_management(temp_outSpansIntoScript)
-
-            # multiple lines are now supported...
-            if i >= 0:
+            for fc in [outJunctionPointsIntoFFCER, outJunctionPointsIntoFFCER + CE_additionP, outJunctionPointsIntoFFCER + CE_additionMP,
+                       outJunctionPointsIntoFFCER + CE_additionL, staging_outTowerPlacementPoints]:
+                if arcpy.Exists(fc):
+                    arcpy.Delete_management(fc)
+
+            staging_field_dict = dict(tower_base_point_field_dict)
+            staging_field_dict[line_id_field] = "LONG"
+            createTowerPlacementPointsFC(staging_outTowerPlacementPoints, spatial_reference, staging_field_dict)
+            if useNativeAttachmentPoints:
+                createAttachmentPointsFC(outJunctionPointsFromFFCER, spatial_reference, lineID=True)
+
+            lineIDs = []
+            lineCursor = arcpy.da.SearchCursor(lc_input_features, fieldList)
+            i = 1
+            for row in lineCursor:
                 fieldAccess.setRow(row)
+                vgPolyline = vg.arcpyPolylineToVGPolyline(fieldAccess.getValue("SHAPE@"))
+                if not vgPolyline:
+                    raise MultipartInputNotSupported
 
-                arcpyPolyline = fieldAccess.getValue("SHAPE@")
-
-                # read the line
-                vgPolyline = vg.arcpyPolylineToVGPolyline(arcpyPolyline)
-                if vgPolyline:
-                    # get tower point objects here. Initializing TowerPlacementLine builds the TowerBasePoints.
-                    # from towerConfiguration
-                    pint("Preparing tower base points for feature: " + str(i) + " out of " + str(num_features) + ".")
-
-                    towerPlacementLine = TowerPlacementLine(vgPolyline, towerConfiguration, lc_sag_to_span_ratio, lc_horizontal_tension, lc_testLineWeight, lc_ends)
-                    towerBasePoints = towerPlacementLine.towerBasePoints
-                    # put the tower base points into the scene.
-                    InsertTowerBasePoints(towerBasePoints, towerConfiguration, temp_outTowerPlacementPoints, list(tower_base_point_field_dict.keys()))
-                    arcpy.ddd.FeaturesFromCityEngineRules(temp_outTowerPlacementPoints, exportPointsRPK,
-                                                          outJunctionPointsIntoFFCER, "DROP_EXISTING_FIELDS",
-                                                          "INCLUDE_REPORTS", "FEATURE_PER_LEAF_SHAPE")
-
-                    # TODO built in check when FFCER fails XX Gert
-
-                    # copy _Points fc to input gdb
-                    arcpy.CopyFeatures_management(outJunctionPointsIntoFFCER + CE_additionP, temp_outJunctionPointsFromFFCER)
-
-                    arcpy.ddd.FeaturesFromCityEngineRules(temp_outTowerPlacementPoints, exportModelsRPK,
-                                                          temp_outTowerModels, "INCLUDE_EXISTING_FIELDS",
-                                                          "EXCLUDE_REPORTS", "FEATURE_PER_SHAPE")
-
-                    pint("Making spans for feature: " + str(i) + " out of " + str(num_features) + ".")
+                pint("Preparing tower base points for feature: " + str(i) + " out of " + str(num_features) + ".")
+                towerPlacementLine = TowerPlacementLine(vgPolyline, towerConfiguration, lc_sag_to_span_ratio, lc_horizontal_tension, lc_testLineWeight, lc_ends)
+                InsertTowerBasePoints(towerPlacementLine.towerBasePoints, towerConfiguration, staging_outTowerPlacementPoints,
+                                      list(tower_base_point_field_dict.keys()), i)
+                if useNativeAttachmentPoints:
+                    InsertAttachmentPoints(makeTowerAttachmentPoints(towerPlacementLine.towerBasePoints, towerConfiguration, metersPerUnit),
+                                           outJunctionPointsFromFFCER, i)
+                if towerModelPlacer:
+                    towerModelPlacer.placeTowerModels(towerPlacementLine.towerBasePoints, towerConfiguration, i)
+                lineIDs.append(i)
+                i += 1
+            del lineCursor
+            if towerModelPlacer:
+                towerModelPlacer.close()
+
+            pint("Making junction points and towers for " + str(num_features) + " features.")
+            if not useNativeAttachmentPoints:
+                arcpy.ddd.FeaturesFromCityEngineRules(staging_outTowerPlacementPoints, exportPointsRPK,
+                                                      outJunctionPointsIntoFFCER, "DROP_EXISTING_FIELDS",
+                                                      "INCLUDE_REPORTS", "FEATURE_PER_LEAF_SHAPE")
+                arcpy.CopyFeatures_management(outJunctionPointsIntoFFCER + CE_additionP, outJunctionPointsFromFFCER)
+                # Spans are made per LineID.
+                joinLineIDToJunctionPoints(outJunctionPointsFromFFCER, staging_outTowerPlacementPoints)
+
+            if not towerModelPlacer:
+                arcpy.ddd.FeaturesFromCityEngineRules(staging_outTowerPlacementPoints, exportModelsRPK,
+                                                      outTowerModels, "INCLUDE_EXISTING_FIELDS",
+                                                      "EXCLUDE_REPORTS", "FEATURE_PER_SHAPE")
+            arcpy.CopyFeatures_management(staging_outTowerPlacementPoints, outTowerPlacementPoints)
+
+            junctionPointsLayer = "JunctionPoints_" + line_id_field
+            with utils.FeatureClassAccumulator(outSpansIntoScript) as spansAccumulator:
+                for lineID in lineIDs:
+                    pint("Making spans for feature: " + str(lineID) + " out of " + str(num_features) + ".")
+
+                    arcpy.MakeFeatureLayer_management(outJunctionPointsFromFFCER, junctionPointsLayer,
+                                                      line_id_field + " = " + str(lineID))
 
                     catenary, guide_lines = create_3D_catenary.makeSpans(lc_scratch_ws=lc_scratch_ws,
-                                                        lc_inPoints=temp_outJunctionPointsFromFFCER,
+                                                        lc_inPoints=junctionPointsLayer,
                                                         lc_testLineWeight=lc_testLineWeight,
                                                         lc_sag_to_span_ratio=lc_sag_to_span_ratio,
                                                         lc_horizontal_tension=lc_horizontal_tension,
@@ -472,40 +632,130 @@ def makeTowersAndJunctions(lc_scratch_ws, lc_rule_dir, lc_input_features, lc_tes
                                                         lc_use_in_memory=False,
                                                         lc_cleanup=False,
                                                         lc_caller=TOOLNAME)
+                    arcpy.Delete_management(junctionPointsLayer)
+
+                    spansAccumulator.append(catenary)
+
+            for fc in [outJunctionPointsFromFFCER, outTowerPlacementPoints, outTowerModels]:
+                arcpy.DeleteField_management(fc, line_id_field)
+
+            return outSpansIntoScript, outTowerModels, outJunctionPointsFromFFCER, outTowerPlacementPoints
+
+        # Scratch data for one line, reused for every line: the tower placement points are truncated per line,
+        # and FFCER and makeSpans overwrite their outputs (overwriteOutput is set while the lines are processed).
+        if lc_use_in_memory:
+            arcpy.AddMessage("Using in memory for processing")
+            outJunctionPointsIntoFFCER = in_memory + "/" + junction_intoFFCER
+            temp_outTowerPlacementPoints = in_memory + "/" + tower_placement_points_name + "_temp"
+            temp_outTowerModels = in_memory + "/" + out_tower_models_name + "_temp"
+            temp_outJunctionPoints = in_memory + "/" + junction_points_name + "_temp"
+            temp_outSpansIntoScript = in_memory + "/" + spans_name + "_temp"
+        else:
+            # junctions points needed for makeSpans: FFCER generates 3D points with _Points in name
+            outJunctionPointsIntoFFCER = os.path.join(lc_scratch_ws, junction_intoFFCER)
+            temp_outTowerPlacementPoints = os.path.join(lc_scratch_ws, tower_placement_points_name + "_temp")
+            temp_outTowerModels = os.path.join(lc_scratch_ws, out_tower_models_name + "_temp")
+            temp_outJunctionPoints = os.path.join(lc_scratch_ws, junction_points_name + "_temp")
+            temp_outSpansIntoScript = os.path.join(lc_scratch_ws, spans_name + "_temp")
+
+        for fc in [outJunctionPointsIntoFFCER, outJunctionPointsIntoFFCER + CE_additionP, outJunctionPointsIntoFFCER + CE_additionMP,
+                   outJunctionPointsIntoFFCER + CE_additionL, temp_outTowerPlacementPoints, temp_outTowerModels, temp_outJunctionPoints]:
+            if arcpy.Exists(fc):
+                arcpy.Delete_management(fc)
+
+        createTowerPlacementPointsFC(temp_outTowerPlacementPoints, spatial_reference, tower_base_point_field_dict)
+        if useNativeAttachmentPoints:
+            createAttachmentPointsFC(temp_outJunctionPoints, spatial_reference)
+            junctionPoints = temp_outJunctionPoints
+        else:
+            junctionPoints = outJunctionPointsIntoFFCER + CE_additionP
+
+        # The four outputs are created once, from the first line's results, and each line is streamed into them.
+        spansAccumulator = utils.FeatureClassAccumulator(outSpansIntoScript)
+        towerModelsAccumulator = utils.FeatureClassAccumulator(outTowerModels)
+        junctionPointsAccumulator = utils.FeatureClassAccumulator(outJunctionPointsFromFFCER)
+        towerPlacementPointsAccumulator = utils.FeatureClassAccumulator(outTowerPlacementPoints)
+
+        overwriteOutput = arcpy.env.overwriteOutput
+        arcpy.env.overwriteOutput = True
+        try:
+            lineCursor = arcpy.da.SearchCursor(lc_input_features, fieldList)
+            i = 1
+
+            for row in lineCursor:
+                fieldAccess.setRow(row)
 
-                    # append features to output feature classes
-
-                    # catenary, outTowerModels, outJunctionPointsFromFFCER, outTowerPlacementPoints
-                    schemaType = "NO_TEST"
-                    if arcpy.Exists(outSpansIntoScript):
-                        arcpy.Append_management(catenary, outSpansIntoScript, schemaType)
-                    else:
-                        arcpy.Copy_management(catenary, outSpansIntoScript)
-
-                    pint("Made spans for feature: " + str(i) + " out of " + str(num_features) + ".")
-
-                    if arcpy.Exists(outTowerModels):
-                        arcpy.Append_management(temp_outTowerModels, outTowerModels, schemaType)
-                    else:
-                        arcpy.Copy_management(temp_outTowerModels, outTowerModels)
+                arcpyPolyline = fieldAccess.getValue("SHAPE@")
 
-                    pint("Made towers for feature: " + str(i) + " out of " + str(num_features) + ".")
+                # read the line
+                vgPolyline = vg.arcpyPolylineToVGPolyline(arcpyPolyline)
+                if not vgPolyline:
+                    raise MultipartInputNotSupported
 
-                    if arcpy.Exists(outJunctionPointsFromFFCER):
-                        arcpy.Append_management(temp_outJunctionPointsFromFFCER, outJunctionPointsFromFFCER, schemaType)
-                    else:
-                        arcpy.Copy_management(temp_outJunctionPointsFromFFCER, outJunctionPointsFromFFCER)
+                # get tower point objects here. Initializing TowerPlacementLine builds the TowerBasePoints.
+                # from towerConfiguration
+                pint("Preparing tower base points for feature: " + str(i) + " out of " + str(num_features) + ".")
+
+                if i > 1:
+                    arcpy.TruncateTable_management(temp_outTowerPlacementPoints)
+                    if useNativeAttachmentPoints:
+                        arcpy.TruncateTable_management(temp_outJunctionPoints)
+
+                towerPlacementLine = TowerPlacementLine(vgPolyline, towerConfiguration, lc_sag_to_span_ratio, lc_horizontal_tension, lc_testLineWeight, lc_ends)
+                towerBasePoints = towerPlacementLine.towerBasePoints
+                # put the tower base points into the scene.
+                InsertTowerBasePoints(towerBasePoints, towerConfiguration, temp_outTowerPlacementPoints, list(tower_base_point_field_dict.keys()))
+                if useNativeAttachmentPoints:
+                    InsertAttachmentPoints(makeTowerAttachmentPoints(towerBasePoints, towerConfiguration, metersPerUnit), temp_outJunctionPoints)
+                else:
+                    arcpy.ddd.FeaturesFromCityEngineRules(temp_outTowerPlacementPoints, exportPointsRPK,
+                                                          outJunctionPointsIntoFFCER, "DROP_EXISTING_FIELDS",
+                                                          "INCLUDE_REPORTS", "FEATURE_PER_LEAF_SHAPE")
 
-                    pint("Made junctions for feature: " + str(i) + " out of " + str(num_features) + ".")
+                # TODO built in check when FFCER fails XX Gert
 
-                    if arcpy.Exists(outTowerPlacementPoints):
-                        arcpy.Append_management(temp_outTowerPlacementPoints, outTowerPlacementPoints, schemaType)
-                    else:
-                        arcpy.Copy_management(temp_outTowerPlacementPoints, outTowerPlacementPoints)
+                if towerModelPlacer:
+                    towerModelPlacer.placeTowerModels(towerBasePoints, towerConfiguration)
                 else:
-                    raise MultipartInputNotSupported
+                    arcpy.ddd.FeaturesFromCityEngineRules(temp_outTowerPlacementPoints, exportModelsRPK,
+                                                          temp_outTowerModels, "INCLUDE_EXISTING_FIELDS",
+                                                          "EXCLUDE_REPORTS", "FEATURE_PER_SHAPE")
 
-            i += 1
+                pint("Making spans for feature: " + str(i) + " out of " + str(num_features) + ".")
+
+                catenary, guide_lines = create_3D_catenary.makeSpans(lc_scratch_ws=lc_scratch_ws,
+                                                    lc_inPoints=junctionPoints,
+                                                    lc_testLineWeight=lc_testLineWeight,
+                                                    lc_sag_to_span_ratio=lc_sag_to_span_ratio,
+                                                    lc_horizontal_tension=lc_horizontal_tension,
+                                                    lc_output_features=temp_outSpansIntoScript,
+                                                    lc_debug=lc_debug,
+                                                    lc_use_in_memory=False,
+                                                    lc_cleanup=False,
+                                                    lc_caller=TOOLNAME)
+
+                # append features to output feature classes
+                spansAccumulator.append(catenary)
+                pint("Made spans for feature: " + str(i) + " out of " + str(num_features) + ".")
+
+                if not towerModelPlacer:
+                    towerModelsAccumulator.append(temp_outTowerModels)
+                pint("Made towers for feature: " + str(i) + " out of " + str(num_features) + ".")
+
+                junctionPointsAccumulator.append(junctionPoints)
+                pint("Made junctions for feature: " + str(i) + " out of " + str(num_features) + ".")
+
+                towerPlacementPointsAccumulator.append(temp_outTowerPlacementPoints)
+
+                i += 1
+        finally:
+            arcpy.env.overwriteOutput = overwriteOutput
+            spansAccumulator.close()
+            towerModelsAccumulator.close()
+            if towerModelPlacer:
+                towerModelPlacer.close()
+            junctionPointsAccumulator.close()
+            towerPlacementPointsAccumulator.close()
 
         return outSpansIntoScript, outTowerModels, outJunctionPointsFromFFCER, outTowerPlacementPoints
 
@@ -513,6 +763,10 @@ def makeTowersAndJunctions(lc_scratch_ws, lc_rule_dir, lc_input_features, lc_tes
         print("Multipart features are not supported. Exiting...")
         arcpy.AddError("Multipart features are not supported. Exiting...")
 
+    except JunctionPointsNotMatched:
+        print("Can't match the junction points of the rule package to their tower base points by Tower. Exiting...")
+        arcpy.AddError("Can't match the junction points of the rule package to their tower base points by Tower. Exiting...")
+
     except arcpy.ExecuteError:
         # Get the tool error messages
         msgs = arcpy.GetMessages(2)
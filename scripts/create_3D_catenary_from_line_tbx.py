@@ -411,6 +411,9 @@ def main():
                                     arcpy.AddMessage("Creating catenaries with a sagToSpan ratio of: " + str(sag_to_span_ratio)
                                                      + " and " + str(line_weight) + " pound weight per unit length.")
 
+                                # Not tool parameters, Python only: lc_batch_ffcer, lc_native_attachment_points and
+                                # lc_instance_tower_models. lc_instance_tower_models stays off here, its tower models
+                                # have no RPK materials or textures, so the output looks different.
                                 catenary, TowerModels, JunctionPoints, TowerPlacementPoints = create_3D_catenary_from_line.makeTowersAndJunctions(
                                                                                                                 lc_scratch_ws=scratch_ws,
                                                                                                                 lc_rule_dir=rule_directory,
@@ -153,6 +153,12 @@ def main():
 
         desc = arcpy.Describe(input_source)
 
+        # These makeSpans options are not tool parameters, they can only be set from Python:
+        # lc_report_only (span attribute table, no geometry), lc_exact (exact inclined catenaries),
+        # lc_template_tolerance (shared catenary template), lc_workers (process pool), lc_stream (per line spans),
+        # lc_load_cases (list of SpanArrays.LoadCase, one output or report column set per case),
+        # lc_ruling_span and lc_dead_end_towers (one tension per tension section, split at the listed towers),
+        # lc_line_guides (line guides of an earlier run, for spans without a sag ratio and a tension).
         catenary, guide_lines = create_3D_catenary.makeSpans(lc_scratch_ws=scratch_ws,
                                                 lc_inPoints=input_source_copy,
                                                 lc_testLineWeight=float(line_weight),
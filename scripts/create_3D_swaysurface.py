@@ -6,6 +6,7 @@ import os
 import arcpy
 import sys
 import math
+import collections
 import importlib
 
 import ToolsUtilities as utils
@@ -14,6 +15,12 @@ if 'ToolsUtilities' in sys.modules:
 import VectorGeometry as vg
 if 'VectorGeometry' in sys.modules:
     importlib.reload(vg)
+import GeometryEncoding as ge
+if 'GeometryEncoding' in sys.modules:
+    importlib.reload(ge)
+import SpanArrays as sa
+if 'SpanArrays' in sys.modules:
+    importlib.reload(sa)
 import create_3D_catenary
 if 'create_3D_catenary' in sys.modules:
     importlib.reload(create_3D_catenary)
@@ -49,51 +56,7 @@ def p(label, value):
 ###############################################################################################
 ###############################################################################################
 
-def makeSurfacePanels(span):
-    surfacePanels = []
-    swaysLines = span.swayLines
-    swayLineCount = len(swaysLines)
-    for swayIndex in range(0, swayLineCount - 1):
-        thisSway = swaysLines[swayIndex]
-        nextSway = swaysLines[swayIndex + 1]
-        thisSwayNodes = thisSway.nodes
-        nextSwayNodes = nextSway.nodes
-
-        nodeCount = len(thisSwayNodes)
-        lastNextNodeIndex = nodeCount - 2
-        for nodeIndex in range(0, nodeCount - 1):
-            thisSway_thisNode = thisSwayNodes[nodeIndex]
-            thisSway_nextNode = thisSwayNodes[nodeIndex + 1]
-            nextSway_thisNode = nextSwayNodes[nodeIndex]
-            nextSway_nextNode = nextSwayNodes[nodeIndex + 1]
-            if nodeIndex == 0:
-                n0 = thisSway_thisNode
-                # no n1 as this is triangle.
-                n2 = nextSway_nextNode
-                n3 = thisSway_nextNode
-                panel = vg.Polygon([n0, n2, n3])
-            elif nodeIndex == lastNextNodeIndex:
-                n0 = thisSway_thisNode
-                n1 = nextSway_thisNode
-                n2 = nextSway_nextNode
-                # no n3 as this is triangle.
-                panel = vg.Polygon([n0, n1, n2])
-            else:
-                n0 = thisSway_thisNode
-                n1 = nextSway_thisNode
-                n2 = nextSway_nextNode
-                n3 = thisSway_nextNode
-                panel = vg.Polygon([n0, n1, n2, n3])
-
-            surfacePanels.append(panel)
-        # END FOR nodeIndex
-    # END FOR swayIndex
-    span.surfacePanels = surfacePanels
-    pass
-
-
-def makeSways(span, max_angle):
-
+def getSwayAngles(max_angle):
     total_range = 2*max_angle
     angles = []
 
@@ -110,116 +73,70 @@ def makeSways(span, max_angle):
         angles.append(i)
 
     angles.append(max_angle)
+    return angles
+
+
+def getSpanVertices(span):
+    # (V, 3) vertex array of the span polyline.
+    if span.polylineVertices is not None:
+        return span.polylineVertices
+    return sa.asXYZArray(span.polyline.nodes)
+
+
+def makeSways(span, max_angle):
+    angles = getSwayAngles(max_angle)
 
     # Span was constructed in new 2D XZ plane, and we'll keep that convention here.
-    # Some of this is redundant from makeSpan, but best option is make generic function in VG library
-    # to rotate points/geometry around arbitrary 3D axis.
-    spanVector3D = vg.getVectorFromTwoPoints(span.fromPoint, span.toPoint)
-    spanVector2DNoZ = vg.Vector(spanVector3D.x, spanVector3D.y,0)
-    spanLength2D = vg.magnitude(spanVector2DNoZ)
-    spanVector3DNormalToSpanPlane = vg.crossProduct(spanVector3D, vg.Vector(0,0,1))
-    spanVector3DNormalInSpanPlane = vg.crossProduct(spanVector3D, spanVector3DNormalToSpanPlane)
-    attachmentPointHeightDifference = span.toPoint.z - span.fromPoint.z
-
-    # Still using XZ for span plane.
-    spanVector2DNoY = vg.Vector(spanLength2D, 0, attachmentPointHeightDifference)
-
-    # Build point vectors.
-    pointVectors = []
-    spanPolyline = span.polyline
-    points = spanPolyline.nodes
-    firstPoint = points[0]
-    for pointIndex in range(0, len(points)):
-        thisPoint = points[pointIndex]
-        vectPoint3D = vg.getVectorFromTwoPoints(firstPoint,thisPoint)
-        vectPoint2DNoZ = vg.Vector(vectPoint3D.x, vectPoint3D.y,0)
-        vectZ = vg.Vector(0,0,vectPoint3D.z)
-        vectPoint2DMag = vg.magnitude(vectPoint2DNoZ)
-        xMag = vectPoint2DMag
-        vectX = vg.Vector(xMag,0,0)
-        thisVect = vg.addVectors(vectX, vectZ)
-        pointVectors.append(thisVect)
-    pointVectorsInSpanPlane = pointVectors
-
-    ################
-    swayLines = []
-    for angle in angles:
-        # These vectors are in 2D XZ plane.
-        swayPoints = []
-        lastPointIndex = len(pointVectorsInSpanPlane) - 1
-        for pointIndex in range(0, lastPointIndex + 1):
-            pointVector = pointVectorsInSpanPlane[pointIndex]
-            if pointIndex == 0:
-                thisPoint = span.fromPoint
-            elif pointIndex == lastPointIndex:
-                thisPoint = span.toPoint
-            else:
-                pointVectorLength = vg.magnitude(pointVector)
-                h = pointVectorLength
-                t = vg.scalarProjection(pointVector, spanVector2DNoY)
-                r = math.sqrt(pow(h,2) - pow(t,2))
-                alpha = 90 - angle
-                alphaRadians = math.radians(alpha)
-                u = r * math.cos(alphaRadians)
-                v = r * math.sin(alphaRadians)
-
-                tVector = vg.setVectorMagnitude(spanVector3D, t)
-                uVector = vg.setVectorMagnitude(spanVector3DNormalToSpanPlane, u)
-                vVector = vg.setVectorMagnitude(spanVector3DNormalInSpanPlane, v)
-                uvVector = vg.addVectors(uVector,vVector)
-                tuvVector = vg.addVectors(tVector, uvVector)
-                thisPoint = vg.copyNode(span.fromPoint, tuvVector)
-            swayPoints.append(thisPoint)
-        # END FOR pointIndex.
-        thisSwayLine = vg.Polyline(swayPoints)
-        swayLines.append(thisSwayLine)
-    # END FOR angles
-    span.swayLines = swayLines
-    ################
+    # The whole (angles, vertices, 3) sway grid is built in one broadcast from the span frame vectors (SpanArrays.swayGrid).
+    # Each row of the grid is one sway line; they are written from the grid, without VG nodes.
+    span.swayGrid = sa.swayGrid(sa.asXYZArray([span.fromPoint]), sa.asXYZArray([span.toPoint]), getSpanVertices(span), angles)[0]
+    pass
+
+
+def makeSwayMesh(span):
+    # One indexed triangle mesh for the whole sway surface of the span, instead of a polygon per panel.
+    span.swayMesh = sa.swayMesh(span.swayGrid)
     pass
 
 
 ############################################################################################### Chris ends...................
 
-def doInsert_SwayLinesSurfaces(lc_includedSwayLinesFC, includedSwaySurfacesFC,  lc_listOfSpans):
+def getSwayFieldList():
+    return ['SHAPE@WKB', 'FromTower', 'ToTower', 'LineNumber']
+
+
+def makeSwayWriter(lc_includedSwayLinesFC, lc_flush_size=1000):
+    return utils.InsertCursorWriter(lc_includedSwayLinesFC, getSwayFieldList(), lc_flush_size)
+
+
+def doInsert_SwayLines(lc_includedSwayLinesFC, lc_listOfSpans, lc_line_writer=None):
     try:
 
-        # Delete and Insert features into 4 tables.
-        fieldListBothLinesAndPoints = ['SHAPE@', 'FromTower', 'ToTower', 'LineNumber']
-        deleteFieldList = ["FromTower", "ToTower", "LineNumber"]
+        # Insert a polyline per sway line, written as WKB straight from the sway grid rows.
+        closeWriter = False
+        if lc_line_writer is None:
+            lc_line_writer = makeSwayWriter(lc_includedSwayLinesFC)
+            closeWriter = True
 
         newRow = utils.NewRow()
-        newRow.setFieldNames(fieldListBothLinesAndPoints)
+        newRow.setFieldNames(getSwayFieldList())
 
         for span in lc_listOfSpans:
-            fromTower = span.fromTower
-            toTower = span.toTower
-            lineNumber = span.lineNumber
-            deleteWhereClause = "FromTower = " + str(fromTower) + " and ToTower = " + \
-                                str(toTower) + " and LineNumber = " + str(lineNumber)
             # All new rows have these fields/values.
-            newRow.set('FromTower', fromTower)
-            newRow.set('ToTower', toTower)
-            newRow.set('LineNumber', lineNumber)
+            newRow.set('FromTower', span.fromTower)
+            newRow.set('ToTower', span.toTower)
+            newRow.set('LineNumber', span.lineNumber)
 
             ####################################
 
-            # Insert new sway lines.
-            cursorInsertLine = arcpy.da.InsertCursor(lc_includedSwayLinesFC, newRow.getFieldNamesList())
-            for swayLine in span.swayLines:
-                lineShape = vg.funPolylineToArcpyPolyline([swayLine])
-                newRow.set('SHAPE@', lineShape)
-                cursorInsertLine.insertRow(newRow.getFieldValuesList())
-
-            del cursorInsertLine
+            # Insert new sway lines: the (vertices, 3) rows of the sway grid, or VG polylines set on span.swayLines.
+            swayLines = span.swayGrid if span.swayGrid is not None else span.swayLines
+            for swayLine in swayLines:
+                newRow.set('SHAPE@WKB', ge.polylineToWKB(swayLine))
+                lc_line_writer.insertNewRow(newRow)
 
-            # Insert new sway surface panels.
-            cursorInsertPolygon = arcpy.da.InsertCursor(includedSwaySurfacesFC, newRow.getFieldNamesList())
-            for panel in span.surfacePanels:
-                polygonShape = vg.funPolygonToArcpyPolygon([panel])
-                newRow.set('SHAPE@', polygonShape)
-                cursorInsertPolygon.insertRow(newRow.getFieldValuesList())
-            del cursorInsertPolygon
+        if closeWriter:
+            lc_line_writer.close()
 
     except arcpy.ExecuteError:
         # Get the tool error messages
@@ -231,11 +148,83 @@ def doInsert_SwayLinesSurfaces(lc_includedSwayLinesFC, includedSwaySurfacesFC,
     pass
 
 
+def addSwaySurface(swaySurfacesPerLine, span):
+    # Keeps the sway mesh of the span with the other spans of its line: LineNumber -> [(FromTower, ToTower, mesh)].
+    if span.swayMesh is None:
+        makeSwayMesh(span)
+    swaySurfacesPerLine.setdefault(span.lineNumber, []).append((span.fromTower, span.toTower, span.swayMesh))
+
+
+def getMultipatchFromWKB(wkb, spatial_reference):
+    # The geometry arcpy makes from a mesh WKB, or None when that is not a multipatch.
+    shape = arcpy.FromWKB(wkb, spatial_reference)
+    if shape is None or shape.type != "multipatch":
+        return None
+    return shape
+
+
+def doInsert_SwaySurfaces(lc_scratch_ws, includedSwaySurfacesFC, swaySurfacesPerLine, spatial_reference, lc_flush_size=1000):
+    # One multipatch per LineNumber, like the LineNumber grouping of Layer3DToFeatureClass: the sway meshes of all spans
+    # of a line are merged, and FromTower and ToTower hold the first and last tower of the line.
+    # The merged mesh goes through arcpy.FromWKB, and is only written as a multipatch when FromWKB returns one;
+    # otherwise the triangles are written as 3D polygons and grouped with Layer3DToFeatureClass.
+    lineNumbers = list(swaySurfacesPerLine.keys())
+    lineMeshes = [sa.mergeMeshes([mesh for fromTower, toTower, mesh in swaySurfacesPerLine[lineNumber]]) for lineNumber in lineNumbers]
+    if len(lineMeshes) == 0:
+        return includedSwaySurfacesFC
+
+    firstShape = getMultipatchFromWKB(ge.meshToWKB(*lineMeshes[0]), spatial_reference)
+    if firstShape is None:
+        arcpy.AddMessage("Sway surfaces are grouped per line with Layer3DToFeatureClass.")
+        return doInsert_SwaySurfacePolygons(lc_scratch_ws, includedSwaySurfacesFC, swaySurfacesPerLine, spatial_reference, lc_flush_size)
+
+    fieldList = ['SHAPE@', 'FromTower', 'ToTower', 'LineNumber']
+    with utils.InsertCursorWriter(includedSwaySurfacesFC, fieldList, lc_flush_size) as surfaceWriter:
+        for lineIndex in range(0, len(lineNumbers)):
+            lineNumber = lineNumbers[lineIndex]
+            spanSurfaces = swaySurfacesPerLine[lineNumber]
+            if lineIndex == 0:
+                shape = firstShape
+            else:
+                shape = arcpy.FromWKB(ge.meshToWKB(*lineMeshes[lineIndex]), spatial_reference)
+            surfaceWriter.insertRow([shape, min(fromTower for fromTower, toTower, mesh in spanSurfaces),
+                                     max(toTower for fromTower, toTower, mesh in spanSurfaces), lineNumber])
+    return includedSwaySurfacesFC
+
+
+def doInsert_SwaySurfacePolygons(lc_scratch_ws, includedSwaySurfacesFC, swaySurfacesPerLine, spatial_reference, lc_flush_size=1000):
+    # Sway surface triangles as 3D polygons in the scratch workspace, then one multipatch per LineNumber with
+    # Layer3DToFeatureClass (the way the sway surfaces were always grouped).
+    swaySurfacePolygonsFC = os.path.join(lc_scratch_ws, "temp_sway_surfaces")
+    if arcpy.Exists(swaySurfacePolygonsFC):
+        arcpy.Delete_management(swaySurfacePolygonsFC)
+
+    arcpy.CreateFeatureclass_management(lc_scratch_ws, os.path.basename(swaySurfacePolygonsFC), "POLYGON", "", "DISABLED", "ENABLED",
+                                        spatial_reference)
+    common_lib.delete_add_field(swaySurfacePolygonsFC, "FromTower", "LONG")
+    common_lib.delete_add_field(swaySurfacePolygonsFC, "ToTower", "LONG")
+    common_lib.delete_add_field(swaySurfacePolygonsFC, "LineNumber", "LONG")
+
+    with utils.InsertCursorWriter(swaySurfacePolygonsFC, getSwayFieldList(), lc_flush_size) as polygonWriter:
+        for lineNumber, spanSurfaces in swaySurfacesPerLine.items():
+            for fromTower, toTower, (vertices, faces) in spanSurfaces:
+                for triangle in ge.meshTrianglesToWKB(vertices, faces):
+                    polygonWriter.insertRow([triangle, fromTower, toTower, lineNumber])
+
+    swaySurfacePolygonsLayer = common_lib.get_name_from_feature_class(swaySurfacePolygonsFC)
+    arcpy.MakeFeatureLayer_management(swaySurfacePolygonsFC, swaySurfacePolygonsLayer)
+
+    if arcpy.Exists(includedSwaySurfacesFC):
+        arcpy.Delete_management(includedSwaySurfacesFC)
+
+    arcpy.Layer3DToFeatureClass_3d(swaySurfacePolygonsLayer, includedSwaySurfacesFC, "LineNumber")
+    return includedSwaySurfacesFC
+
+
 def makeSwayLinesAndSurfaces(lc_scratch_ws, lc_catenary, lc_angle, lc_output_features, lc_debug, lc_use_in_memory):
     try:
         includedSwayLinesFC = None
         includedSwaySurfacesFC = None
-        sr = arcpy.Describe(lc_catenary).spatialReference
 
         geometry_type = "POLYLINE"
         has_m = "DISABLED"
@@ -268,9 +257,10 @@ def makeSwayLinesAndSurfaces(lc_scratch_ws, lc_catenary, lc_angle, lc_output_fea
         common_lib.delete_add_field(includedSwayLinesFC, line_number_field, "LONG")
         common_lib.delete_add_field(includedSwayLinesFC, count_field, "LONG")
 
-        geometry_type = "POLYGON"
+        # Sway surfaces are written straight to a multipatch feature class, one feature per line (see doInsert_SwaySurfaces).
+        geometry_type = "MULTIPATCH"
 
-        includedSwaySurfacesFC= os.path.join(lc_scratch_ws, "temp_sway_surfaces")
+        includedSwaySurfacesFC = lc_output_features + "_3D"
 
         includedSwaySurfacesFC_dirname = os.path.dirname(includedSwaySurfacesFC)
         includedSwaySurfacesFC_basename = os.path.basename(includedSwaySurfacesFC)
@@ -288,44 +278,41 @@ def makeSwayLinesAndSurfaces(lc_scratch_ws, lc_catenary, lc_angle, lc_output_fea
 
         arcpy.AddMessage("Creating sway surfaces...")
 
+        lineWriter = makeSwayWriter(includedSwayLinesFC)
+        # LineNumber -> sway meshes of the spans of that line.
+        swaySurfacesPerLine = collections.OrderedDict()
+
         # cycle through catenaries
-        with arcpy.da.SearchCursor(lc_catenary, ['SHAPE@', 'FromTower', 'ToTower', 'LineNumber']) as cursor:
+        # The vertex array is read once per feature (SHAPE@WKB); the endpoints are its first and last vertex.
+        with arcpy.da.SearchCursor(lc_catenary, ['SHAPE@WKB', 'FromTower', 'ToTower', 'LineNumber']) as cursor:
             for row in cursor:
-                polyline = row[0]
                 fromPoint = None
                 toPoint = None
 
-                # get start and end points from line, we assume 1 part
-                for part in polyline:
-                    for pnt in part:
-                        if pnt:
-                            ptGeom = arcpy.PointGeometry(pnt, sr)
-                            line_length = polyline.length
-                            chainage = polyline.measureOnLine(ptGeom)
-
-                            if chainage == 0:  # start point
-                                point = vg.Point(pnt.X, pnt.Y, pnt.Z)
-                                fromPoint = create_3D_catenary.AttachmentPoint(point, row[3], row[1])
-
-                            elif chainage - line_length == 0:  # end point
-                                point = vg.Point(pnt.X, pnt.Y, pnt.Z)
-                                toPoint = create_3D_catenary.AttachmentPoint(point, row[3], row[2])
-                            else:  # in between points
-                                continue
+                # we assume 1 part
+                parts = ge.polylineFromWKB(row[0]) if row[0] else []
+                if len(parts) > 0 and len(parts[0]) > 1:
+                    vertices = parts[0]
+                    fromPoint = create_3D_catenary.AttachmentPoint(vg.Point(*vertices[0]), row[3], row[1])
+                    toPoint = create_3D_catenary.AttachmentPoint(vg.Point(*vertices[-1]), row[3], row[2])
+
                 # fill span object
                 if fromPoint and toPoint:
                     span = create_3D_catenary.Span(fromPoint, toPoint)
-                    catenary_line = vg.arcpyPolylineToVGPolyline(polyline)
-                    span.polyline = catenary_line
+                    span.polylineVertices = vertices
 
                     makeSways(span, lc_angle)
-                    makeSurfacePanels(span)
 
-                    doInsert_SwayLinesSurfaces(includedSwayLinesFC, includedSwaySurfacesFC, [span])
+                    doInsert_SwayLines(includedSwayLinesFC, [span], lineWriter)
+                    addSwaySurface(swaySurfacesPerLine, span)
 
                 else:
                     arcpy.AddError("Error finding start and end points for catenary")
 
+        lineWriter.close()
+
+        includedSwaySurfacesFC = doInsert_SwaySurfaces(lc_scratch_ws, includedSwaySurfacesFC, swaySurfacesPerLine, spatial_reference)
+
         if lc_use_in_memory:
             arcpy.Delete_management("in_memory")
 
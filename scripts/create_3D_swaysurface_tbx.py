@@ -180,15 +180,8 @@ def main():
                     else:
                         swaysurfaceSymbologyLayer = layer_directory + "\\swaysurface3Dmeter_mp.lyrx"
 
-                    sway_layer = common_lib.get_name_from_feature_class(sway_surfaces)
-                    arcpy.MakeFeatureLayer_management(sway_surfaces, sway_layer)
-
-                    sway_surfaces_mp = output_features + "_3D"
-
-                    if arcpy.Exists(sway_surfaces_mp):
-                        arcpy.Delete_management(sway_surfaces_mp)
-
-                    arcpy.Layer3DToFeatureClass_3d(sway_layer, sway_surfaces_mp, "LineNumber")
+                    # sway surfaces are already multipatches, one per LineNumber.
+                    sway_surfaces_mp = sway_surfaces
 
                     output_layer3 = common_lib.get_name_from_feature_class(sway_surfaces_mp)
                     arcpy.MakeFeatureLayer_management(sway_surfaces_mp, output_layer3)
@@ -0,0 +1,5 @@
+# The scripts are not a package; SpanArrays and GeometryEncoding import without arcpy from the scripts folder.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
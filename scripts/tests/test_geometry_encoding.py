@@ -0,0 +1,106 @@
+# Round trips for the WKB and Esri JSON encoders in GeometryEncoding.
+import json
+import struct
+
+import numpy as np
+
+import GeometryEncoding as ge
+
+
+class Node(object):
+    # Stands in for a VectorGeometry node.
+    def __init__(self, x, y, z):
+        self.x = x
+        self.y = y
+        self.z = z
+
+
+class Polyline(object):
+    # Stands in for a VectorGeometry Polyline or Polygon.
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def getNodes(self):
+        return self.nodes
+
+
+line = np.array([[0.0, 0.0, 10.0], [50.0, 25.0, 8.5], [100.0, 50.0, 12.25]])
+otherLine = np.array([[100.0, 50.0, 12.25], [200.0, 60.0, 11.0]])
+triangle = np.array([[0.0, 0.0, 0.0], [10.0, 0.0, 1.0], [10.0, 10.0, 2.0]])
+
+
+def testPolylineWKBRoundTrip():
+    wkb = ge.polylineToWKB(line)
+    assert struct.unpack_from("<BI", wkb) == (ge.wkbNDR, ge.wkbLineStringZ)
+    parts = ge.polylineFromWKB(wkb)
+    assert len(parts) == 1
+    np.testing.assert_array_equal(parts[0], line)
+
+
+def testMultipartPolylineWKBRoundTrip():
+    wkb = ge.polylineToWKB([line, None, otherLine])
+    assert struct.unpack_from("<BII", wkb) == (ge.wkbNDR, ge.wkbMultiLineStringZ, 2)
+    parts = ge.polylineFromWKB(wkb)
+    np.testing.assert_array_equal(parts[0], line)
+    np.testing.assert_array_equal(parts[1], otherLine)
+
+
+def testVectorGeometryShapesEncodeLikeArrays():
+    polyline = Polyline([Node(*vertex) for vertex in line.tolist()])
+    assert ge.polylineToWKB(polyline) == ge.polylineToWKB(line)
+    assert ge.polylineToEsriJSON([polyline], 2229) == ge.polylineToEsriJSON(line, 2229)
+
+
+def testPolylineFromWKBReadsOtherDimensions():
+    # Big endian 2D LineString, and a little endian extended (flag bit) LineString ZM.
+    wkb2D = struct.pack(">BII", 0, 2, 2) + np.array([[1.0, 2.0], [3.0, 4.0]]).astype(">f8").tobytes()
+    np.testing.assert_array_equal(ge.polylineFromWKB(wkb2D)[0], [[1.0, 2.0, 0.0], [3.0, 4.0, 0.0]])
+    wkbZM = struct.pack("<BII", 1, 2 | 0x80000000 | 0x40000000, 2) + np.array([[1.0, 2.0, 3.0, 9.0], [4.0, 5.0, 6.0, 9.0]]).tobytes()
+    np.testing.assert_array_equal(ge.polylineFromWKB(wkbZM)[0], [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+
+
+def testPolygonWKBClosesRings():
+    template = ge.WKBTemplate(ge.polygonToWKB(triangle))
+    assert struct.unpack_from("<BII", template.wkb) == (ge.wkbNDR, ge.wkbPolygonZ, 1)
+    np.testing.assert_array_equal(template.xyz, np.concatenate((triangle, triangle[0:1])))
+
+    template = ge.WKBTemplate(ge.polygonToWKB([triangle, triangle + 100.0]))
+    assert struct.unpack_from("<BII", template.wkb) == (ge.wkbNDR, ge.wkbMultiPolygonZ, 2)
+    assert len(template.xyz) == 8
+
+
+def testEsriJSONRoundTrip():
+    shape = json.loads(ge.polylineToEsriJSON([line, otherLine], wkid=3857))
+    assert shape["hasZ"] and shape["spatialReference"] == {"wkid": 3857}
+    np.testing.assert_array_equal(shape["paths"][0], line)
+    np.testing.assert_array_equal(shape["paths"][1], otherLine)
+
+    shape = json.loads(ge.encodePolygon(triangle, ge.JSON))
+    np.testing.assert_array_equal(shape["rings"][0], np.concatenate((triangle, triangle[0:1])))
+    assert "spatialReference" not in shape
+
+
+def testMeshWKBHoldsEveryTriangle():
+    vertices = np.array([[0.0, 0.0, 0.0], [10.0, 0.0, 0.0], [10.0, 10.0, 5.0], [0.0, 10.0, 5.0]])
+    faces = np.array([[0, 1, 2], [0, 2, 3]])
+    wkb = ge.meshToWKB(vertices, faces)
+    assert struct.unpack_from("<BII", wkb) == (ge.wkbNDR, ge.wkbMultiPolygonZ, 2)
+    expected = vertices[faces[:, [0, 1, 2, 0]]].reshape(-1, 3)
+    np.testing.assert_array_equal(ge.WKBTemplate(wkb).xyz, expected)
+
+    triangleWKBs = ge.meshTrianglesToWKB(vertices, faces)
+    assert len(triangleWKBs) == 2
+    for triangleWKB, face in zip(triangleWKBs, faces):
+        assert struct.unpack_from("<BII", triangleWKB) == (ge.wkbNDR, ge.wkbPolygonZ, 1)
+        np.testing.assert_array_equal(ge.WKBTemplate(triangleWKB).xyz, vertices[face[[0, 1, 2, 0]]])
+
+
+def testWKBTemplateMovesAndTurnsClockwise():
+    template = ge.WKBTemplate(ge.polylineToWKB(np.array([[1.0, 0.0, 0.0], [1.0, 2.0, 3.0]])))
+    moved = ge.polylineFromWKB(template.moved((0.0, 0.0, 0.0), (100.0, 200.0, 10.0)))[0]
+    np.testing.assert_allclose(moved, [[101.0, 200.0, 10.0], [101.0, 202.0, 13.0]])
+    # Turned 90 degrees clockwise seen from above: east becomes south, north becomes east.
+    turned = ge.polylineFromWKB(template.moved((0.0, 0.0, 0.0), (0.0, 0.0, 0.0), 90))[0]
+    np.testing.assert_allclose(turned, [[0.0, -1.0, 0.0], [2.0, -1.0, 3.0]], atol=1e-12)
+    # The template itself is not changed.
+    np.testing.assert_array_equal(template.xyz, [[1.0, 0.0, 0.0], [1.0, 2.0, 3.0]])
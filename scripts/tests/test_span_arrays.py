@@ -0,0 +1,361 @@
+# Checks the array span math in SpanArrays against the scalar loops it replaces (makeSpan(),
+# makeSpanPolylineShapeAndLineGuide(), makeSways() and makeSurfacePanels()), written out here with math only.
+import math
+
+import numpy as np
+import pytest
+
+import SpanArrays as sa
+
+
+fromPoints = np.array([[0.0, 0.0, 30.0], [100.0, 50.0, 42.0], [300.0, 80.0, 35.0], [500.0, 500.0, 60.0]])
+toPoints = np.array([[100.0, 50.0, 42.0], [300.0, 80.0, 35.0], [520.0, 100.0, 35.0], [400.0, 600.0, 20.0]])
+lineWeight = 1.2
+
+
+def makeSpanValues(fromXYZ, toXYZ, w, sagToSpanRatio=None, horizontalTension=None):
+    # Scalar makeSpan(): sag, tension and line length.
+    dx, dy, dz = [toValue - fromValue for fromValue, toValue in zip(fromXYZ, toXYZ)]
+    S = math.hypot(dx, dy)
+    spanLength3D = math.sqrt(dx * dx + dy * dy + dz * dz)
+    h = abs(dz)
+    H = None
+    if sagToSpanRatio is not None:
+        D = sagToSpanRatio * S
+    else:
+        H = horizontalTension
+        D = (H / w) * (math.cosh((spanLength3D / 2) * (w / H)) - 1)
+    xHigh = (S / 2) * (1 + (h / (4 * D)))
+    xLow = (S / 2) * (1 - (h / (4 * D)))
+    dHigh = D * pow((1 + (h / (4 * D))), 2)
+    dLow = D * pow((1 - (h / (4 * D))), 2)
+    if H is None:
+        H = (w * pow(xLow, 2)) / (2 * dLow)
+    L = S + (pow(abs(xLow), 3) + pow(xHigh, 3)) * (pow(w, 2) / (6 * pow(H, 2)))
+    return {"D": D, "H": H, "L": L, "xHigh": xHigh, "xLow": xLow, "dHigh": dHigh, "dLow": dLow}
+
+
+def makeSpanVertices(fromXYZ, toXYZ, xHigh, xLow, dHigh, dLow, H, w):
+    # Scalar makeSpanPolylineShapeAndLineGuide(): 101 polyline vertices and the 2 line guide vertices.
+    dx, dy = toXYZ[0] - fromXYZ[0], toXYZ[1] - fromXYZ[1]
+    S = math.hypot(dx, dy)
+    a = H / w
+    listT = []
+    listZ = []
+    for xStep in range(0, 101):
+        T = (xStep * S) / 100
+        listT.append(T)
+        if fromXYZ[2] > toXYZ[2]:
+            sagOriginDrop = dHigh
+            x = abs(xHigh) + T if xHigh < 0 else abs(T - xHigh)
+        else:
+            sagOriginDrop = dLow
+            x = abs(xLow) + T if xLow < 0 else abs(T - xLow)
+        listZ.append(a * (math.cosh(x / a) - 1))
+    firstFixZ = sagOriginDrop - listZ[0]
+    firstElevDiff = fromXYZ[2] - (listZ[0] + sagOriginDrop)
+    lastElevDiff = toXYZ[2] - (listZ[-1] + sagOriginDrop)
+    shearZIncrement = (lastElevDiff - firstElevDiff) / 100
+    sagOrigin = (fromXYZ[0], fromXYZ[1], fromXYZ[2] - sagOriginDrop)
+    vertices = []
+    for index in range(0, len(listT)):
+        vertices.append((sagOrigin[0] + dx / S * listT[index], sagOrigin[1] + dy / S * listT[index],
+                         sagOrigin[2] + listZ[index] + firstFixZ + shearZIncrement * index))
+    lineGuide = [sagOrigin, (sagOrigin[0] + dx, sagOrigin[1] + dy, sagOrigin[2])]
+    return np.array(vertices), np.array(lineGuide)
+
+
+def makeSwayLines(fromXYZ, toXYZ, spanVertices, angles):
+    # Scalar makeSways(): one sway line per angle, swung around the chord.
+    def cross(A, B):
+        return (A[1] * B[2] - A[2] * B[1], A[2] * B[0] - A[0] * B[2], A[0] * B[1] - A[1] * B[0])
+
+    def unit(A):
+        magnitude = math.sqrt(sum(value * value for value in A))
+        return [value / magnitude for value in A]
+
+    spanVector3D = [toValue - fromValue for fromValue, toValue in zip(fromXYZ, toXYZ)]
+    normalToSpanPlane = cross(spanVector3D, (0, 0, 1))
+    normalInSpanPlane = cross(spanVector3D, normalToSpanPlane)
+    spanVector2DNoY = (math.hypot(spanVector3D[0], spanVector3D[1]), spanVector3D[2])
+    swayLines = []
+    for angle in angles:
+        swayPoints = []
+        for pointIndex, point in enumerate(spanVertices):
+            if pointIndex == 0:
+                swayPoints.append(tuple(fromXYZ))
+            elif pointIndex == len(spanVertices) - 1:
+                swayPoints.append(tuple(toXYZ))
+            else:
+                pointVector = (math.hypot(point[0] - spanVertices[0][0], point[1] - spanVertices[0][1]), point[2] - spanVertices[0][2])
+                h = math.hypot(pointVector[0], pointVector[1])
+                t = (pointVector[0] * spanVector2DNoY[0] + pointVector[1] * spanVector2DNoY[1]) / math.hypot(*spanVector2DNoY)
+                r = math.sqrt(max(h * h - t * t, 0))
+                alphaRadians = math.radians(90 - angle)
+                u = r * math.cos(alphaRadians)
+                v = r * math.sin(alphaRadians)
+                swayPoints.append(tuple(fromValue + t * spanValue + u * normalValue + v * inPlaneValue
+                                        for fromValue, spanValue, normalValue, inPlaneValue in
+                                        zip(fromXYZ, unit(spanVector3D), unit(normalToSpanPlane), unit(normalInSpanPlane))))
+        swayLines.append(swayPoints)
+    return swayLines
+
+
+def makeSurfacePanelTriangles(swayLines):
+    # Scalar makeSurfacePanels(), with every quad panel split in (n0, n1, n2) and (n0, n2, n3).
+    triangles = []
+    for swayIndex in range(0, len(swayLines) - 1):
+        thisSway = swayLines[swayIndex]
+        nextSway = swayLines[swayIndex + 1]
+        nodeCount = len(thisSway)
+        for nodeIndex in range(0, nodeCount - 1):
+            n0, n1, n2, n3 = thisSway[nodeIndex], nextSway[nodeIndex], nextSway[nodeIndex + 1], thisSway[nodeIndex + 1]
+            if nodeIndex == 0:
+                triangles.append((n0, n2, n3))
+            elif nodeIndex == nodeCount - 2:
+                triangles.append((n0, n1, n2))
+            else:
+                triangles.append((n0, n1, n2))
+                triangles.append((n0, n2, n3))
+    return triangles
+
+
+def sortedTriangles(triangles):
+    return sorted(tuple(tuple(round(value, 6) for value in vertex) for vertex in triangle) for triangle in triangles)
+
+
+@pytest.mark.parametrize("sagToSpanRatio, horizontalTension", [(0.03, None), (None, 1500.0)])
+def testSolveSpansMatchesMakeSpan(sagToSpanRatio, horizontalTension):
+    solution = sa.solveSpans(fromPoints, toPoints, lineWeight, sagToSpanRatio=sagToSpanRatio, horizontalTension=horizontalTension)
+    vertices = sa.sampleSpanVertices(fromPoints, toPoints, solution)
+    guides = sa.lineGuideVertices(fromPoints, toPoints, solution.sagOriginDrop)
+    assert solution.valid.all()
+    for index in range(0, len(fromPoints)):
+        expected = makeSpanValues(fromPoints[index], toPoints[index], lineWeight, sagToSpanRatio, horizontalTension)
+        assert solution.sagDistance[index] == pytest.approx(expected["D"], rel=1e-12)
+        assert solution.horizontalTension[index] == pytest.approx(expected["H"], rel=1e-12)
+        assert solution.lineLength[index] == pytest.approx(expected["L"], rel=1e-12)
+        expectedVertices, expectedGuide = makeSpanVertices(fromPoints[index], toPoints[index], expected["xHigh"], expected["xLow"],
+                                                           expected["dHigh"], expected["dLow"], expected["H"], lineWeight)
+        np.testing.assert_allclose(vertices[index], expectedVertices, atol=1e-9)
+        np.testing.assert_allclose(guides[index], expectedGuide, atol=1e-9)
+
+
+def testSolveSpansMarksUnsolvableSpans():
+    solution = sa.solveSpans(np.array([[0.0, 0.0, 10.0], [0.0, 0.0, 10.0]]), np.array([[0.0, 0.0, 10.0], [100.0, 0.0, 10.0]]),
+                             lineWeight, sagToSpanRatio=0.03)
+    assert solution.valid.tolist() == [False, True]
+
+
+def testAdjacentSpanMaximumsIgnoresNaN():
+    towerValues = sa.adjacentSpanMaximums([1.0, np.nan, 3.0, 2.0])
+    assert towerValues.tolist() == [1.0, 1.0, 3.0, 3.0, 2.0]
+
+
+def chordDeviation(fromXYZ, toXYZ, solution, vertices):
+    # Largest vertical distance between the sampled polyline and the catenary it approximates, for one span.
+    S = math.hypot(toXYZ[0, 0] - fromXYZ[0, 0], toXYZ[0, 1] - fromXYZ[0, 1])
+    dense = sa.catenaryVertices(fromXYZ, toXYZ, solution.xHigh, solution.xLow, solution.dHigh, solution.dLow,
+                                solution.horizontalTension, solution.weightPerUnitLength, stepCount=20000)[0]
+    denseT = np.linspace(0, S, len(dense))
+    sampledT = np.hypot(vertices[:, 0] - fromXYZ[0, 0], vertices[:, 1] - fromXYZ[0, 1])
+    return np.max(np.abs(np.interp(denseT, sampledT, vertices[:, 2]) - dense[:, 2]))
+
+
+@pytest.mark.parametrize("tolerance", [0.5, 0.05, 0.01])
+def testAdaptiveStepCountsKeepChordsWithinTolerance(tolerance):
+    solution = sa.solveSpans(fromPoints, toPoints, lineWeight, horizontalTension=800.0)
+    vertexLists = sa.sampleSpanVerticesAdaptive(fromPoints, toPoints, solution, tolerance, maxStepCount=1000)
+    for index, vertices in enumerate(vertexLists):
+        assert len(vertices) < 1001
+        assert chordDeviation(fromPoints[index:index + 1], toPoints[index:index + 1], solution.select([index]), vertices) <= tolerance
+        np.testing.assert_allclose(vertices[0], fromPoints[index], atol=1e-9)
+        np.testing.assert_allclose(vertices[-1], toPoints[index], atol=1e-9)
+
+
+def testAdaptiveStepCountsStayInBounds():
+    solution = sa.solveSpans(fromPoints, toPoints, lineWeight, horizontalTension=800.0)
+    stepCounts = sa.adaptiveStepCounts(fromPoints, toPoints, solution.xHigh, solution.xLow, solution.horizontalTension,
+                                       solution.weightPerUnitLength, 1e-9, minStepCount=2, maxStepCount=100)
+    assert stepCounts.tolist() == [100] * len(fromPoints)
+    stepCounts = sa.adaptiveStepCounts(fromPoints, toPoints, solution.xHigh, solution.xLow, solution.horizontalTension,
+                                       solution.weightPerUnitLength, 1e9, minStepCount=2, maxStepCount=100)
+    assert stepCounts.tolist() == [2] * len(fromPoints)
+
+
+def testCatenaryTemplateMatchesCosh():
+    solution = sa.solveSpans(fromPoints, toPoints, lineWeight, horizontalTension=1500.0)
+    xMax = np.max(np.maximum(np.abs(solution.xHigh), np.abs(solution.xLow)))
+    template = sa.CatenaryTemplate(1500.0 / lineWeight, xMax, tolerance=0.0001)
+    withTemplate = sa.sampleSpanVertices(fromPoints, toPoints, solution, template=template)
+    withCosh = sa.sampleSpanVertices(fromPoints, toPoints, solution)
+    # Interpolation error at most tolerance per height, and the visual correction adds at most two of them.
+    assert np.max(np.abs(withTemplate - withCosh)) <= 3 * 0.0001
+
+
+def testCatenaryTemplateIsRejectedForOtherTensions():
+    solution = sa.solveSpans(fromPoints, toPoints, lineWeight, horizontalTension=1500.0)
+    template = sa.CatenaryTemplate(1000.0 / lineWeight, 1000.0)
+    with pytest.raises(ValueError):
+        sa.sampleSpanVertices(fromPoints, toPoints, solution, template=template)
+
+
+def testGetCatenaryTemplateGrowsToCoverLongerSpans():
+    sa.catenaryTemplates.clear()
+    template = sa.getCatenaryTemplate(1500.0, lineWeight, 100.0)
+    assert sa.getCatenaryTemplate(1500.0, lineWeight, 50.0) is template
+    longer = sa.getCatenaryTemplate(1500.0, lineWeight, 150.0)
+    assert longer is not template and longer.xMax == 200.0
+
+
+@pytest.mark.parametrize("sagToSpanRatio", [0.001, 0.03, 0.2])
+def testExactSpansConvergeToTheTargetSag(sagToSpanRatio):
+    solution = sa.solveExactSpans(fromPoints, toPoints, lineWeight, sagToSpanRatio=sagToSpanRatio, tolerance=1e-9)
+    assert solution.converged.all() and solution.valid.all()
+    assert solution.iterations.max() < 50
+    np.testing.assert_allclose(solution.sagDistance, sagToSpanRatio * solution.spanLength2D, rtol=1e-8)
+
+
+def testExactSpansRoundTripThroughTension():
+    bySag = sa.solveExactSpans(fromPoints, toPoints, lineWeight, sagToSpanRatio=0.03)
+    byTension = sa.solveExactSpans(fromPoints, toPoints, lineWeight, horizontalTension=bySag.horizontalTension)
+    np.testing.assert_allclose(byTension.sagDistance, bySag.sagDistance, rtol=1e-8)
+    np.testing.assert_allclose(byTension.lineLength, bySag.lineLength, rtol=1e-10)
+
+
+def testExactSpanVerticesEndOnTheAttachmentPoints():
+    solution = sa.solveSpans(fromPoints, toPoints, lineWeight, sagToSpanRatio=0.03, exact=True)
+    vertices = sa.sampleSpanVertices(fromPoints, toPoints, solution)
+    np.testing.assert_allclose(vertices[:, 0], fromPoints, atol=1e-6)
+    np.testing.assert_allclose(vertices[:, -1], toPoints, atol=1e-6)
+
+
+def testExactSpansMatchTheParabolaForFlatSpans():
+    flatFrom = np.array([[0.0, 0.0, 20.0]])
+    flatTo = np.array([[300.0, 0.0, 20.0]])
+    exact = sa.solveExactSpans(flatFrom, flatTo, lineWeight, horizontalTension=20000.0)
+    parabola = sa.solveSpans(flatFrom, flatTo, lineWeight, horizontalTension=20000.0)
+    assert exact.sagDistance[0] == pytest.approx(parabola.sagDistance[0], rel=1e-3)
+    assert exact.lineLength[0] == pytest.approx(parabola.lineLength[0], rel=1e-6)
+
+
+def testRulingSpanSags():
+    spanLengths = np.array([100.0, 200.0, 300.0, 150.0, 150.0])
+    sectionStarts = sa.tensionSectionStarts([1, 1, 1, 1, 1], [1, 2, 3, 4, 5], deadEndTowers=[4])
+    assert sectionStarts.tolist() == [True, False, False, True, False]
+    rulingSpans = sa.rulingSpanLengths(spanLengths, sectionStarts)
+    firstRulingSpan = math.sqrt((100.0 ** 3 + 200.0 ** 3 + 300.0 ** 3) / 600.0)
+    np.testing.assert_allclose(rulingSpans, [firstRulingSpan] * 3 + [150.0] * 2)
+
+    D, H = sa.rulingSpanSags(spanLengths, sectionStarts, lineWeight, sagToSpanRatio=0.03)
+    # One tension per section, and the ruling span itself gets the sag ratio.
+    assert len(set(H[0:3].tolist())) == 1
+    assert lineWeight * firstRulingSpan ** 2 / (8 * H[0]) == pytest.approx(0.03 * firstRulingSpan)
+    np.testing.assert_allclose(D[3:], 0.03 * spanLengths[3:])
+    np.testing.assert_allclose(D, lineWeight * spanLengths ** 2 / (8 * H))
+
+    D, H = sa.rulingSpanSags(spanLengths, sectionStarts, lineWeight, horizontalTension=1500.0)
+    np.testing.assert_allclose(D, lineWeight * spanLengths ** 2 / (8 * 1500.0))
+
+
+def testTensionSectionsStartOnEveryLine():
+    assert sa.tensionSectionStarts([1, 1, 2, 2, -1], [1, 2, 1, 2, 1]).tolist() == [True, False, True, False, True]
+
+
+def testSwayGridAndMeshMatchTheSwayLoops():
+    angles = [-45, -30, -15, 0, 15, 30, 45]
+    solution = sa.solveSpans(fromPoints, toPoints, lineWeight, sagToSpanRatio=0.03)
+    vertices = sa.sampleSpanVertices(fromPoints, toPoints, solution, stepCount=20)
+    grid = sa.swayGrid(fromPoints, toPoints, vertices, angles)
+    assert grid.shape == (len(fromPoints), len(angles), 21, 3)
+    for index in range(0, len(fromPoints)):
+        swayLines = makeSwayLines(fromPoints[index], toPoints[index], vertices[index].tolist(), angles)
+        np.testing.assert_allclose(grid[index], np.array(swayLines), atol=1e-9)
+
+        meshVertices, faces = sa.swayMesh(grid[index])
+        assert len(meshVertices) == 2 + len(angles) * 19
+        assert sortedTriangles(meshVertices[faces].tolist()) == sortedTriangles(makeSurfacePanelTriangles(swayLines))
+
+
+def testMergeMeshesKeepsEveryTriangle():
+    solution = sa.solveSpans(fromPoints, toPoints, lineWeight, sagToSpanRatio=0.03)
+    vertices = sa.sampleSpanVertices(fromPoints, toPoints, solution, stepCount=10)
+    grid = sa.swayGrid(fromPoints, toPoints, vertices, [-30, 0, 30])
+    meshes = [sa.swayMesh(grid[index]) for index in range(0, len(fromPoints))]
+    mergedVertices, mergedFaces = sa.mergeMeshes(meshes)
+    assert len(mergedVertices) == sum(len(meshVertices) for meshVertices, faces in meshes)
+    expected = np.concatenate([meshVertices[faces] for meshVertices, faces in meshes])
+    np.testing.assert_array_equal(mergedVertices[mergedFaces], expected)
+
+
+def testLoadCasesMatchSeparateSolves():
+    loadCases = [sa.LoadCase("bare", lineWeight, horizontalTension=1500.0), sa.LoadCase("ratio", 2.0, sagToSpanRatio=0.04),
+                 sa.LoadCase("iced", 3.5, horizontalTension=2500.0)]
+    solutions = sa.solveLoadCases(fromPoints, toPoints, loadCases)
+    for loadCase, solution in zip(loadCases, solutions):
+        expected = sa.solveSpans(fromPoints, toPoints, loadCase.weightPerUnitLength, sagToSpanRatio=loadCase.sagToSpanRatio,
+                                 horizontalTension=loadCase.horizontalTension)
+        np.testing.assert_allclose(solution.sagDistance, expected.sagDistance)
+        np.testing.assert_allclose(solution.horizontalTension, expected.horizontalTension)
+
+
+def testGroupAttachmentPointsAndSpanEndpoints():
+    points = sa.asAttachmentPointArray([(0, 0, 0, 2, 2), (0, 0, 0, 1, 2), (0, 0, 0, 2, 1), (0, 0, 0, 1, 1), (0, 0, 0, 1, 3)])
+    points, lines = sa.groupAttachmentPoints(points)
+    assert lines == [(1, 0, 3), (2, 3, 5)]
+    fromIndices, toIndices = sa.spanEndpointIndices(points)
+    assert fromIndices.tolist() == [0, 1, 3] and toIndices.tolist() == [1, 2, 4]
+
+
+def testSpanCacheKeysGroupSpansWithTheSameShape():
+    spanCache = sa.SpanCache(quantum=0.001)
+    shift = np.array([1000.0, -500.0, 7.0])
+    fromXYZ = np.concatenate((fromPoints, fromPoints + shift, fromPoints[0:1]))
+    toXYZ = np.concatenate((toPoints, toPoints + shift + 0.0001, toPoints[0:1] + 0.01))
+    keys, firstIndices, keyIndices = spanCache.makeKeys(fromXYZ, toXYZ, lineWeight, None, 0.03)
+    assert len(keys) == len(fromPoints) + 1
+    assert keyIndices[0:4].tolist() == keyIndices[4:8].tolist()
+    assert keyIndices[8] != keyIndices[0]
+    for spanIndex in range(0, len(fromXYZ)):
+        key = keys[keyIndices[spanIndex]]
+        assert key == spanCache.makeKey(tuple(fromXYZ[spanIndex]), tuple(toXYZ[spanIndex]), lineWeight, None, 0.03, None)
+        assert keyIndices[firstIndices[keyIndices[spanIndex]]] == keyIndices[spanIndex]
+
+    # Per span sag ratios are part of the key: one span with two ratios gives two keys.
+    sameSpanFrom = np.repeat(fromPoints[0:1], 4, axis=0)
+    sameSpanTo = np.repeat(toPoints[0:1], 4, axis=0)
+    ratioKeys, firstIndices, keyIndices = spanCache.makeKeys(sameSpanFrom, sameSpanTo, lineWeight, None, [0.03, 0.015, 0.03, 0.015])
+    assert sorted(key[4] for key in ratioKeys) == [0.015, 0.03]
+    assert keyIndices[0] == keyIndices[2] and keyIndices[1] == keyIndices[3] and keyIndices[0] != keyIndices[1]
+
+
+def testSpanCacheEntriesEndOnTheToPoint():
+    spanCache = sa.SpanCache(quantum=0.01)
+    solution = sa.solveSpans(fromPoints[0:1], toPoints[0:1], lineWeight, sagToSpanRatio=0.03)
+    vertices = sa.sampleSpanVertices(fromPoints[0:1], toPoints[0:1], solution)[0]
+    guide = sa.lineGuideVertices(fromPoints[0:1], toPoints[0:1], solution.sagOriginDrop)[0]
+    entry = spanCache.makeEntry(fromPoints[0], vertices, guide, solution.sagDistance[0], solution.horizontalTension[0],
+                                solution.lineLength[0], lineWeight)
+
+    # A span that moved, with a delta within quantum / 2 of the cached one: same key, shape sheared onto the new end.
+    newFrom = fromPoints[0] + np.array([250.0, 10.0, 5.0])
+    newTo = toPoints[0] + np.array([250.0, 10.0, 5.0]) + np.array([0.004, -0.003, 0.0049])
+    assert spanCache.makeKey(tuple(newFrom), tuple(newTo), lineWeight, None, 0.03, None) == \
+        spanCache.makeKey(tuple(fromPoints[0]), tuple(toPoints[0]), lineWeight, None, 0.03, None)
+    polylineVertices, lineGuideVertices = spanCache.entryVertices(entry, newFrom, newTo)
+    np.testing.assert_allclose(polylineVertices[0], newFrom, atol=1e-12)
+    np.testing.assert_allclose(polylineVertices[-1], newTo, atol=1e-12)
+    np.testing.assert_allclose(lineGuideVertices[-1, 0:2], newTo[0:2], atol=1e-12)
+    np.testing.assert_allclose(polylineVertices, vertices + (newFrom - fromPoints[0]), atol=0.01)
+    # The cached offsets are not changed by placing them.
+    np.testing.assert_allclose(entry[0] + fromPoints[0], vertices)
+
+
+def testLRUCacheEvictsAndReloadsFromDisk(tmp_path):
+    cache = sa.LRUCache(maxSize=2, cacheDirectory=str(tmp_path))
+    for key in range(0, 3):
+        cache.put((key,), {"value": key})
+    assert len(cache) == 2 and (0,) not in cache.entries
+    assert cache.get((0,)) == {"value": 0}
+    assert cache.get((5,)) is None
+    assert (cache.hits, cache.misses) == (1, 1)